@@ -10,6 +10,11 @@ class ServiceType(str, Enum):
     DEEPSEEK = "deepseek"
     OLLAMA = "ollama"
 
+class CacheReplayMode(str, Enum):
+    INSTANT = "instant"        # 整段缓存作为一个 SSE 帧发送
+    TOKEN_RATE = "token_rate"  # 按模型生成速率回放
+    CHUNKED = "chunked"        # 按固定大小分块发送，不等待
+
 class Settings(BaseSettings):
     # Deepseek settings
     DEEPSEEK_API_KEY: str
@@ -37,6 +42,21 @@ class Settings(BaseSettings):
     CHAT_SERVICE: ServiceType = ServiceType.DEEPSEEK
     REASON_SERVICE: ServiceType = ServiceType.DEEPSEEK
     AGENT_SERVICE: ServiceType = ServiceType.DEEPSEEK
+
+    # LangGraph 节点模型客户端的连接池设置
+    AGENT_HTTP_MAX_CONNECTIONS: int = 100       # 共享 HTTP 连接池的最大连接数
+    AGENT_HTTP_MAX_KEEPALIVE: int = 20          # 保持 keep-alive 的空闲连接数
+    AGENT_HTTP_KEEPALIVE_EXPIRY: float = 60.0   # 空闲连接的保持时间(秒)
+    AGENT_CONNECT_TIMEOUT: float = 10.0         # 建立连接的超时时间(秒)
+    AGENT_REQUEST_TIMEOUT: float = 120.0        # 单次模型请求的超时时间(秒)
+    VISION_REQUEST_TIMEOUT: float = 60.0        # 视觉模型请求的超时时间(秒)
+    RESEARCH_WORKFLOW_WARMUP: bool = True       # 启动时预先编译研究计划工作流
+    AGENT_BRANCH_MAX_CONCURRENCY: int = 16      # 进程内同时运行的子任务分支节点上限
+    AGENT_BRANCH_MAX_PER_USER: int = 4          # 单个用户同时运行的子任务分支节点上限
+    LANGGRAPH_CHECKPOINTER: str = "redis"       # 会话检查点存储：redis 或 memory（进程内，仅用于开发测试）
+    LANGGRAPH_CHECKPOINT_KEEP: int = 10         # 每个线程（及子图命名空间）保留的最近检查点数
+    LANGGRAPH_THREAD_TTL: int = 7 * 24 * 3600   # 线程空闲多久后清除检查点(秒)，0 表示不过期
+    LANGGRAPH_CHECKPOINT_MAX_CONNECTIONS: int = 50  # 检查点存储独立 Redis 连接池的连接数，用尽时排队等待
     
     # Search settings
     SEARCH_SERVICE: str = "bocha_ai"  # 默认使用博查AI搜索
@@ -61,13 +81,38 @@ class Settings(BaseSettings):
     DB_USER: str
     DB_PASSWORD: str
     DB_NAME: str
+    DB_POOL_SIZE: int = 10                          # 连接池常驻连接数
+    DB_MAX_OVERFLOW: int = 20                       # 常驻连接用尽时最多额外创建的连接数
+    DB_POOL_TIMEOUT: float = 30.0                   # 等待空闲连接的超时(秒)，超时抛出 TimeoutError
+    DB_POOL_RECYCLE: int = 3600                     # 连接最长使用时间(秒)，避免被 MySQL wait_timeout 断开
+    DB_READ_HOST: str = ""                          # 只读副本地址，为空时读请求也走主库
+    DB_READ_PORT: int = 0                           # 只读副本端口，0 表示与主库相同
+    DB_SLOW_QUERY_MS: float = 200.0                 # 执行时间超过该值(毫秒)的 SQL 记为慢查询
     
     # Neo4j settings
     NEO4J_URL: str = "bolt://localhost:7687"
     NEO4J_USERNAME: str = "neo4j"
     NEO4J_PASSWORD: str = "password"
     NEO4J_DATABASE: str = "neo4j"
+    NEO4J_MAX_CONNECTION_POOL_SIZE: int = 50        # 异步驱动连接池的最大连接数
+    NEO4J_CONNECTION_ACQUISITION_TIMEOUT: float = 30.0  # 等待空闲连接的超时时间(秒)
+    NEO4J_MAX_CONNECTION_LIFETIME: int = 3600       # 单个连接的最长存活时间(秒)
+    NEO4J_QUERY_TIMEOUT: float = 30.0               # 单条查询的默认超时时间(秒)
+    NEO4J_POOL_STATS_INTERVAL: int = 60             # 连接池指标写日志的间隔(秒)
+    NEO4J_POOL_WAIT_WARN_MS: float = 200            # 等待连接超过该值时记录警告(毫秒)
+    NEO4J_SCHEMA_CHECK_INTERVAL: float = 60.0       # 检查图 Schema 指纹的间隔(秒)
+    NEO4J_SCHEMA_TTL: float = 3600.0                # Schema 快照的最长有效期(秒)，到期后重新扫描
+    CYPHER_STATEMENT_CACHE_SIZE: int = 512          # 通过校验的 Cypher 语句缓存条数(按归一化的任务文本)
+    CYPHER_STATEMENT_CACHE_TTL: float = 86400.0     # Cypher 语句缓存的有效期(秒)，Schema 变化时提前失效
+    CYPHER_RESULT_CACHE_SIZE: int = 256             # Cypher 查询结果缓存条数
+    CYPHER_RESULT_CACHE_TTL: float = 60.0           # 查询结果缓存的有效期(秒)，0 表示不缓存结果
+    CYPHER_CACHE_VERSION_CHECK_INTERVAL: float = 10.0  # 检查图数据是否变化的间隔(秒)
+    CYPHER_CORRECTION_MAX_ATTEMPTS: int = 2         # 校验失败后让大模型修正 Cypher 的最多轮数
     
+    # Conversation settings
+    CONVERSATION_FLUSH_INTERVAL: float = 0.5        # 对话消息批量写库的间隔(秒)
+    CONVERSATION_FLUSH_BATCH_SIZE: int = 200        # 缓冲的问答轮数达到该值时立即写库
+
     # JWT settings
     SECRET_KEY: str = "your-secret-key"  # 在生产环境中使用安全的密钥
     ALGORITHM: str = "HS256"
@@ -78,13 +123,45 @@ class Settings(BaseSettings):
     REDIS_PORT: int
     REDIS_DB: int = 0
     REDIS_PASSWORD: str = ""
+    REDIS_MAX_CONNECTIONS: int = 50  # 共享连接池的最大连接数
     REDIS_CACHE_EXPIRE: int = 3600
     REDIS_CACHE_THRESHOLD: float = 0.8
+    REDIS_CACHE_CLEANUP_INTERVAL: int = 3600  # 全局缓存清理任务的执行间隔(秒)
+    CACHE_REPLAY_MODE: CacheReplayMode = CacheReplayMode.CHUNKED  # 缓存命中时的回放策略
+    CACHE_REPLAY_CHUNK_SIZE: int = 512  # chunked 模式下每帧的字符数
+    CACHE_REPLAY_TOKENS_PER_SECOND: float = 60  # token_rate 模式下的回放速率(按字符估算)
+    REDIS_CACHE_VECTOR_BACKEND: str = "auto"  # auto / redisearch / local，auto 时优先使用 RediSearch
+    REDIS_CACHE_HNSW_M: int = 16  # HNSW 每个节点的邻居数
+    REDIS_CACHE_HNSW_EF_CONSTRUCTION: int = 200  # HNSW 构建时的候选集大小
+    REDIS_CACHE_LOCAL_REFRESH: int = 60  # 本地向量矩阵与 Redis 重新同步的间隔(秒)
     
     # Embedding settings 
     EMBEDDING_TYPE: str = "ollama"  # ollama 或 sentence_transformer
     EMBEDDING_MODEL: str = "bge-m3"  # ollama embedding模型
     EMBEDDING_THRESHOLD: float = 0.90  # 语义相似度阈值
+    EMBEDDING_CACHE_SIZE: int = 4096  # 进程内嵌入向量 LRU 的条数
+    EMBEDDING_BATCH_WINDOW_MS: float = 5  # 嵌入请求合并窗口(毫秒)
+    EMBEDDING_MAX_BATCH_SIZE: int = 64  # 单次 embeddings.create 的最大文本数
+
+    # 本地向量索引 (FAISS) settings
+    VECTOR_INDEX_DIR: str = "indexes"                # 索引与文档侧车文件目录
+    VECTOR_INDEX_MAX_OPEN: int = 32                  # 同时保持打开的索引数量
+    VECTOR_INDEX_HNSW_THRESHOLD: int = 10_000        # 向量数达到该值时使用 HNSW
+    VECTOR_INDEX_IVF_THRESHOLD: int = 100_000        # 向量数达到该值时使用 IVF
+    VECTOR_INDEX_HNSW_M: int = 32
+    VECTOR_INDEX_HNSW_EF_SEARCH: int = 64
+    VECTOR_INDEX_IVF_NPROBE: int = 16
+    EMBEDDING_CHUNK_TOKENS: int = 128                # 每个文本块的最大 token 数（MiniLM 的最大序列长度）
+    EMBEDDING_CHUNK_OVERLAP: int = 32                # 相邻文本块重叠的 token 数
+    EMBEDDING_ENCODE_BATCH_SIZE: int = 64            # 每批送入 encode 的文本块数
+    EMBEDDING_PDF_WORKERS: int = 4                   # PDF 文本提取的进程数
+    EMBEDDING_PAGES_PER_TASK: int = 16               # 每个提取任务处理的页数
+    PREDEFINED_CYPHER_VECTOR_DIR: str = "indexes/predefined_cypher"  # 预定义查询描述向量矩阵的缓存目录
+    PREDEFINED_CYPHER_QUESTION_CACHE_SIZE: int = 256  # 最近问题向量的 LRU 条数
+    PREDEFINED_CYPHER_MATRIX_RETRY_INTERVAL: float = 60.0  # 查询描述向量计算失败后再次尝试的间隔(秒)
+    CYPHER_EXAMPLES_SOURCE: str = "file"             # Text2Cypher 少样本示例来源：file 或 database
+    CYPHER_EXAMPLES_FILE: str = ""                   # 示例文件(JSON)，为空时使用内置的 northwind_examples.json
+    CYPHER_EXAMPLES_RELOAD_INTERVAL: int = 30        # 检查示例是否变化的间隔(秒)
     
     # GraphRAG settings
     GRAPHRAG_PROJECT_DIR: str = "llm_backend/app/graphrag"  # GraphRAG项目目录
@@ -93,6 +170,11 @@ class Settings(BaseSettings):
     GRAPHRAG_RESPONSE_TYPE: str = "text"                    # 响应类型
     GRAPHRAG_COMMUNITY_LEVEL: int = 3                       # 社区级别
     GRAPHRAG_DYNAMIC_COMMUNITY: bool = False                # 是否动态选择社区
+    GRAPHRAG_ENGINE_RELOAD_INTERVAL: int = 30               # 检查索引文件是否变化的间隔(秒)
+    INDEXING_MAX_WORKERS: int = 2                           # 同时运行的索引构建进程数
+    INDEXING_UPLOAD_CHUNK_SIZE: int = 1024 * 1024           # 上传文件分块写盘的大小(字节)
+    INDEXING_PROGRESS_INTERVAL: float = 1.0                 # 任务进度写库的最小间隔(秒)
+    INDEXING_PARSE_CONCURRENCY: int = 4                     # 批量索引时并发哈希/解析的文件数
 
     # GraphRAG模型配置
     GRAPHRAG_API_BASE: str
@@ -105,6 +187,14 @@ class Settings(BaseSettings):
     @property
     def DATABASE_URL(self) -> str:
         return f"mysql+aiomysql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+
+    @property
+    def DATABASE_READ_URL(self) -> str:
+        """只读副本 URL，账号和库名与主库相同；未配置副本时返回主库 URL"""
+        if not self.DB_READ_HOST:
+            return self.DATABASE_URL
+        port = self.DB_READ_PORT or self.DB_PORT
+        return f"mysql+aiomysql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_READ_HOST}:{port}/{self.DB_NAME}"
     
     @property
     def REDIS_URL(self) -> str:
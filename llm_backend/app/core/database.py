@@ -1,19 +1,148 @@
 import logging
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Any, Dict
+
+from sqlalchemy import event, exc
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from app.core.config import settings
+from app.core.logger import get_logger
 
 # 设置 SQLAlchemy 日志级别为 WARNING，这样就不会显示 INFO 级别的 SQL 查询日志
 logging.getLogger('sqlalchemy.engine').setLevel(logging.WARNING)
 
-# 创建异步引擎
-engine = create_async_engine(
-    settings.DATABASE_URL,
-    echo=False,  # 设置为 False 也可以关闭 SQL 日志
-    pool_pre_ping=True,  # 自动检测断开的连接
-    pool_size=5,  # 连接池大小， 保持 5 个连接处于可用状态。在高并发情况下，最多可以同时处理 5 个数据库请求，而不需要每次都去创建新的连接。
-    max_overflow=10  # 最大溢出连接数，如果连接池中的连接都被占用，最多可以再创建 10 个额外的连接。因此，最多可以同时处理 15 个请求（5 个常规连接 + 10 个溢出连接）。超出这个数量的请求将会被阻塞，直到有连接可用。
-)
+logger = get_logger(service="database")
+
+# 获取连接耗时直方图的桶上界(毫秒)，最后一个桶统计超过 10 秒的情况
+CHECKOUT_BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+class DatabaseMetrics:
+    """单个引擎（主库或只读副本）的连接获取耗时和查询耗时统计"""
+
+    def __init__(self, role: str):
+        self.role = role
+        self.engine: AsyncEngine = None
+        self.checkout_buckets = [0] * (len(CHECKOUT_BUCKETS_MS) + 1)
+        self.checkouts = 0
+        self.waiting = 0
+        self.timeouts = 0
+        self.total_checkout = 0.0
+        self.max_checkout = 0.0
+        self.queries = 0
+        self.total_query = 0.0
+        self.slow_queries = 0
+        self.recent_slow: deque = deque(maxlen=20)
+
+    def record_checkout(self, seconds: float):
+        self.checkouts += 1
+        self.total_checkout += seconds
+        self.max_checkout = max(self.max_checkout, seconds)
+        self.checkout_buckets[bisect_left(CHECKOUT_BUCKETS_MS, seconds * 1000)] += 1
+
+    def record_query(self, statement: str, seconds: float):
+        self.queries += 1
+        self.total_query += seconds
+        elapsed_ms = seconds * 1000
+        if elapsed_ms >= settings.DB_SLOW_QUERY_MS:
+            self.slow_queries += 1
+            statement = " ".join(statement.split())[:500]
+            self.recent_slow.append({"sql": statement, "ms": round(elapsed_ms, 1), "at": time.time()})
+            logger.warning(f"Slow query on {self.role} took {elapsed_ms:.0f}ms: {statement}")
+
+    def stats(self) -> Dict[str, Any]:
+        pool = self.engine.sync_engine.pool
+        histogram = {f"le_{bound}ms": count for bound, count in zip(CHECKOUT_BUCKETS_MS, self.checkout_buckets)}
+        histogram["gt_10000ms"] = self.checkout_buckets[-1]
+        return {
+            "pool": {
+                "size": pool.size(),
+                "max_overflow": pool._max_overflow,
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+                "waiting": self.waiting,
+            },
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "avg_checkout_ms": round(self.total_checkout / self.checkouts * 1000, 2) if self.checkouts else 0.0,
+            "max_checkout_ms": round(self.max_checkout * 1000, 2),
+            "checkout_histogram": histogram,
+            "queries": self.queries,
+            "avg_query_ms": round(self.total_query / self.queries * 1000, 2) if self.queries else 0.0,
+            "slow_query_ms": settings.DB_SLOW_QUERY_MS,
+            "slow_queries": self.slow_queries,
+            "recent_slow_queries": list(self.recent_slow),
+        }
+
+
+_metrics: Dict[str, DatabaseMetrics] = {}
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """统计获取连接耗时的连接池
+
+    耗时包括排队等待空闲连接、新建溢出连接和 pre_ping 检测。
+    引擎角色通过 pool_logging_name 传入，engine.dispose() 重建连接池时会保留。
+    """
+
+    def connect(self):
+        metrics = _metrics[self._orig_logging_name]
+        metrics.waiting += 1
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            metrics.timeouts += 1
+            raise
+        finally:
+            metrics.waiting -= 1
+        metrics.record_checkout(time.perf_counter() - start)
+        return connection
+
+
+def _create_engine(url: str, role: str) -> AsyncEngine:
+    metrics = _metrics[role] = DatabaseMetrics(role)
+    async_engine = create_async_engine(
+        url,
+        echo=False,  # 设置为 False 也可以关闭 SQL 日志
+        pool_pre_ping=True,  # 自动检测断开的连接
+        poolclass=InstrumentedQueuePool,
+        pool_logging_name=role,
+        pool_size=settings.DB_POOL_SIZE,  # 常驻连接数，高并发时最多同时处理 pool_size 个数据库请求而不需要新建连接
+        max_overflow=settings.DB_MAX_OVERFLOW,  # 常驻连接都被占用时最多再创建的连接数，超出 pool_size + max_overflow 的请求排队等待
+        pool_timeout=settings.DB_POOL_TIMEOUT,  # 排队超过该时间抛出 TimeoutError
+        pool_recycle=settings.DB_POOL_RECYCLE,  # 连接使用超过该时间后重建
+    )
+    metrics.engine = async_engine
+
+    # 查询耗时：同一连接上的语句按顺序执行，用栈记录开始时间
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(async_engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        metrics.record_query(statement, time.perf_counter() - conn.info["query_start"].pop())
+
+    @event.listens_for(async_engine.sync_engine, "handle_error")
+    def handle_error(exception_context):
+        # 执行出错时不会触发 after_cursor_execute，丢弃对应的开始时间
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_start"):
+            connection.info["query_start"].pop()
+
+    return async_engine
+
+
+# 创建异步引擎（主库），写操作和需要读到最新数据的查询使用
+engine = _create_engine(settings.DATABASE_URL, "primary")
+
+# 只读副本引擎，未配置 DB_READ_HOST 时与主库共用
+read_engine = _create_engine(settings.DATABASE_READ_URL, "replica") if settings.DB_READ_HOST else engine
 
 # 创建异步会话工厂
 AsyncSessionLocal = sessionmaker(
@@ -22,6 +151,24 @@ AsyncSessionLocal = sessionmaker(
     expire_on_commit=False
 )
 
+# 只读会话工厂：副本有复制延迟，只用于可以接受短暂旧数据的列表查询
+ReadSessionLocal = sessionmaker(
+    bind=read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False
+) if read_engine is not engine else AsyncSessionLocal
+
+
+def database_stats() -> Dict[str, Any]:
+    """各引擎的连接池状态、获取连接耗时直方图和慢查询统计"""
+    return {role: metrics.stats() for role, metrics in _metrics.items()}
+
+
+async def dispose_engines():
+    await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
+
 # 创建基类
 Base = declarative_base()
 
@@ -35,4 +182,4 @@ async def get_db():
             await session.rollback()
             raise
         finally:
-            await session.close() 
\ No newline at end of file
+            await session.close()
\ No newline at end of file
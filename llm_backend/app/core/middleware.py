@@ -1,24 +1,178 @@
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
+from bisect import bisect_left
+from typing import Any, Dict, Optional
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from app.core.logger import get_logger
 import time
 
 logger = get_logger(service="http")
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        start_time = time.time()
-        
-        response = await call_next(request)
-        
-        # 计算处理时间
-        process_time = time.time() - start_time
-        
-        # 记录请求日志
-        logger.info(
-            f"{request.client.host}:{request.client.port} - "
-            f"\"{request.method} {request.url.path} HTTP/{request.scope.get('http_version', '1.1')}\" "
-            f"{response.status_code} - {process_time:.2f}s"
-        )
-        
-        return response 
\ No newline at end of file
+# 延迟直方图的桶上界(毫秒)，最后一个桶统计超过 5 分钟的请求（长时间的流式对话）
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 120000, 300000]
+
+
+class LatencyHistogram:
+    """固定桶的延迟直方图，分位数在所在桶内线性插值估算"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, ms: float):
+        self.buckets[bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.buckets):
+            if count and cumulative + count >= rank:
+                lower = LATENCY_BUCKETS_MS[index - 1] if index > 0 else 0.0
+                upper = LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else self.max
+                return min(lower + (upper - lower) * (rank - cumulative) / count, self.max)
+            cumulative += count
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "avg_ms": round(self.total / self.count, 2) if self.count else 0.0,
+            "p50_ms": round(self.percentile(0.50), 2),
+            "p95_ms": round(self.percentile(0.95), 2),
+            "p99_ms": round(self.percentile(0.99), 2),
+            "max_ms": round(self.max, 2),
+        }
+
+
+class RouteMetrics:
+    """单个路由的请求数、状态码分布、首字节时间和总耗时（流式响应为整个流的持续时间）"""
+
+    def __init__(self):
+        self.requests = 0
+        self.status: Dict[str, int] = {}
+        self.ttfb = LatencyHistogram()
+        self.duration = LatencyHistogram()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "status": dict(self.status),
+            "ttfb": self.ttfb.summary(),
+            "duration": self.duration.summary(),
+        }
+
+
+class HttpMetrics:
+    """按 "方法 路由模板" 聚合的进程内 HTTP 延迟统计，未匹配到路由的请求合并计入一项，避免路径爆炸"""
+
+    def __init__(self):
+        self.routes: Dict[str, RouteMetrics] = {}
+        self.in_flight = 0
+        self.started_at = time.time()
+
+    def route(self, key: str) -> RouteMetrics:
+        metrics = self.routes.get(key)
+        if metrics is None:
+            metrics = self.routes[key] = RouteMetrics()
+        return metrics
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "since": self.started_at,
+            "in_flight": self.in_flight,
+            "routes": {key: self.routes[key].snapshot() for key in sorted(self.routes)},
+        }
+
+    def reset(self):
+        self.routes = {}
+        self.started_at = time.time()
+
+
+http_metrics = HttpMetrics()
+
+
+def _route_template(scope: Scope) -> Optional[str]:
+    """命中路由的完整路径模板（包含 include_router 的前缀），未匹配到路由时返回 None"""
+    # 新版 FastAPI 的 include_router 不再把前缀写进子路由，完整模板记录在 scope["fastapi"] 的路由上下文中
+    context = (scope.get("fastapi") or {}).get("effective_route_context")
+    template = getattr(context, "path_format", None)
+    if template:
+        return template
+
+    # 路由匹配后 Starlette 会把命中的路由写入 scope["route"]
+    route = scope.get("route")
+    template = getattr(route, "path_format", None) or getattr(route, "path", None)
+    if not template:
+        return None
+    # 挂载的子应用等情况下路由模板只对应请求路径的后缀，前面未被匹配的部分就是前缀
+    path = scope.get("path", "")
+    regex = getattr(route, "path_regex", None)
+    if regex is not None and not regex.match(path):
+        for index in range(1, len(path)):
+            if path[index] == "/" and regex.match(path[index:]):
+                return path[:index] + template
+    return template
+
+
+def _route_key(scope: Scope) -> str:
+    return f"{scope['method']} {_route_template(scope) or '<unmatched>'}"
+
+
+class TimingMiddleware:
+    """纯 ASGI 的请求计时中间件，替代 BaseHTTPMiddleware 实现的日志中间件
+
+    BaseHTTPMiddleware 会把响应体转接到内存队列，流式响应多一层任务切换，且只能测到响应头返回的时间。
+    这里直接包装 send：
+    - ttfb：从收到请求到发送第一段响应体
+    - duration：到最后一段响应体发送完毕，SSE 等流式响应即整个流的持续时间
+    客户端中途断开或处理出错时同样计入。
+    """
+
+    def __init__(self, app: ASGIApp, metrics: Optional[HttpMetrics] = None):
+        self.app = app
+        self.metrics = metrics or http_metrics
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+        first_byte: Optional[float] = None
+        self.metrics.in_flight += 1
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code, first_byte
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body" and first_byte is None:
+                if message.get("body") or not message.get("more_body", False):
+                    first_byte = time.perf_counter()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            end = time.perf_counter()
+            self.metrics.in_flight -= 1
+            # 路由在处理过程中才确定
+            metrics = self.metrics.route(_route_key(scope))
+            metrics.requests += 1
+            status_class = f"{status_code // 100}xx"
+            metrics.status[status_class] = metrics.status.get(status_class, 0) + 1
+            ttfb_ms = ((first_byte or end) - start) * 1000
+            duration_ms = (end - start) * 1000
+            metrics.ttfb.observe(ttfb_ms)
+            metrics.duration.observe(duration_ms)
+
+            client = scope.get("client") or ("-", 0)
+            logger.info(
+                f"{client[0]}:{client[1]} - "
+                f"\"{scope['method']} {scope['path']} HTTP/{scope.get('http_version', '1.1')}\" "
+                f"{status_code} - ttfb {ttfb_ms:.0f}ms total {duration_ms:.0f}ms"
+            )
@@ -273,6 +273,7 @@ class InputDefaults:
     image_description_api_key: None = None
     image_description_model: None = None
     image_description_base_url: None = None
+    concurrent_files: int = 4
 
 @dataclass
 class LanguageModelDefaults:
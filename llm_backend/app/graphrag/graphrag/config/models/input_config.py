@@ -106,3 +106,8 @@ class InputConfig(BaseModel):
         description="The image description base url to use.",
         default=graphrag_config_defaults.input.image_description_base_url,
     )
+
+    concurrent_files: int = Field(
+        description="The number of input files to load concurrently.",
+        default=graphrag_config_defaults.input.concurrent_files,
+    )
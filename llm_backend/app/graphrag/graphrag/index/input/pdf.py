@@ -3,6 +3,7 @@
 
 """A module containing load method for PDF files."""
 
+import asyncio
 import logging
 import re
 from pathlib import Path
@@ -199,7 +200,8 @@ async def load_pdf(
                 file_path = temp_file.name
                 
             # 1. 调用MinerU远程Server服务解析PDF
-            result = do_parse(file_path, url=config.mineru_api_url)
+            # do_parse 是同步 HTTP 调用，放到线程中执行，不阻塞其他文件的解析
+            result = await asyncio.to_thread(do_parse, file_path, url=config.mineru_api_url)
             
             if not result or 'output_dir' not in result:
                 data = pd.DataFrame([{
@@ -283,7 +285,7 @@ async def load_pdf(
        
                 # 为表格生成描述
                 if structured_info and structured_info.get("tables") and config.table_description_api_key and config.table_description_model:
-                    structured_info = generate_descriptions_for_tables(auto_dir if auto_dir.exists() else doc_local_dir, structured_info, config)
+                    structured_info = await asyncio.to_thread(generate_descriptions_for_tables, auto_dir if auto_dir.exists() else doc_local_dir, structured_info, config)
                     
                 # 从content_list.json提取图片信息 - 更新路径
                 image_info = None
@@ -295,7 +297,7 @@ async def load_pdf(
         
                 # # 为图片生成描述
                 if image_info and image_info.get("images") and config.image_description_api_key and config.image_description_model:
-                    image_info = generate_descriptions_for_images(auto_dir if auto_dir.exists() else doc_local_dir, image_info, config)
+                    image_info = await asyncio.to_thread(generate_descriptions_for_images, auto_dir if auto_dir.exists() else doc_local_dir, image_info, config)
                     
                 # 构建增强的Markdown文本，包含元数据
                 enhanced_text = enhance_markdown_with_metadata(text_content, structured_info, image_info)
@@ -46,14 +46,20 @@ async def load_files(
         msg = f"No {config.file_type} files found in {config.base_dir}"
         raise ValueError(msg)
 
-    files_loaded = []
-    
-    for file, group in files:
-        try:
-            files_loaded.append(await loader(file, group))
-        except Exception as e:  # noqa: BLE001 (catching Exception is fine here)
-            log.warning("Warning! Error loading file %s. Skipping...", file)
-            log.warning("Error: %s", e)
+    # 多个文件并发解析，信号量限制同时解析的文件数
+    semaphore = asyncio.Semaphore(max(1, config.concurrent_files))
+
+    async def load_one(file: str, group: dict | None) -> pd.DataFrame | None:
+        async with semaphore:
+            try:
+                return await loader(file, group)
+            except Exception as e:  # noqa: BLE001 (catching Exception is fine here)
+                log.warning("Warning! Error loading file %s. Skipping...", file)
+                log.warning("Error: %s", e)
+                return None
+
+    loaded = await asyncio.gather(*(load_one(file, group) for file, group in files))
+    files_loaded = [df for df in loaded if df is not None]
 
     log.info(
         "Found %d %s files, loading %d", len(files), config.file_type, len(files_loaded)
@@ -0,0 +1,347 @@
+"""
+进程内常驻的 GraphRAG 查询引擎。
+
+GraphRAG 的 api.local_search 等接口每次调用都要重新读取配置和 parquet 表、把 DataFrame 转换成数据类、
+重新打开 LanceDB 向量库并构建搜索引擎。这里把这些工作放到加载阶段只做一次，查询时直接复用搜索引擎。
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+import asyncio
+import os
+import time
+
+from app.graphrag.graphrag.config.load_config import load_config
+from app.graphrag.graphrag.config.embeddings import (
+    community_full_content_embedding,
+    entity_description_embedding,
+    text_unit_text_embedding,
+)
+from app.graphrag.graphrag.query.factory import (
+    get_basic_search_engine,
+    get_drift_search_engine,
+    get_global_search_engine,
+    get_local_search_engine,
+)
+from app.graphrag.graphrag.query.indexer_adapters import (
+    read_indexer_communities,
+    read_indexer_covariates,
+    read_indexer_entities,
+    read_indexer_relationships,
+    read_indexer_report_embeddings,
+    read_indexer_reports,
+    read_indexer_text_units,
+)
+from app.graphrag.graphrag.storage.file_pipeline_storage import FilePipelineStorage
+from app.graphrag.graphrag.utils.api import get_embedding_store, load_search_prompt
+from app.graphrag.graphrag.utils.storage import load_table_from_storage
+from app.core.config import settings
+from app.core.logger import get_logger
+
+logger = get_logger(service="graphrag_engine")
+
+GRAPHRAG_TABLES = ["entities", "text_units", "communities", "community_reports", "relationships"]
+SUPPORTED_QUERY_TYPES = ("local", "global", "drift", "basic")
+
+
+@dataclass(frozen=True)
+class EngineState:
+    """一次加载的结果，作为一个整体替换，查询过程中不会读到新旧混合的数据"""
+
+    query_type: str
+    fingerprint: Tuple[Tuple[str, int, int], ...]
+    watch_paths: Tuple[Path, ...]
+    # local / global / basic 的搜索引擎不保存请求状态，可以被并发查询共享；
+    # DRIFT 的搜索引擎带有 query_state，每次查询用 build_engine 基于预加载的数据新建一个
+    search_engine: Any
+    build_engine: Callable[[], Any]
+    loaded_at: float
+    load_ms: float
+
+
+def _fingerprint(paths: Tuple[Path, ...]) -> Tuple[Tuple[str, int, int], ...]:
+    """文件路径、修改时间和大小，目录递归展开"""
+    entries = []
+    for root in paths:
+        if root.is_file():
+            files = [root]
+        elif root.is_dir():
+            files = sorted(p for p in root.rglob("*") if p.is_file())
+        else:
+            continue
+        for path in files:
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((str(path), stat.st_mtime_ns, stat.st_size))
+    return tuple(entries)
+
+
+def _load_tables(output_dir: Path) -> Dict[str, Any]:
+    """读取索引输出的 parquet 表，在工作线程中调用：load_table_from_storage 虽然是协程，但读文件和解析 parquet 都是同步的"""
+
+    async def _load() -> Dict[str, Any]:
+        storage = FilePipelineStorage(root_dir=str(output_dir))
+        loaded = await asyncio.gather(*(load_table_from_storage(name, storage) for name in GRAPHRAG_TABLES))
+        tables = dict(zip(GRAPHRAG_TABLES, loaded))
+        # 协变量表可能不存在
+        try:
+            tables["covariates"] = await load_table_from_storage("covariates", storage)
+        except Exception:
+            tables["covariates"] = None
+        return tables
+
+    return asyncio.run(_load())
+
+
+def _vector_store_args(config) -> Dict[str, Dict[str, Any]]:
+    return {index: store.model_dump() for index, store in config.vector_store.items()}
+
+
+def _build_search_engine(config, tables: Dict[str, Any], query_type: str, response_type: str,
+                         community_level: int, dynamic_community_selection: bool) -> Tuple[Any, Callable[[], Any]]:
+    """把 DataFrame 转换成 GraphRAG 数据类并构建搜索引擎，与 api.query 中各 *_search_streaming 的构建过程一致"""
+    entities = tables["entities"]
+    communities = tables["communities"]
+    community_reports = tables["community_reports"]
+
+    if query_type == "local":
+        covariates = tables.get("covariates")
+        engine = get_local_search_engine(
+            config=config,
+            reports=read_indexer_reports(community_reports, communities, community_level),
+            text_units=read_indexer_text_units(tables["text_units"]),
+            entities=read_indexer_entities(entities, communities, community_level),
+            relationships=read_indexer_relationships(tables["relationships"]),
+            covariates={"claims": read_indexer_covariates(covariates) if covariates is not None else []},
+            description_embedding_store=get_embedding_store(
+                config_args=_vector_store_args(config),
+                embedding_name=entity_description_embedding,
+            ),
+            response_type=response_type,
+            system_prompt=load_search_prompt(config.root_dir, config.local_search.prompt),
+        )
+        return engine, lambda: engine
+
+    if query_type == "global":
+        engine = get_global_search_engine(
+            config,
+            reports=read_indexer_reports(
+                community_reports,
+                communities,
+                community_level=community_level,
+                dynamic_community_selection=dynamic_community_selection,
+            ),
+            entities=read_indexer_entities(entities, communities, community_level=community_level),
+            communities=read_indexer_communities(communities, community_reports),
+            response_type=response_type,
+            dynamic_community_selection=dynamic_community_selection,
+            map_system_prompt=load_search_prompt(config.root_dir, config.global_search.map_prompt),
+            reduce_system_prompt=load_search_prompt(config.root_dir, config.global_search.reduce_prompt),
+            general_knowledge_inclusion_prompt=load_search_prompt(config.root_dir, config.global_search.knowledge_prompt),
+        )
+        return engine, lambda: engine
+
+    if query_type == "drift":
+        vector_store_args = _vector_store_args(config)
+        reports = read_indexer_reports(community_reports, communities, community_level)
+        read_indexer_report_embeddings(
+            reports,
+            get_embedding_store(config_args=vector_store_args, embedding_name=community_full_content_embedding),
+        )
+        drift_inputs = dict(
+            config=config,
+            reports=reports,
+            text_units=read_indexer_text_units(tables["text_units"]),
+            entities=read_indexer_entities(entities, communities, community_level),
+            relationships=read_indexer_relationships(tables["relationships"]),
+            description_embedding_store=get_embedding_store(
+                config_args=vector_store_args,
+                embedding_name=entity_description_embedding,
+            ),
+            local_system_prompt=load_search_prompt(config.root_dir, config.drift_search.prompt),
+            reduce_system_prompt=load_search_prompt(config.root_dir, config.drift_search.reduce_prompt),
+            response_type=response_type,
+        )
+        return None, lambda: get_drift_search_engine(**drift_inputs)
+
+    if query_type == "basic":
+        engine = get_basic_search_engine(
+            config=config,
+            text_units=read_indexer_text_units(tables["text_units"]),
+            text_unit_embeddings=get_embedding_store(
+                config_args=_vector_store_args(config),
+                embedding_name=text_unit_text_embedding,
+            ),
+            system_prompt=load_search_prompt(config.root_dir, config.basic_search.prompt),
+        )
+        return engine, lambda: engine
+
+    raise ValueError(f"不支持的查询类型: {query_type}")
+
+
+class GraphRAGQueryEngine:
+    """常驻内存的 GraphRAG 查询引擎
+
+    - 首次查询（或启动时的后台任务）加载配置和索引表，转换成数据类并构建搜索引擎，之后的查询直接复用
+    - 后台任务每隔 GRAPHRAG_ENGINE_RELOAD_INTERVAL 秒检查输出目录、向量库和 settings.yaml 的修改时间和大小，
+      变化且连续两次检查一致（索引已写完）时重新加载，建好后整体替换，加载期间的查询继续使用旧引擎
+    - 加载失败时保留旧引擎
+    """
+
+    def __init__(self, project_dir: str = None,
+                 data_dir_name: str = None,
+                 query_type: str = None,
+                 response_type: str = None,
+                 community_level: int = None,
+                 dynamic_community_selection: bool = None,
+                 reload_interval: Optional[int] = None):
+        self.project_dir = project_dir or settings.GRAPHRAG_PROJECT_DIR
+        self.data_dir_name = data_dir_name or settings.GRAPHRAG_DATA_DIR
+        self.query_type = (query_type or settings.GRAPHRAG_QUERY_TYPE).lower()
+        self.response_type = response_type or settings.GRAPHRAG_RESPONSE_TYPE
+        self.community_level = community_level or settings.GRAPHRAG_COMMUNITY_LEVEL
+        self.dynamic_community_selection = dynamic_community_selection if dynamic_community_selection is not None else settings.GRAPHRAG_DYNAMIC_COMMUNITY
+        self.reload_interval = reload_interval or settings.GRAPHRAG_ENGINE_RELOAD_INTERVAL
+        self._state: Optional[EngineState] = None
+        self._pending_fingerprint: Optional[Tuple[Tuple[str, int, int], ...]] = None
+        self._load_lock: Optional[asyncio.Lock] = None
+        self._reloader: Optional[asyncio.Task] = None
+        self.loads = 0
+        self.load_failures = 0
+        self.queries = 0
+        self.query_failures = 0
+        self.total_query_ms = 0.0
+
+    @property
+    def project_directory(self) -> Path:
+        return Path(os.path.join(self.project_dir, self.data_dir_name))
+
+    async def load(self, force: bool = False) -> bool:
+        """加载索引并构建搜索引擎，文件没有变化时直接返回 False"""
+        if self._load_lock is None:
+            self._load_lock = asyncio.Lock()
+        async with self._load_lock:
+            state = self._state
+            if state is not None and not force:
+                fingerprint = await asyncio.to_thread(_fingerprint, state.watch_paths)
+                if fingerprint == state.fingerprint:
+                    self._pending_fingerprint = None
+                    return False
+                # 索引可能还在写入，等到两次检查结果一致再加载
+                if fingerprint != self._pending_fingerprint:
+                    self._pending_fingerprint = fingerprint
+                    return False
+
+            if self.query_type not in SUPPORTED_QUERY_TYPES:
+                raise ValueError(f"不支持的查询类型: {self.query_type}")
+
+            start = time.perf_counter()
+            project_directory = self.project_directory
+            config = await asyncio.to_thread(load_config, project_directory, None, None)
+            output_dir = Path(config.output.base_dir)
+            if not output_dir.is_absolute():
+                output_dir = project_directory / output_dir
+            watch_paths = [output_dir, project_directory / "settings.yaml"]
+            for store in config.vector_store.values():
+                db_uri = getattr(store, "db_uri", None)
+                if db_uri and Path(db_uri).exists():
+                    watch_paths.append(Path(db_uri))
+            watch_paths = tuple(dict.fromkeys(watch_paths))
+            # 先记录指纹再读表：读表期间文件发生变化时，下次检查会再加载一次
+            fingerprint = await asyncio.to_thread(_fingerprint, watch_paths)
+
+            try:
+                tables = await asyncio.to_thread(_load_tables, output_dir)
+                search_engine, build_engine = await asyncio.to_thread(
+                    _build_search_engine,
+                    config,
+                    tables,
+                    self.query_type,
+                    self.response_type,
+                    self.community_level,
+                    self.dynamic_community_selection,
+                )
+            except Exception:
+                self.load_failures += 1
+                raise
+
+            load_ms = (time.perf_counter() - start) * 1000
+            self._state = EngineState(
+                query_type=self.query_type,
+                fingerprint=fingerprint,
+                watch_paths=watch_paths,
+                search_engine=search_engine,
+                build_engine=build_engine,
+                loaded_at=time.time(),
+                load_ms=load_ms,
+            )
+            self._pending_fingerprint = None
+            self.loads += 1
+            logger.info(f"Loaded GraphRAG {self.query_type} search engine from {output_dir} in {load_ms:.0f}ms")
+            return True
+
+    async def search(self, query: str) -> Dict[str, Any]:
+        """执行查询，返回 {"response": 回答, "context": 上下文数据}"""
+        state = self._state
+        if state is None:
+            await self.load()
+            state = self._state
+
+        start = time.perf_counter()
+        try:
+            engine = state.search_engine or state.build_engine()
+            result = await engine.search(query=query)
+        except Exception:
+            self.query_failures += 1
+            raise
+        finally:
+            self.queries += 1
+            self.total_query_ms += (time.perf_counter() - start) * 1000
+        return {"response": result.response, "context": result.context_data}
+
+    def start(self):
+        """启动后台加载和热更新任务，已在运行时不重复启动"""
+        if self._reloader is None or self._reloader.done():
+            self._reloader = asyncio.create_task(self._reload_loop())
+
+    async def stop(self):
+        if self._reloader is not None:
+            self._reloader.cancel()
+            try:
+                await self._reloader
+            except asyncio.CancelledError:
+                pass
+            self._reloader = None
+
+    async def _reload_loop(self):
+        while True:
+            try:
+                await self.load()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"GraphRAG engine load failed: {str(e)}")
+            await asyncio.sleep(self.reload_interval)
+
+    def stats(self) -> Dict[str, Any]:
+        state = self._state
+        return {
+            "query_type": self.query_type,
+            "loaded": state is not None,
+            "files": len(state.fingerprint) if state else 0,
+            "loaded_at": state.loaded_at if state else None,
+            "last_load_ms": round(state.load_ms, 2) if state else None,
+            "reload_pending": self._pending_fingerprint is not None,
+            "loads": self.loads,
+            "load_failures": self.load_failures,
+            "queries": self.queries,
+            "query_failures": self.query_failures,
+            "avg_query_ms": round(self.total_query_ms / self.queries, 2) if self.queries else 0.0,
+        }
+
+
+# 进程内共享的查询引擎
+graphrag_engine = GraphRAGQueryEngine()
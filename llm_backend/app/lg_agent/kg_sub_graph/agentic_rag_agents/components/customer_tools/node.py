@@ -10,6 +10,7 @@ from app.graphrag.graphrag.config.load_config import load_config
 from app.graphrag.graphrag.callbacks.noop_query_callbacks import NoopQueryCallbacks
 from app.graphrag.graphrag.utils.storage import load_table_from_storage
 from app.graphrag.graphrag.storage.file_pipeline_storage import FilePipelineStorage
+from app.lg_agent.kg_sub_graph.agentic_rag_agents.components.customer_tools.graphrag_engine import graphrag_engine
 
 # 导入配置
 from app.core.config import settings
@@ -29,6 +30,7 @@ class GraphRAGQueryOutputState(BaseModel):
     steps: List[str]
 
 # 定义GraphRAG API包装器
+# 每次查询都会重新加载配置和索引表，查询节点使用常驻的 graphrag_engine，这里保留用于单次调用和对比测试
 class GraphRAGAPI:
     def __init__(self, project_dir: str = None, 
                  data_dir_name: str = None,
@@ -201,10 +203,8 @@ def create_graphrag_query_node(
             errors.append("未提供查询文本")
         else:
             try:
-                # 使用环境变量中的配置创建GraphRAGAPI实例
-                graphrag_api = GraphRAGAPI()
-                # 调用GraphRAG API获取数据
-                search_result = await graphrag_api.query_graphrag(query)
+                # 使用进程内常驻的查询引擎，索引表和搜索引擎只在首次查询或索引文件变化时加载
+                search_result = await graphrag_engine.search(query)
             except Exception as e:
                 errors.append(f"GraphRAG查询失败: {str(e)}")
   
@@ -217,7 +217,7 @@ def create_graphrag_query_node(
                             "statement": "",
                             "parameters":"",
                             "errors": errors,
-                            "records": {"result": search_result["response"]},
+                            "records": {"result": search_result.get("response", "")},
                             "steps": ["execute_graphrag_query"],
                         }
                     )
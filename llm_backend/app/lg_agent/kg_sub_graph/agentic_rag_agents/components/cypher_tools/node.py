@@ -1,4 +1,4 @@
-from typing import Any, Callable, Coroutine, Dict, List
+from typing import Any, Callable, Coroutine, Dict, List, Optional
 import asyncio
 import os
 from pathlib import Path
@@ -11,10 +11,11 @@ from app.graphrag.graphrag.callbacks.noop_query_callbacks import NoopQueryCallba
 from app.graphrag.graphrag.utils.storage import load_table_from_storage
 from app.graphrag.graphrag.storage.file_pipeline_storage import FilePipelineStorage
 from app.lg_agent.kg_sub_graph.kg_neo4j_conn import get_neo4j_graph
+from app.lg_agent.kg_sub_graph.kg_cypher_cache import cypher_cache
 from app.core.logger import get_logger
-from langchain_ollama import ChatOllama
-from langchain_deepseek import ChatDeepSeek
 from app.core.config import settings, ServiceType
+from app.lg_agent.lg_models import model_registry
+from app.lg_agent.kg_sub_graph.agentic_rag_agents.retrievers.cypher_examples.base import BaseCypherExampleRetriever
 from app.lg_agent.kg_sub_graph.agentic_rag_agents.retrievers.cypher_examples.northwind_retriever import NorthwindCypherRetriever
 from app.lg_agent.kg_sub_graph.agentic_rag_agents.components.cypher_tools.utils import create_text2cypher_generation_node, create_text2cypher_validation_node, create_text2cypher_execution_node
 
@@ -40,6 +41,7 @@ class CypherQueryOutputState(BaseModel):
 # 定义GraphRAG API包装器
 
 def create_cypher_query_node(
+    cypher_example_retriever: Optional[BaseCypherExampleRetriever] = None,
 ) -> Callable[
     [CypherQueryInputState],
     Coroutine[Any, Any, Dict[str, List[CypherQueryOutputState] | List[str]]],
@@ -47,12 +49,21 @@ def create_cypher_query_node(
     """
     创建 Text2Cypher 查询节点，用于LangGraph工作流。
 
+    参数
+    -------
+    cypher_example_retriever : Optional[BaseCypherExampleRetriever]
+        少样本示例检索器，应与规划节点预取示例使用的检索器相同；为空时使用 NorthwindCypherRetriever
+
     返回
     -------
     Callable[[CypherQueryInputState], Dict[str, List[CypherQueryOutputState] | List[str]]]
         名为`cypher_query`的LangGraph节点。
     """
 
+    # step 2. 创建自定义检索器实例，根据 Graph Schema 创建 Cypher 示例，用来引导大模型生成正确的Cypher 查询语句
+    # 检索器不保存请求状态，在创建节点时构建一次
+    cypher_retriever = cypher_example_retriever or NorthwindCypherRetriever()
+
     async def cypher_query(
         state: Dict[str, Any],
     ) -> Dict[str, List[CypherQueryOutputState] | List[str]]:
@@ -66,13 +77,9 @@ def create_cypher_query_node(
             errors.append("未提供查询文本")
  
         # 使用大模型执行查询/多跳/并行查询计划
-        # 1. 根据.env文件中AGENT_SERVICE的设置，选择使用DeepSeek或Ollama启动的模型服务
-        if settings.AGENT_SERVICE == ServiceType.DEEPSEEK:
-            # 对于Agent服务，使用deepseek-chat而不是deepseek-reasoner
-            agent_model = "deepseek-chat"
-            model = ChatDeepSeek(api_key=settings.DEEPSEEK_API_KEY, model_name=agent_model, temperature=0.7, tags=["research_plan"])
-        else:
-            model = ChatOllama(model=settings.OLLAMA_AGENT_MODEL, base_url=settings.OLLAMA_BASE_URL, temperature=0.7, tags=["research_plan"])
+        # 1. 根据.env文件中AGENT_SERVICE的设置，选择使用DeepSeek或Ollama启动的模型服务（模型客户端跨请求复用）
+        # 对于Agent服务，使用deepseek-chat而不是deepseek-reasoner
+        model = model_registry.get_model("research_plan", model_name="deepseek-chat")
 
         # 2. 获取Neo4j图数据库连接
         try:
@@ -81,69 +88,76 @@ def create_cypher_query_node(
         except Exception as e:
             logger.error(f"failed to get Neo4j graph database connection: {e}")
 
-        # step 2. 创建自定义检索器实例，根据 Graph Schema 创建 Cypher 示例，用来引导大模型生成正确的Cypher 查询语句
-        cypher_retriever = NorthwindCypherRetriever()
-
-        # Step 3.根据自定义的 Cypher 示例，引导大模型生成 当前输入 问题的 Cypher 查询语句
-        cypher_generation = create_text2cypher_generation_node(
-            llm=model, graph=neo4j_graph, cypher_example_retriever=cypher_retriever
-        )
+        # 同一个问题之前已生成并通过校验的 Cypher 直接复用，跳过生成和校验
+        cached_statement = cypher_cache.get_statement(query)
+        if cached_statement is not None:
+            logger.info(f"Using cached Cypher statement for task: {query}")
+            execute_info = {"statement": cached_statement, "errors": [], "steps": ["cached_cypher"]}
+        else:
+            # Step 3.根据自定义的 Cypher 示例，引导大模型生成 当前输入 问题的 Cypher 查询语句
+            cypher_generation = create_text2cypher_generation_node(
+                llm=model, graph=neo4j_graph, cypher_example_retriever=cypher_retriever
+            )
 
-        cypher_result = await cypher_generation(state)
-        #  TODO: Example 1. 直接使用大模型生成 Cypher 查询语句
-        """
-        # 安装依赖
-        pip install neo4j-graphrag
+            cypher_result = await cypher_generation(state)
+            #  TODO: Example 1. 直接使用大模型生成 Cypher 查询语句
+            """
+            # 安装依赖
+            pip install neo4j-graphrag
         
-        from neo4j_graphrag.retrievers import Text2CypherRetriever
-        from neo4j_graphrag.llm import OpenAILLM
-        import time
-        import pandas as pd
-        from neo4j import GraphDatabase
-
-        NEO4J_URI="bolt://localhost"
-        NEO4J_USERNAME="neo4j"
-        NEO4J_PASSWORD="Snowball2019"
-        NEO4J_DATABASE="neo4j"
-
-        driver = GraphDatabase.driver(
-            NEO4J_URI, 
-            auth=(NEO4J_USERNAME, NEO4J_PASSWORD)
-            )
+            from neo4j_graphrag.retrievers import Text2CypherRetriever
+            from neo4j_graphrag.llm import OpenAILLM
+            import time
+            import pandas as pd
+            from neo4j import GraphDatabase
+
+            NEO4J_URI="bolt://localhost"
+            NEO4J_USERNAME="neo4j"
+            NEO4J_PASSWORD="Snowball2019"
+            NEO4J_DATABASE="neo4j"
 
-        # 这里可以填写 DeepSeek 模型
-        client = OpenAILLM(api_key="your-deepseek-api-key", base_url="https://api.deepseek.com", model_name='deepseek-chat')
+            driver = GraphDatabase.driver(
+                NEO4J_URI, 
+                auth=(NEO4J_USERNAME, NEO4J_PASSWORD)
+                )
+
+            # 这里可以填写 DeepSeek 模型
+            client = OpenAILLM(api_key="your-deepseek-api-key", base_url="https://api.deepseek.com", model_name='deepseek-chat')
 
         
-        # 定义用户输入：
-        examples = [
-        "USER INPUT: 'Which actors starred in the Matrix?' QUERY: MATCH (p:Person)-[:ACTED_IN]->(m:Movie) WHERE m.title = 'The Matrix' RETURN p.name"
-        ]
-
-        # 初始化检索器
-        retriever = Text2CypherRetriever(
-            driver=driver,
-            llm=client,
-            neo4j_schema=neo4j_schema,  # 可以通过 retrieve_and_parse_schema_from_graph_for_prompts 获取动态的Schema
-            examples=examples,
-        )
+            # 定义用户输入：
+            examples = [
+            "USER INPUT: 'Which actors starred in the Matrix?' QUERY: MATCH (p:Person)-[:ACTED_IN]->(m:Movie) WHERE m.title = 'The Matrix' RETURN p.name"
+            ]
+
+            # 初始化检索器
+            retriever = Text2CypherRetriever(
+                driver=driver,
+                llm=client,
+                neo4j_schema=neo4j_schema,  # 可以通过 retrieve_and_parse_schema_from_graph_for_prompts 获取动态的Schema
+                examples=examples,
+            )
 
         
-        # 执行检索：
-        query_text = "muyu 都有哪些朋友？"
-        print(retriever.search(query_text=query_text))
-        """
+            # 执行检索：
+            query_text = "muyu 都有哪些朋友？"
+            print(retriever.search(query_text=query_text))
+            """
+
+            # step 4. 验证生成的 Cypher 查询语句是否正确
+            validate_cypher = create_text2cypher_validation_node(
+                llm=model,
+                graph=neo4j_graph,
+                llm_validation=True,
+                cypher_statement=cypher_result
+            )
 
-        # step 4. 验证生成的 Cypher 查询语句是否正确
-        validate_cypher = create_text2cypher_validation_node(
-            llm=model,
-            graph=neo4j_graph,
-            llm_validation=True,
-            cypher_statement=cypher_result
-        )
+            # step 5. 获取执行Cypher查询的全部信息
+            execute_info = await validate_cypher(state=state)
 
-        # step 5. 获取执行Cypher查询的全部信息
-        execute_info = await validate_cypher(state=state)
+            # 只缓存校验没有发现错误的语句
+            if not execute_info.get("errors"):
+                cypher_cache.put_statement(query, execute_info["statement"])
 
         # step 6. 执行 Cypher 查询语句
         execute_cypher = create_text2cypher_execution_node(
@@ -151,6 +165,9 @@ def create_cypher_query_node(
         )
 
         final_result = await execute_cypher(state)
+        # 修正后仍有错误的语句没有执行，把错误交给后续节点
+        if execute_info.get("next_action_cypher") == "__end__":
+            errors.extend(execute_info.get("errors", []))
 
         # 封装 单次子任务执行的 输出结果并通过Pydantic模型限定格式
         return {
@@ -1,10 +1,12 @@
 from typing import Any, Callable, Coroutine, Dict
+import asyncio
 import logging
+import time
 from langchain_core.language_models import BaseChatModel
 from langchain_core.output_parsers import StrOutputParser
 from langchain_neo4j import Neo4jGraph
 from app.lg_agent.kg_sub_graph.agentic_rag_agents.components.cypher_tools.prompts import create_text2cypher_generation_prompt_template, create_text2cypher_validation_prompt_template, create_text2cypher_correction_prompt_template
-from app.lg_agent.kg_sub_graph.agentic_rag_agents.retrievers.cypher_examples.base import BaseCypherExampleRetriever
+from app.lg_agent.kg_sub_graph.agentic_rag_agents.retrievers.cypher_examples.base import BaseCypherExampleRetriever, FEWSHOT_EXAMPLES_K
 from typing_extensions import TypedDict
 from typing import Annotated, Any, Dict, List, Optional, Callable, Coroutine
 from operator import add
@@ -14,6 +16,13 @@ import regex as re
 from langchain_core.runnables.base import Runnable
 from langchain_neo4j.chains.graph_qa.cypher_utils import CypherQueryCorrector, Schema
 from neo4j.exceptions import CypherSyntaxError
+from app.lg_agent.kg_sub_graph.kg_neo4j_conn import aquery
+from app.lg_agent.kg_sub_graph.kg_cypher_cache import cypher_cache
+from app.lg_agent.kg_sub_graph.kg_schema import GraphSchemaSnapshot, aget_graph_schema, get_graph_schema
+from app.core.config import settings
+from app.core.logger import get_logger
+
+logger = get_logger(service="cypher_validation")
 
 # 设置Neo4j驱动的日志级别为ERROR，禁止WARNING消息
 logging.getLogger("neo4j").setLevel(logging.ERROR)
@@ -35,6 +44,7 @@ class CypherState(TypedDict):
     records: List[Dict[str, Any]]
     next_action_cypher: str
     attempts: int
+    latency: Dict[str, float]
     steps: Annotated[List[str], add]
 
 class CypherOutputState(TypedDict):
@@ -82,7 +92,7 @@ validation_prompt_template = create_text2cypher_validation_prompt_template()
 correction_cypher_prompt = create_text2cypher_correction_prompt_template()
 
 
-def validate_cypher_query_syntax(graph: Neo4jGraph, cypher_statement: str) -> List[str]:
+async def validate_cypher_query_syntax(graph: Neo4jGraph, cypher_statement: str) -> List[str]:
     """
     Validate the Cypher statement syntax by running an EXPLAIN query.
 
@@ -101,14 +111,14 @@ def validate_cypher_query_syntax(graph: Neo4jGraph, cypher_statement: str) -> Li
     errors = list()
     try:
         # 使用 EXPLAIN 查询来验证Cypher语句的语法，仅仅查看语法是否正确，而不实际执行查询
-        graph.query(f"EXPLAIN {cypher_statement}")
+        await aquery(f"EXPLAIN {cypher_statement}")
     except CypherSyntaxError as e:
         errors.append(str(e.message))
     return errors
 
 
 def correct_cypher_query_relationship_direction(
-    graph: Neo4jGraph, cypher_statement: str
+    graph: Neo4jGraph, cypher_statement: str, snapshot: Optional[GraphSchemaSnapshot] = None
 ) -> str:
     """
     Correct Relationship directions in the Cypher statement with LangChain's `CypherQueryCorrector`.
@@ -119,21 +129,18 @@ def correct_cypher_query_relationship_direction(
         The Neo4j graph wrapper.
     cypher_statement : str
         The Cypher statement to validate.
+    snapshot : Optional[GraphSchemaSnapshot], optional
+        A schema snapshot already fetched with `aget_graph_schema`, by default read from the graph
 
     Returns
     -------
     str
         The Cypher statement with corrected Relationship directions.
     """
-    # 从数据库中提取关系的结构性信息
-    corrector_schema = [
-        Schema(el["start"], el["type"], el["end"])
-        for el in graph.structured_schema.get("relationships", list())
-    ]
-
     # 使用langchain_neo4j 的CypherQueryCorrector 来校验Cypher语句的语法
     # 比如 ：MATCH (a:Person)-[r:FRIENDS_WITH]->(b:Person) ，如果r:FRIENDS_WITH 是反向的，则会被纠正为：MATCH (a:Person)-[r:FRIENDS_WITH]->(b:Person)
-    cypher_query_corrector = CypherQueryCorrector(corrector_schema)
+    # Corrector 按数据库中的关系定义构建，随 Schema 快照缓存
+    cypher_query_corrector = (snapshot or get_graph_schema(graph)).corrector
 
     corrected_cypher: str = cypher_query_corrector(cypher_statement)
 
@@ -169,19 +176,9 @@ def retrieve_and_parse_schema_from_graph_for_prompts(graph: Neo4jGraph) -> str:
     3. 促进零样本学习：即使没有特定领域的示例，模型也能根据提供的结构信息生成符合语法的查询
     """
     
-    schema: str = graph.get_schema
-
-    # 过滤掉对用户查询不相关的内部结构信息
-    if "CypherQuery" in schema:
-        schema = re.sub(  
-            get_cypher_query_node_graph_schema(), r"\2", schema, flags=re.MULTILINE
-        )
-    
-    # 在这里添加一行：将所有花括号替换为方括号，避免模板变量冲突
-    # 因为 Schema 中包含 { } ，会与 ChatPromptTemplate 模版中的 input_variables 
-    schema = schema.replace("{", "[").replace("}", "]")
-    
-    return schema
+    # 过滤 CypherQuery 节点、将花括号替换为方括号（避免与 ChatPromptTemplate 的 input_variables 冲突）
+    # 的结果缓存在 Schema 快照中，只在 Schema 变化时重新计算
+    return get_graph_schema(graph).prompt_schema
 
 
 async def validate_cypher_query_with_llm(
@@ -214,13 +211,13 @@ async def validate_cypher_query_with_llm(
 
     errors: List[str] = []
     mapping_errors: List[str] = []
-
+    snapshot = await aget_graph_schema(graph)
 
     # 使用大模型验证Cypher语句的语法， 通过 Pydantic 结构化输出
     llm_output: ValidateCypherOutput = await validate_cypher_chain.ainvoke(
         {
             "question": question,
-            "schema": retrieve_and_parse_schema_from_graph_for_prompts(graph),
+            "schema": snapshot.prompt_schema,
             "cypher": cypher_statement,
         }
     )
@@ -230,12 +227,13 @@ async def validate_cypher_query_with_llm(
         errors.extend(llm_output.errors)
     # 如果 Pydantic 结构化输出中包含 filters，则遍历每个过滤器。
     if llm_output.filters:
+        node_props = snapshot.structured_schema["node_props"]
         for filter in llm_output.filters:
             # 仅对字符串类型的属性进行映射检查。通过检查 graph.structured_schema 中的节点属性，判断属性类型是否为字符串。
             if (
                 not [
                     prop
-                    for prop in graph.structured_schema["node_props"][filter.node_label]
+                    for prop in node_props[filter.node_label]
                     if prop["property"] == filter.property_key
                 ][0]["type"]
                 == "STRING"
@@ -243,7 +241,7 @@ async def validate_cypher_query_with_llm(
                 continue
 
             # 对于每个过滤器，构建一个 Cypher 查询，检查数据库中是否存在具有指定属性值的节点。
-            mapping = graph.query(
+            mapping = await aquery(
                 f"MATCH (n:{filter.node_label}) WHERE toLower(n.`{filter.property_key}`) = toLower($value) RETURN 'yes' LIMIT 1",
                 {"value": filter.property_value},
             )
@@ -254,7 +252,7 @@ async def validate_cypher_query_with_llm(
 
 
 def validate_cypher_query_with_schema(
-    graph: Neo4jGraph, cypher_statement: str
+    graph: Neo4jGraph, cypher_statement: str, snapshot: Optional[GraphSchemaSnapshot] = None
 ) -> List[str]:
     """
     Validate the provided Cypher statement using the schema retrieved from the graph.
@@ -268,6 +266,8 @@ def validate_cypher_query_with_schema(
         The Neo4j graph wrapper.
     cypher_statement : str
         The Cypher to be validated.
+    snapshot : Optional[GraphSchemaSnapshot], optional
+        A schema snapshot already fetched with `aget_graph_schema`, by default read from the graph
 
     Returns
     -------
@@ -290,9 +290,7 @@ def validate_cypher_query_with_schema(
     _validate_relationship_property_values_with_range,
     )
 
-    schema: Neo4jStructuredSchema = Neo4jStructuredSchema.model_validate(
-        graph.get_structured_schema
-    )
+    schema: Neo4jStructuredSchema = (snapshot or get_graph_schema(graph)).validation_schema
     nodes_and_rels = extract_entities_for_validation(cypher_statement=cypher_statement)
 
     node_tasks = update_task_list_with_property_type(
@@ -397,29 +395,71 @@ def create_text2cypher_generation_node(
         """
         task = state.get("task", "")
         # 获取针对当前任务的cypher示例, 选择 k 个
-        examples: str = cypher_example_retriever.get_examples(
-            **{"query": task[0] if isinstance(task, list) else task, "k": 3}
+        # 规划阶段已为所有子任务批量预取过示例时直接使用预取结果
+        examples: str = await cypher_example_retriever.get_prefetched_examples(
+            task[0] if isinstance(task, list) else task, FEWSHOT_EXAMPLES_K
         )
         generated_cypher = await text2cypher_chain.ainvoke(
             {
                 "question": state.get("task", ""),
                 "fewshot_examples": examples,
-                "schema": graph.schema,
+                "schema": (await aget_graph_schema(graph)).schema,
             }
         )
         return generated_cypher
 
     return generate_cypher
 
+class StageLatency:
+    """按阶段累计 Cypher 校验各步骤的耗时（毫秒），用来查看每轮对话的时间花在哪里"""
+
+    def __init__(self):
+        self._stages: Dict[str, Dict[str, float]] = {}
+
+    def record(self, stage: str, elapsed_ms: float):
+        entry = self._stages.setdefault(stage, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        entry["count"] += 1
+        entry["total_ms"] += elapsed_ms
+        entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            stage: {
+                "count": entry["count"],
+                "avg_ms": round(entry["total_ms"] / entry["count"], 2),
+                "max_ms": round(entry["max_ms"], 2),
+            }
+            for stage, entry in self._stages.items()
+        }
+
+
+validation_latency = StageLatency()
+
+
+def _strip_code_fence(cypher_statement: str) -> str:
+    # 修正链的输出偶尔带有 ```cypher 代码块标记
+    match = re.search(r"```(?:cypher)?\s*([\s\S]*?)```", cypher_statement, flags=re.IGNORECASE)
+    return (match.group(1) if match else cypher_statement).strip()
+
+
 def create_text2cypher_validation_node(
     graph: Neo4jGraph,
     llm: Optional[BaseChatModel] = None,
     llm_validation: bool = True,
     cypher_statement: str = None,
+    max_correction_attempts: Optional[int] = None,
 ) -> Callable[[CypherState], Coroutine[Any, Any, dict[str, Any]]]:
     """
     Create a Text2Cypher query validation node for a LangGraph workflow.
 
+    Checks run in order of cost:
+    1. local checks (write clauses, relationship direction, schema validation when LLM validation is off),
+       a hard failure here skips the database and LLM checks;
+    2. EXPLAIN and LLM validation run concurrently, a syntax error from EXPLAIN cancels the LLM validation;
+    3. on errors the correction chain is awaited and the corrected statement is re-checked locally and with EXPLAIN,
+       up to `max_correction_attempts` times.
+    The latency of each stage is returned under `latency` and accumulated in `validation_latency`.
+
     Parameters
     ----------
     graph : Neo4jGraph
@@ -428,99 +468,156 @@ def create_text2cypher_validation_node(
         The LLM to use for processing if LLM validation is desired. By default None
     llm_validation : bool, optional
         Whether to perform LLM validation with the provided LLM, by default True
+    cypher_statement : str, optional
+        The Cypher statement to validate, by default the `statement` in the state
+    max_correction_attempts : Optional[int], optional
+        Max number of correction rounds, by default settings.CYPHER_CORRECTION_MAX_ATTEMPTS
     Returns
     -------
     Callable[[CypherState], CypherState]
         The LangGraph node.
     """
     # 如果传递了 LLM， 则会借助大模型进行Cypher 校验：针对语法格式的
-    if llm is not None and llm_validation:
+    use_llm_validation = llm is not None and llm_validation
+    if use_llm_validation:
         validate_cypher_chain = validation_prompt_template | llm.with_structured_output(
             ValidateCypherOutput
         )
+    correct_cypher_chain = correction_cypher_prompt | llm | StrOutputParser() if llm is not None else None
+    if max_correction_attempts is None:
+        max_correction_attempts = settings.CYPHER_CORRECTION_MAX_ATTEMPTS
 
     async def validate_cypher(state: CypherState) -> Dict[str, Any]:
         """
         Validates the Cypher statements and maps any property values to the database.
         """
-
-        errors = []
-        mapping_errors = []
-
-        # 1. 语法校验：检查Cypher查询的语法是否正确，例如括号匹配、关键字使用等。
-        syntax_error = validate_cypher_query_syntax(
-            graph=graph, cypher_statement=cypher_statement
-        )
-        errors.extend(syntax_error)
-
-        # 检查Cypher查询中是否包含写操作(如CREATE、DELETE、SET等)，防止大模型意外修改数据库,
-        write_errors = validate_no_writes_in_cypher_query(cypher_statement=cypher_statement)
-        errors.extend(write_errors)
-
-        # Neo4j的关系是有方向性的。这一步会检查关系方向是否正确，如果不正确，会尝试自动修复。这对提高查询成功率很重要。
-        corrected_cypher = correct_cypher_query_relationship_direction(
-            graph=graph, cypher_statement=cypher_statement
-        )
-
-        # 如果启用了大模型验证，会使用语言模型检查Cypher查询的更高级错误，
-        # 例如语义上是否符合用户问题、属性映射是否正确等。这是一种更智能的验证方式。
-        if llm is not None and llm_validation:
-            llm_errors = await validate_cypher_query_with_llm(
-                validate_cypher_chain=validate_cypher_chain,
-                question=state.get("task", ""),
-                graph=graph,
-                cypher_statement=cypher_statement,
-            )
-            errors.extend(llm_errors.get("errors", []))
-            mapping_errors.extend(llm_errors.get("mapping_errors", []))
-
-        # 如果禁用大模型验证，会使用更严格的模式检查Cypher查询，确保所有节点和关系都存在，并且属性值符合类型限制。
-        if not llm_validation:
-            cypher_errors = validate_cypher_query_with_schema(
-                graph=graph, cypher_statement=cypher_statement
+        latency: Dict[str, float] = {}
+
+        def record(stage: str, start: float):
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            latency[stage] = round(latency.get(stage, 0.0) + elapsed_ms, 2)
+            validation_latency.record(stage, elapsed_ms)
+
+        def local_checks(statement: str) -> tuple[str, List[str]]:
+            """本地检查，不访问数据库和大模型，返回 (修正关系方向后的语句, 错误)"""
+            start = time.perf_counter()
+            if not statement.strip():
+                record("local", start)
+                return statement, ["Cypher statement is empty"]
+
+            # 检查Cypher查询中是否包含写操作(如CREATE、DELETE、SET等)，防止大模型意外修改数据库
+            errors = validate_no_writes_in_cypher_query(cypher_statement=statement)
+
+            # Neo4j的关系是有方向性的。这一步会检查关系方向是否正确，如果不正确，会尝试自动修复。
+            # 无法修复时 CypherQueryCorrector 返回空字符串
+            corrected = correct_cypher_query_relationship_direction(
+                graph=graph, cypher_statement=statement, snapshot=snapshot
             )
-            errors.extend(cypher_errors)
+            if not corrected:
+                errors.append("Relationship types or directions in the Cypher statement do not match the graph schema")
+                corrected = statement
+
+            # 如果禁用大模型验证，会使用更严格的模式检查Cypher查询，确保所有节点和关系都存在，并且属性值符合类型限制。
+            if not errors and not use_llm_validation:
+                errors.extend(validate_cypher_query_with_schema(graph=graph, cypher_statement=corrected, snapshot=snapshot))
+            record("local", start)
+            return corrected, errors
+
+        async def explain(statement: str) -> List[str]:
+            start = time.perf_counter()
+            try:
+                # 语法校验：检查Cypher查询的语法是否正确，例如括号匹配、关键字使用等。
+                return await validate_cypher_query_syntax(graph=graph, cypher_statement=statement)
+            finally:
+                record("explain", start)
+
+        async def llm_check(statement: str) -> Dict[str, List[str]]:
+            start = time.perf_counter()
+            try:
+                # 使用语言模型检查Cypher查询的更高级错误，例如语义上是否符合用户问题、属性映射是否正确等。
+                return await validate_cypher_query_with_llm(
+                    validate_cypher_chain=validate_cypher_chain,
+                    question=state.get("task", ""),
+                    graph=graph,
+                    cypher_statement=statement,
+                )
+            finally:
+                record("llm_validation", start)
+
+        async def remote_checks(statement: str, with_llm: bool) -> tuple[List[str], List[str]]:
+            """EXPLAIN 与大模型校验并行执行，EXPLAIN 先发现语法错误时取消大模型校验"""
+            explain_task = asyncio.ensure_future(explain(statement))
+            if not with_llm:
+                return await explain_task, []
+
+            llm_task = asyncio.ensure_future(llm_check(statement))
+            try:
+                done, _ = await asyncio.wait({explain_task, llm_task}, return_when=asyncio.FIRST_COMPLETED)
+                if explain_task in done and explain_task.result():
+                    return explain_task.result(), []
+                syntax_errors, llm_errors = await asyncio.gather(explain_task, llm_task)
+                return syntax_errors + llm_errors.get("errors", []), llm_errors.get("mapping_errors", [])
+            finally:
+                # EXPLAIN 抛出其他异常或本协程被取消时，不留下仍在运行的校验任务
+                pending = [task for task in (explain_task, llm_task) if not task.done()]
+                for task in pending:
+                    task.cancel()
+                if pending:
+                    await asyncio.gather(*pending, return_exceptions=True)
+
+        statement = cypher_statement if cypher_statement is not None else state.get("statement", "")
+        mapping_errors: List[str] = []
+        # 本地检查在同步函数中执行，先异步取得 Schema 快照，避免在事件循环上访问数据库
+        snapshot = await aget_graph_schema(graph)
+
+        # 1. 本地检查，硬性错误（写操作、关系与 Schema 不符）直接进入修正，不再访问数据库和大模型
+        statement, errors = local_checks(statement)
+        # 2. EXPLAIN 和大模型校验
+        if not errors:
+            errors, mapping_errors = await remote_checks(statement, use_llm_validation)
 
         # 区分真正的语法错误和数据不存在的情况
         # Map：mapping_errors: ['Missing value mapping for Order on property orderId with value 12345', 'Missing value mapping for Product on property ProductName with value 小米音箱']
         # Map 会表明你的Cypher查询语法是正确的，但查询中使用的具体值在数据库中不存在。这是数据不存在的问题，而不是查询语法的问题。
-        if errors:  # 真正的语法错误
-            correct_cypher_chain = correction_cypher_prompt | llm | StrOutputParser()
-            corrected_cypher_update = correct_cypher_chain.ainvoke(
-                {
-                    "question": state.get("task"),
-                    "errors": errors, 
-                    "cypher": cypher_statement,
-                    "schema": graph.schema,
-                }
-            )
-            corrected_cypher = corrected_cypher_update
-            next_action = "execute_cypher" 
-
-        elif mapping_errors:  # 数据映射错误
-            # TODO：1. 可以直接结束查询，告诉用户数据库中不存在 2. 可以再次引导用户提问，确认信息， 3. 也可以针对历史对话重新生成Cypher，再次尝试
-            next_action = "execute_cypher"  # 或 "__end__"
-        else:  # 没有错误
-            next_action = "execute_cypher"
-
-        # # 如果有错误且未达到最大尝试次数，转到"correct_cypher"节点尝试修复错误
-        # if (errors or mapping_errors) and GENERATION_ATTEMPT < max_attempts:
-        #     next_action = "correct_cypher"
-        # # 如果未达到最大尝试次数，转到"execute_cypher"节点执行Cypher查询
-        # elif GENERATION_ATTEMPT < max_attempts:
-        #     next_action = "execute_cypher"
-        # elif (
-        #     GENERATION_ATTEMPT == max_attempts
-        #     and attempt_cypher_execution_on_final_attempt
-        # ):
-        #     next_action = "execute_cypher"
-        # else:
-        #     next_action = "__end__"
-
+        # 3. 真正的语法错误：让大模型修正，修正结果再做本地检查和 EXPLAIN，最多 max_correction_attempts 轮
+        attempts = 0
+        while errors and correct_cypher_chain is not None and attempts < max_correction_attempts:
+            attempts += 1
+            start = time.perf_counter()
+            try:
+                corrected_cypher = await correct_cypher_chain.ainvoke(
+                    {
+                        "question": state.get("task"),
+                        "errors": errors,
+                        "cypher": statement,
+                        "schema": snapshot.schema,
+                    }
+                )
+            except Exception as e:
+                logger.warning(f"Cypher correction attempt {attempts} failed: {str(e)}")
+                break
+            finally:
+                record("correction", start)
+
+            statement, errors = local_checks(_strip_code_fence(corrected_cypher))
+            if not errors:
+                errors, _ = await remote_checks(statement, with_llm=False)
+
+        # 修正后仍有错误（包括写操作、修正调用失败）时不执行语句，把错误返回给上层
+        # TODO：数据映射错误时 1. 可以直接结束查询，告诉用户数据库中不存在 2. 可以再次引导用户提问，确认信息， 3. 也可以针对历史对话重新生成Cypher，再次尝试
+        # 目前只有数据映射错误时仍执行语句
+        next_action = "__end__" if errors else "execute_cypher"
+
+        logger.info(
+            f"Validated Cypher in {sum(latency.values()):.0f}ms "
+            f"(errors={len(errors)}, mapping_errors={len(mapping_errors)}, corrections={attempts}): {latency}"
+        )
         return {
             "next_action_cypher": next_action,
-            "statement": corrected_cypher,
+            "statement": statement,
             "errors": errors,
+            "attempts": attempts,
+            "latency": latency,
             "steps": ["validate_cypher"],
         }
 
@@ -555,12 +652,33 @@ def create_text2cypher_execution_node(
         
         # 清理cypher语句中的换行符
         cypher_statement = cypher["statement"].replace("\n", " ").strip()
-        records = graph.query(cypher_statement)
         steps = state.get("steps", list())
         steps.append("execute_cypher")
         
         NO_CYPHER_RESULTS = [{"error": "在数据库中找不到任何相关信息。"}]
         
+        # 校验未通过或含写操作的语句不执行
+        write_errors = validate_no_writes_in_cypher_query(cypher_statement)
+        if cypher.get("next_action_cypher") == "__end__" or write_errors:
+            logger.warning(f"Skipping execution of invalid Cypher statement: {cypher_statement[:200]}")
+            return {
+                "cyphers": [
+                    CypherOutputState(
+                        **{
+                            "task": state.get("task", []),
+                            "statement": cypher_statement,
+                            "parameters": None,
+                            "errors": list(dict.fromkeys(cypher.get("errors", []) + write_errors)),
+                            "records": [],
+                            "steps": steps,
+                        }
+                    )
+                ],
+                "steps": ["text2cypher"],
+            }
+
+        records = await cypher_cache.query(cypher_statement)
+
         return {
             "cyphers": [
                 CypherOutputState(
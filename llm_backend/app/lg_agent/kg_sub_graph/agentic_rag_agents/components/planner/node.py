@@ -1,4 +1,4 @@
-from typing import Any, Callable, Coroutine, Dict
+from typing import Any, Callable, Coroutine, Dict, Optional
 from langchain_core.language_models import BaseChatModel
 from langchain_core.runnables.base import Runnable
 from app.core.logger import get_logger
@@ -10,13 +10,17 @@ from app.lg_agent.kg_sub_graph.agentic_rag_agents.components.models import Task
 from app.lg_agent.kg_sub_graph.agentic_rag_agents.components.planner.models import PlannerOutput
 from app.lg_agent.kg_sub_graph.agentic_rag_agents.components.planner.prompts import create_planner_prompt_template
 from app.lg_agent.kg_sub_graph.agentic_rag_agents.components.state import InputState
+from app.lg_agent.kg_sub_graph.agentic_rag_agents.retrievers.cypher_examples.base import BaseCypherExampleRetriever
 
 
 # 定义planner prompt
 planner_prompt = create_planner_prompt_template()
 
 def create_planner_node(
-    llm: BaseChatModel, ignore_node: bool = False, next_action: str = "tool_selection"
+    llm: BaseChatModel,
+    ignore_node: bool = False,
+    next_action: str = "tool_selection",
+    cypher_example_retriever: Optional[BaseCypherExampleRetriever] = None,
 ) -> Callable[[InputState], Coroutine[Any, Any, Dict[str, Any]]]:
     """
     Create a planner node to be used in a LangGraph workflow.
@@ -27,6 +31,8 @@ def create_planner_node(
         The LLM used to process data.
     ignore_node : bool, optional
         Whether to ignore this node in the workflow, by default False
+    cypher_example_retriever : Optional[BaseCypherExampleRetriever], optional
+        If provided, Cypher examples for all tasks are prefetched in one batch while tools are being selected, by default None
 
     Returns
     -------
@@ -67,6 +73,12 @@ def create_planner_node(
    
         for i, task in enumerate(planner_task_decomposition['tasks']):
             logger.info(f"Sub Task[{i+1}]: {task.question}")
+
+        # 后台为所有子任务批量检索少样本示例，与工具选择并行，生成 Cypher 时直接取用
+        if cypher_example_retriever is not None:
+            cypher_example_retriever.prefetch_examples(
+                [task.question for task in planner_task_decomposition["tasks"]]
+            )
              
         return planner_task_decomposition
 
@@ -1,14 +1,19 @@
 from typing import Any, Callable, Coroutine, Dict, List
+import re
 
 from langchain_neo4j import Neo4jGraph
 from langchain_core.language_models import BaseChatModel
 
+from app.core.logger import get_logger
+from app.lg_agent.kg_sub_graph.kg_cypher_cache import cypher_cache
 from app.lg_agent.kg_sub_graph.agentic_rag_agents.constants import NO_CYPHER_RESULTS
 from app.lg_agent.kg_sub_graph.agentic_rag_agents.components.state import PredefinedCypherInputState
 from app.lg_agent.kg_sub_graph.agentic_rag_agents.components.text2cypher.state import CypherOutputState
 from app.lg_agent.kg_sub_graph.agentic_rag_agents.components.predefined_cypher.utils import create_vector_query_matcher
 from app.lg_agent.kg_sub_graph.agentic_rag_agents.components.predefined_cypher.descriptions import QUERY_DESCRIPTIONS
 
+logger = get_logger(service="predefined_cypher")
+
 
 def create_predefined_cypher_node(
     graph: Neo4jGraph, predefined_cypher_dict: Dict[str, str]
@@ -31,6 +36,21 @@ def create_predefined_cypher_node(
     Callable[[PredefinedCypherInputState], Dict[str, List[CypherOutputState] | List[str]]]
         The LangGraph node named `predefined_cypher`.
     """
+    # 工具选择给出的查询名不存在时，用任务描述做向量匹配找到最接近的预定义查询
+    query_matcher = create_vector_query_matcher(predefined_cypher_dict, QUERY_DESCRIPTIONS)
+
+    async def match_statement(task: str, parameters: Dict[str, Any]) -> tuple[str, str] | None:
+        matches = await query_matcher.amatch_query(task, top_k=1)
+        if not matches:
+            return None
+        match = matches[0]
+        # 只有工具选择给出的参数覆盖匹配到的语句所需的全部参数时才使用
+        required = set(re.findall(r"\$(\w+)", match["cypher"]))
+        if not required <= set(parameters or {}):
+            return None
+        logger.info(f"Matched predefined query {match['query_name']} (similarity {match['similarity']:.2f}) for task: {task}")
+        return match["query_name"], match["cypher"]
+
     async def predefined_cypher(
         state: PredefinedCypherInputState,
     ) -> Dict[str, List[CypherOutputState] | List[str]]:
@@ -45,9 +65,15 @@ def create_predefined_cypher_node(
         )  
 
         statement = predefined_cypher_dict.get(params.get("query"))
+        if statement is None:
+            task = state.get("task", "")
+            matched = await match_statement(task[0] if isinstance(task, list) else task, params.get("parameters"))
+            if matched is not None:
+                statement_name, statement = matched
    
         if statement is not None:
-            records = graph.query(query=statement, params=params.get("parameters"))
+            # 相同语句和参数在短时间内重复执行时直接复用结果
+            records = await cypher_cache.query(statement, params.get("parameters"))
             print(f"records: {records}")
             
         else:
@@ -1,14 +1,38 @@
 """基于词向量的查询匹配工具，用于将用户问题匹配到预定义的Cypher查询"""
 
-import os
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
 import numpy as np
 import requests
 from typing import Dict, List, Tuple, Any, Optional
-from sklearn.metrics.pairwise import cosine_similarity
 from app.core.config import settings
+from app.core.logger import get_logger
+
+logger = get_logger(service="predefined_cypher")
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """按行做 L2 归一化，归一化后点积即余弦相似度"""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
 
 class VectorQueryMatcher:
-    """基于词向量的查询匹配器，用于将用户问题匹配到预定义的Cypher查询"""
+    """基于词向量的查询匹配器，用于将用户问题匹配到预定义的Cypher查询
+
+    - 所有查询描述的向量归一化后组成一个矩阵，按 (模型, 描述内容哈希) 持久化到
+      PREDEFINED_CYPHER_VECTOR_DIR，重启后不再重新计算
+    - 匹配时一次矩阵乘法得到全部相似度，再用 argpartition 取 top_k
+    - 异步匹配通过共享的 aiohttp 会话请求问题向量，最近的问题向量保存在 LRU 中
+    - 创建时只读取持久化的矩阵，不访问 embedding 接口；没有缓存时在第一次匹配时计算，
+      失败后每隔 PREDEFINED_CYPHER_MATRIX_RETRY_INTERVAL 秒重试
+    """
     
     def __init__(
         self, 
@@ -32,31 +56,51 @@ class VectorQueryMatcher:
         self.ollama_base_url = settings.OLLAMA_BASE_URL.rstrip('/')
         self.ollama_embedding_model = settings.OLLAMA_EMBEDDING_MODEL
         self.ollama_api_url = f"{self.ollama_base_url}/api/embed"
-        
-        print(f"使用Ollama模型: {self.ollama_embedding_model}, 地址: {self.ollama_base_url}")
-        
-        # 预计算查询向量
-        self.query_vectors = self._compute_query_vectors()
+
+        logger.info(f"使用Ollama模型: {self.ollama_embedding_model}, 地址: {self.ollama_base_url}")
+
+        # 最近问题的归一化向量
+        self._question_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._cache_size = settings.PREDEFINED_CYPHER_QUESTION_CACHE_SIZE
+        self._lock = threading.Lock()
+
+        # 预计算查询向量矩阵，行顺序与 query_keys 一致
+        self.query_keys, self.query_texts = self._query_texts()
+        self.query_matrix: Optional[np.ndarray] = self._load_matrix(self.query_texts)
+        self._matrix_retry_at = 0.0
+
+    @property
+    def query_vectors(self) -> Dict[str, np.ndarray]:
+        """查询名到归一化向量的映射"""
+        if self.query_matrix is None:
+            return {}
+        return dict(zip(self.query_keys, self.query_matrix))
     
     def _embed_texts(self, texts: List[str]) -> List[List[float]]:
-        """使用Ollama的embedding API将文本转换为向量"""
+        """使用Ollama的embedding API将文本转换为向量，失败时抛出异常"""
         payload = {
             "model": self.ollama_embedding_model,
             "input": texts
         }
-        
-        try:
-            response = requests.post(self.ollama_api_url, json=payload)
+        response = requests.post(self.ollama_api_url, json=payload, timeout=settings.AGENT_REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response.json()["embeddings"]
+
+    async def _aembed_texts(self, texts: List[str]) -> List[List[float]]:
+        """异步调用Ollama的embedding API，复用进程内共享的HTTP会话"""
+        from app.lg_agent.lg_models import model_registry
+
+        session = model_registry.get_session("ollama_embed")
+        payload = {
+            "model": self.ollama_embedding_model,
+            "input": texts
+        }
+        async with session.post(self.ollama_api_url, json=payload) as response:
             response.raise_for_status()
-            result = response.json()
-            return result["embeddings"]
-        except Exception as e:
-            print(f"生成embedding时出错: {str(e)}")
-            # 如果调用失败，返回空向量作为后备
-            return [[0.0] * 1024] * len(texts)  # 假设向量维度为1024
-    
-    def _compute_query_vectors(self) -> Dict[str, np.ndarray]:
-        """预计算所有预定义查询的向量表示"""
+            result = await response.json()
+        return result["embeddings"]
+
+    def _query_texts(self) -> Tuple[List[str], List[str]]:
         query_texts = []
         query_keys = []
         
@@ -66,12 +110,116 @@ class VectorQueryMatcher:
             query_text = f"{query_name} {description}"
             query_texts.append(query_text)
             query_keys.append(query_name)
-        
-        # 计算向量表示
-        vectors = self._embed_texts(query_texts)
-        
-        # 创建查询名到向量的映射
-        return {key: np.array(vector) for key, vector in zip(query_keys, vectors)}
+        return query_keys, query_texts
+
+    def _matrix_path(self, query_texts: List[str]) -> Path:
+        content = json.dumps(
+            [self.ollama_embedding_model, self.query_keys, query_texts],
+            ensure_ascii=False,
+            separators=(",", ":")
+        )
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+        model = "".join(c if c.isalnum() else "_" for c in self.ollama_embedding_model)
+        return Path(settings.PREDEFINED_CYPHER_VECTOR_DIR) / f"{model}_{digest}.npy"
+
+    def _load_matrix(self, query_texts: List[str]) -> Optional[np.ndarray]:
+        """读取持久化的向量矩阵，不存在或损坏时返回 None"""
+        if not query_texts:
+            return None
+
+        path = self._matrix_path(query_texts)
+        if path.exists():
+            try:
+                matrix = np.load(path)
+                if matrix.shape[0] == len(query_texts):
+                    logger.info(f"Loaded predefined query vectors from {path.name}: {matrix.shape}")
+                    return matrix
+            except Exception as e:
+                logger.warning(f"Failed to load predefined query vectors from {path}: {str(e)}")
+        return None
+
+    def _should_compute_matrix(self) -> bool:
+        """矩阵缺失且不在重试间隔内时返回 True，并推迟下一次尝试，避免并发请求同时计算"""
+        if self.query_matrix is not None or not self.query_texts:
+            return False
+        now = time.monotonic()
+        if now < self._matrix_retry_at:
+            return False
+        self._matrix_retry_at = now + settings.PREDEFINED_CYPHER_MATRIX_RETRY_INTERVAL
+        return True
+
+    def _ensure_matrix(self):
+        if not self._should_compute_matrix():
+            return
+        try:
+            vectors = self._embed_texts(self.query_texts)
+        except Exception as e:
+            # 计算失败时不写入缓存，本次匹配返回空结果，间隔后重试
+            logger.error(f"生成embedding时出错: {str(e)}")
+            return
+        self.query_matrix = self._save_matrix(vectors)
+
+    async def _aensure_matrix(self):
+        if not self._should_compute_matrix():
+            return
+        try:
+            vectors = await self._aembed_texts(self.query_texts)
+        except Exception as e:
+            logger.error(f"生成embedding时出错: {str(e)}")
+            return
+        self.query_matrix = await asyncio.to_thread(self._save_matrix, vectors)
+
+    def _save_matrix(self, vectors: List[List[float]]) -> np.ndarray:
+        """归一化并持久化查询向量矩阵，写入失败时仍返回矩阵"""
+        matrix = _normalize(np.asarray(vectors, dtype=np.float32))
+        path = self._matrix_path(self.query_texts)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp.npy")
+            np.save(tmp_path, matrix)
+            tmp_path.replace(path)
+            logger.info(f"Saved predefined query vectors to {path.name}: {matrix.shape}")
+        except OSError as e:
+            logger.warning(f"Failed to persist predefined query vectors: {str(e)}")
+        return matrix
+
+    def _cached_question_vector(self, user_question: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._question_cache.get(user_question)
+            if vector is not None:
+                self._question_cache.move_to_end(user_question)
+            return vector
+
+    def _remember_question_vector(self, user_question: str, vector: List[float]) -> np.ndarray:
+        vector = _normalize(np.asarray(vector, dtype=np.float32))
+        with self._lock:
+            self._question_cache[user_question] = vector
+            self._question_cache.move_to_end(user_question)
+            while len(self._question_cache) > self._cache_size:
+                self._question_cache.popitem(last=False)
+        return vector
+
+    def _top_k(self, question_vector: np.ndarray, top_k: int) -> List[Dict[str, Any]]:
+        """一次矩阵乘法计算全部相似度，argpartition 取前 top_k 个后再排序"""
+        similarities = self.query_matrix @ question_vector
+        k = min(top_k, len(similarities))
+        if k <= 0:
+            return []
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+
+        # 过滤掉低于阈值的匹配
+        results = []
+        for i in top:
+            similarity = float(similarities[i])
+            if similarity >= self.similarity_threshold:
+                query_name = self.query_keys[i]
+                results.append({
+                    "query_name": query_name,
+                    "similarity": similarity,
+                    "cypher": self.predefined_cypher_dict[query_name]
+                })
+        return results
     
     def match_query(self, user_question: str, top_k: int = 3) -> List[Dict[str, Any]]:
         """
@@ -84,29 +232,37 @@ class VectorQueryMatcher:
         返回:
         包含匹配查询名称和相似度分数的字典列表，按相似度降序排列
         """
+        self._ensure_matrix()
+        if self.query_matrix is None:
+            return []
+
         # 对用户问题进行向量化
-        question_vector = np.array(self._embed_texts([user_question])[0])
-        
-        # 计算用户问题与所有预定义查询的相似度
-        similarities = []
-        for query_name, query_vector in self.query_vectors.items():
-            similarity = cosine_similarity([question_vector], [query_vector])[0][0]
-            similarities.append((query_name, similarity))
-        
-        # 按相似度降序排序
-        similarities.sort(key=lambda x: x[1], reverse=True)
-        
-        # 提取前top_k个结果，但过滤掉低于阈值的匹配
-        results = []
-        for query_name, similarity in similarities[:top_k]:
-            if similarity >= self.similarity_threshold:
-                results.append({
-                    "query_name": query_name,
-                    "similarity": float(similarity),
-                    "cypher": self.predefined_cypher_dict[query_name]
-                })
-        
-        return results
+        question_vector = self._cached_question_vector(user_question)
+        if question_vector is None:
+            try:
+                question_vector = self._remember_question_vector(user_question, self._embed_texts([user_question])[0])
+            except Exception as e:
+                logger.error(f"生成embedding时出错: {str(e)}")
+                return []
+
+        return self._top_k(question_vector, top_k)
+
+    async def amatch_query(self, user_question: str, top_k: int = 3) -> List[Dict[str, Any]]:
+        """match_query 的异步版本，查询描述向量和问题向量都通过异步HTTP获取"""
+        await self._aensure_matrix()
+        if self.query_matrix is None:
+            return []
+
+        question_vector = self._cached_question_vector(user_question)
+        if question_vector is None:
+            try:
+                embeddings = await self._aembed_texts([user_question])
+            except Exception as e:
+                logger.error(f"生成embedding时出错: {str(e)}")
+                return []
+            question_vector = self._remember_question_vector(user_question, embeddings[0])
+
+        return self._top_k(question_vector, top_k)
     
     def extract_parameters(self, user_question: str, query_name: str, llm=None) -> Dict[str, str]:
         """
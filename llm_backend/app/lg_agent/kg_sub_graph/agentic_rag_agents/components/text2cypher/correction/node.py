@@ -7,6 +7,7 @@ from typing import Any, Callable, Coroutine, Dict
 from langchain_core.language_models import BaseChatModel
 from langchain_core.output_parsers import StrOutputParser
 from langchain_neo4j import Neo4jGraph
+from app.lg_agent.kg_sub_graph.kg_schema import aget_graph_schema
 
 from ....components.text2cypher.correction.prompts import (
     create_text2cypher_correction_prompt_template,
@@ -47,7 +48,7 @@ def create_text2cypher_correction_node(
                 "question": state.get("task"),
                 "errors": state.get("errors"),
                 "cypher": state.get("statement"),
-                "schema": graph.schema,
+                "schema": (await aget_graph_schema(graph)).schema,
             }
         )
 
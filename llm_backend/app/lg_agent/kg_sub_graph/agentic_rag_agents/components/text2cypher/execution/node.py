@@ -6,6 +6,8 @@ from typing import Any, Callable, Coroutine, Dict, List
 
 from langchain_neo4j import Neo4jGraph
 
+from app.lg_agent.kg_sub_graph.kg_cypher_cache import cypher_cache
+
 from ....constants import NO_CYPHER_RESULTS
 from ..state import CypherOutputState, CypherState
 
@@ -37,7 +39,7 @@ def create_text2cypher_execution_node(
         """
         print("我现在进入到执行了")
         print("state", state)
-        records = graph.query(state.get("statement", ""))
+        records = await cypher_cache.query(state.get("statement", ""))
         print("records", records)
         steps = state.get("steps", list())
         steps.append("execute_cypher")
@@ -3,11 +3,12 @@ from typing import Any, Callable, Coroutine, Dict
 from langchain_core.language_models import BaseChatModel
 from langchain_core.output_parsers import StrOutputParser
 from langchain_neo4j import Neo4jGraph
+from app.lg_agent.kg_sub_graph.kg_schema import aget_graph_schema
 
 from ....components.text2cypher.generation.prompts import (
     create_text2cypher_generation_prompt_template,
 )
-from ....retrievers.cypher_examples.base import BaseCypherExampleRetriever
+from ....retrievers.cypher_examples.base import BaseCypherExampleRetriever, FEWSHOT_EXAMPLES_K
 from ..state import CypherInputState
 
 # 定义text2cypher generation prompt
@@ -30,14 +31,15 @@ def create_text2cypher_generation_node(
 
         task = state.get("task", "")
         # 获取针对当前任务的cypher示例, 选择 k 个
-        examples: str = cypher_example_retriever.get_examples(
-            **{"query": task[0] if isinstance(task, list) else task, "k": 3}
+        # 规划阶段已为所有子任务批量预取过示例时直接使用预取结果
+        examples: str = await cypher_example_retriever.get_prefetched_examples(
+            task[0] if isinstance(task, list) else task, FEWSHOT_EXAMPLES_K
         )
         generated_cypher = await text2cypher_chain.ainvoke(
             {
                 "question": state.get("task", ""),
                 "fewshot_examples": examples,
-                "schema": graph.schema,
+                "schema": (await aget_graph_schema(graph)).schema,
             }
         )
 
@@ -2,9 +2,9 @@
 This code is based on content found in the LangGraph documentation: https://python.langchain.com/docs/tutorials/graph/#advanced-implementation-with-langgraph
 """
 
-from typing import Any, Dict, List, Optional, Set
+from typing import Any, Callable, Dict, List, Optional, Set
 
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, PrivateAttr, field_validator
 
 NUMBER_ENUM = {"INTEGER", "FLOAT"}
 
@@ -172,6 +172,14 @@ class Neo4jStructuredSchema(BaseModel):
         description="Metadata about the database.", default=dict()
     )
 
+    # 枚举/范围表的缓存。实例由 GraphSchemaService 跨请求复用，每张表只计算一次
+    _tables: Dict[str, Any] = PrivateAttr(default_factory=dict)
+
+    def _cached(self, name: str, build: Callable[[], Any]) -> Any:
+        if name not in self._tables:
+            self._tables[name] = build()
+        return self._tables[name]
+
     def get_node_labels(self) -> List[str]:
         """
         A list of node labels in the database.
@@ -205,10 +213,13 @@ class Neo4jStructuredSchema(BaseModel):
         Dict[str, Set[str]]
             The Python dictionary.
         """
-        return {
-            label: {p.property for p in prop_list}
-            for label, prop_list in self.node_props.items()
-        }
+        return self._cached(
+            "node_properties_enum",
+            lambda: {
+                label: {p.property for p in prop_list}
+                for label, prop_list in self.node_props.items()
+            },
+        )
 
     def get_relationship_properties_enum(self) -> Dict[str, Set[str]]:
         """
@@ -219,10 +230,13 @@ class Neo4jStructuredSchema(BaseModel):
         Dict[str, Set[str]]
             The Python dictionary.
         """
-        return {
-            rel_type: {p.property for p in prop_list}
-            for rel_type, prop_list in self.rel_props.items()
-        }
+        return self._cached(
+            "relationship_properties_enum",
+            lambda: {
+                rel_type: {p.property for p in prop_list}
+                for rel_type, prop_list in self.rel_props.items()
+            },
+        )
 
     def get_node_property_values_enum(self) -> Dict[str, Dict[str, Set[str]]]:
         """
@@ -240,14 +254,17 @@ class Neo4jStructuredSchema(BaseModel):
             ...
             }
         """
-        return {
-            label: {
-                p.property: p.get_property_values_enum()
-                for p in prop_list
-                if isinstance(p, Neo4jStructuredSchemaPropertyString) and p.is_enum
-            }
-            for label, prop_list in self.node_props.items()
-        }
+        return self._cached(
+            "node_property_values_enum",
+            lambda: {
+                label: {
+                    p.property: p.get_property_values_enum()
+                    for p in prop_list
+                    if isinstance(p, Neo4jStructuredSchemaPropertyString) and p.is_enum
+                }
+                for label, prop_list in self.node_props.items()
+            },
+        )
 
     def get_relationship_property_values_enum(self) -> Dict[str, Dict[str, Set[str]]]:
         """
@@ -266,14 +283,17 @@ class Neo4jStructuredSchema(BaseModel):
             }
         """
 
-        return {
-            rel_type: {
-                p.property: p.get_property_values_enum()
-                for p in prop_list
-                if isinstance(p, Neo4jStructuredSchemaPropertyString) and p.is_enum
-            }
-            for rel_type, prop_list in self.node_props.items()
-        }
+        return self._cached(
+            "relationship_property_values_enum",
+            lambda: {
+                rel_type: {
+                    p.property: p.get_property_values_enum()
+                    for p in prop_list
+                    if isinstance(p, Neo4jStructuredSchemaPropertyString) and p.is_enum
+                }
+                for rel_type, prop_list in self.node_props.items()
+            },
+        )
 
     def get_node_property_values_range(
         self,
@@ -293,14 +313,17 @@ class Neo4jStructuredSchema(BaseModel):
             ...
             }
         """
-        return {
-            label: {
-                p.property: p
-                for p in prop_list
-                if isinstance(p, Neo4jStructuredSchemaPropertyNumber)
-            }
-            for label, prop_list in self.node_props.items()
-        }
+        return self._cached(
+            "node_property_values_range",
+            lambda: {
+                label: {
+                    p.property: p
+                    for p in prop_list
+                    if isinstance(p, Neo4jStructuredSchemaPropertyNumber)
+                }
+                for label, prop_list in self.node_props.items()
+            },
+        )
 
     def get_relationship_property_values_range(
         self,
@@ -320,14 +343,17 @@ class Neo4jStructuredSchema(BaseModel):
             ...
             }
         """
-        return {
-            rel_type: {
-                p.property: p
-                for p in prop_list
-                if isinstance(p, Neo4jStructuredSchemaPropertyNumber)
-            }
-            for rel_type, prop_list in self.node_props.items()
-        }
+        return self._cached(
+            "relationship_property_values_range",
+            lambda: {
+                rel_type: {
+                    p.property: p
+                    for p in prop_list
+                    if isinstance(p, Neo4jStructuredSchemaPropertyNumber)
+                }
+                for rel_type, prop_list in self.node_props.items()
+            },
+        )
 
 
 class CypherValidationTask(BaseModel):
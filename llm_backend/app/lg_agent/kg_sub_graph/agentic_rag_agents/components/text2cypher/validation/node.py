@@ -6,7 +6,7 @@ from typing import Any, Callable, Coroutine, Dict, Optional
 
 from langchain_core.language_models import BaseChatModel
 from langchain_neo4j import Neo4jGraph
-
+from app.lg_agent.kg_sub_graph.kg_schema import aget_graph_schema
 
 
 from ....components.text2cypher.validation.models import ValidateCypherOutput
@@ -71,9 +71,11 @@ def create_text2cypher_validation_node(
         GENERATION_ATTEMPT: int = state.get("attempts", 0) + 1
         errors = []
         mapping_errors = []
+        # 下面的同步校验函数使用同一个 Schema 快照，先异步取得，避免在事件循环上访问数据库
+        snapshot = await aget_graph_schema(graph)
 
         # 检查Cypher查询的语法是否正确，例如括号匹配、关键字使用等。
-        syntax_error = validate_cypher_query_syntax(
+        syntax_error = await validate_cypher_query_syntax(
             graph=graph, cypher_statement=state.get("statement", "")
         )
 
@@ -85,7 +87,7 @@ def create_text2cypher_validation_node(
 
         # Neo4j的关系是有方向性的。这一步会检查关系方向是否正确，如果不正确，会尝试自动修复。这对提高查询成功率很重要。
         corrected_cypher = correct_cypher_query_relationship_direction(
-            graph=graph, cypher_statement=state.get("statement", "")
+            graph=graph, cypher_statement=state.get("statement", ""), snapshot=snapshot
         )
 
         # 如果启用了大模型验证，会使用语言模型检查Cypher查询的更高级错误，
@@ -103,7 +105,7 @@ def create_text2cypher_validation_node(
         # 如果禁用大模型验证，会使用更严格的模式检查Cypher查询，确保所有节点和关系都存在，并且属性值符合类型限制。
         if not llm_validation:
             cypher_errors = validate_cypher_query_with_schema(
-                graph=graph, cypher_statement=state.get("statement", "")
+                graph=graph, cypher_statement=state.get("statement", ""), snapshot=snapshot
             )
             errors.extend(cypher_errors)
 
@@ -6,12 +6,12 @@ from typing import Any, Dict, List, Literal, Optional, Set, Tuple, Union
 
 from langchain_core.runnables.base import Runnable
 from langchain_neo4j import Neo4jGraph
-from langchain_neo4j.chains.graph_qa.cypher_utils import CypherQueryCorrector, Schema
 from neo4j.exceptions import CypherSyntaxError
+from app.lg_agent.kg_sub_graph.kg_neo4j_conn import aquery
+from app.lg_agent.kg_sub_graph.kg_schema import GraphSchemaSnapshot, aget_graph_schema, get_graph_schema
 
 from ....components.text2cypher.validation.models import ValidateCypherOutput
 from ....constants import WRITE_CLAUSES
-from ...utils.utils import retrieve_and_parse_schema_from_graph_for_prompts
 from .models import (
     CypherValidationTask,
     Neo4jStructuredSchema,
@@ -25,7 +25,7 @@ from .utils.cypher_extractors import (
 from .utils.utils import update_task_list_with_property_type
 
 
-def validate_cypher_query_syntax(graph: Neo4jGraph, cypher_statement: str) -> List[str]:
+async def validate_cypher_query_syntax(graph: Neo4jGraph, cypher_statement: str) -> List[str]:
     """
     Validate the Cypher statement syntax by running an EXPLAIN query.
 
@@ -43,14 +43,14 @@ def validate_cypher_query_syntax(graph: Neo4jGraph, cypher_statement: str) -> Li
     """
     errors = list()
     try:
-        graph.query(f"EXPLAIN {cypher_statement}")
+        await aquery(f"EXPLAIN {cypher_statement}")
     except CypherSyntaxError as e:
         errors.append(str(e.message))
     return errors
 
 
 def correct_cypher_query_relationship_direction(
-    graph: Neo4jGraph, cypher_statement: str
+    graph: Neo4jGraph, cypher_statement: str, snapshot: Optional[GraphSchemaSnapshot] = None
 ) -> str:
     """
     Correct Relationship directions in the Cypher statement with LangChain's `CypherQueryCorrector`.
@@ -61,6 +61,8 @@ def correct_cypher_query_relationship_direction(
         The Neo4j graph wrapper.
     cypher_statement : str
         The Cypher statement to validate.
+    snapshot : Optional[GraphSchemaSnapshot], optional
+        A schema snapshot already fetched with `aget_graph_schema`, by default read from the graph
 
     Returns
     -------
@@ -68,11 +70,8 @@ def correct_cypher_query_relationship_direction(
         The Cypher statement with corrected Relationship directions.
     """
     # Cypher query corrector is experimental
-    corrector_schema = [
-        Schema(el["start"], el["type"], el["end"])
-        for el in graph.structured_schema.get("relationships", list())
-    ]
-    cypher_query_corrector = CypherQueryCorrector(corrector_schema)
+    # The corrector is built once per schema version and cached with the schema snapshot
+    cypher_query_corrector = (snapshot or get_graph_schema(graph)).corrector
 
     corrected_cypher: str = cypher_query_corrector(cypher_statement)
 
@@ -109,29 +108,31 @@ async def validate_cypher_query_with_llm(
 
     errors: List[str] = []
     mapping_errors: List[str] = []
+    snapshot = await aget_graph_schema(graph)
 
     llm_output: ValidateCypherOutput = await validate_cypher_chain.ainvoke(
         {
             "question": question,
-            "schema": retrieve_and_parse_schema_from_graph_for_prompts(graph),
+            "schema": snapshot.prompt_schema,
             "cypher": cypher_statement,
         }
     )
     if llm_output.errors:
         errors.extend(llm_output.errors)
     if llm_output.filters:
+        node_props = snapshot.structured_schema["node_props"]
         for filter in llm_output.filters:
             # Do mapping only for string values
             if (
                 not [
                     prop
-                    for prop in graph.structured_schema["node_props"][filter.node_label]
+                    for prop in node_props[filter.node_label]
                     if prop["property"] == filter.property_key
                 ][0]["type"]
                 == "STRING"
             ):
                 continue
-            mapping = graph.query(
+            mapping = await aquery(
                 f"MATCH (n:{filter.node_label}) WHERE toLower(n.`{filter.property_key}`) = toLower($value) RETURN 'yes' LIMIT 1",
                 {"value": filter.property_value},
             )
@@ -142,7 +143,7 @@ async def validate_cypher_query_with_llm(
 
 
 def validate_cypher_query_with_schema(
-    graph: Neo4jGraph, cypher_statement: str
+    graph: Neo4jGraph, cypher_statement: str, snapshot: Optional[GraphSchemaSnapshot] = None
 ) -> List[str]:
     """
     Validate the provided Cypher statement using the schema retrieved from the graph.
@@ -156,6 +157,8 @@ def validate_cypher_query_with_schema(
         The Neo4j graph wrapper.
     cypher_statement : str
         The Cypher to be validated.
+    snapshot : Optional[GraphSchemaSnapshot], optional
+        A schema snapshot already fetched with `aget_graph_schema`, by default read from the graph
 
     Returns
     -------
@@ -163,9 +166,7 @@ def validate_cypher_query_with_schema(
         A list of any found errors.
     """
 
-    schema: Neo4jStructuredSchema = Neo4jStructuredSchema.model_validate(
-        graph.get_structured_schema
-    )
+    schema: Neo4jStructuredSchema = (snapshot or get_graph_schema(graph)).validation_schema
     nodes_and_rels = extract_entities_for_validation(cypher_statement=cypher_statement)
 
     node_tasks = update_task_list_with_property_type(
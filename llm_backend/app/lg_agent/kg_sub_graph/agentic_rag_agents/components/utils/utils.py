@@ -1,7 +1,6 @@
-import regex as re
 from langchain_neo4j import Neo4jGraph
 
-from .regex_patterns import get_cypher_query_node_graph_schema
+from app.lg_agent.kg_sub_graph.kg_schema import get_graph_schema
 
 
 def retrieve_and_parse_schema_from_graph_for_prompts(graph: Neo4jGraph) -> str:
@@ -29,16 +28,6 @@ def retrieve_and_parse_schema_from_graph_for_prompts(graph: Neo4jGraph) -> str:
     3. 促进零样本学习：即使没有特定领域的示例，模型也能根据提供的结构信息生成符合语法的查询
     """
     
-    schema: str = graph.get_schema
-
-    # 过滤掉对用户查询不相关的内部结构信息
-    if "CypherQuery" in schema:
-        schema = re.sub(  
-            get_cypher_query_node_graph_schema(), r"\2", schema, flags=re.MULTILINE
-        )
-    
-    # 在这里添加一行：将所有花括号替换为方括号，避免模板变量冲突
-    # 因为 Schema 中包含 { } ，会与 ChatPromptTemplate 模版中的 input_variables 
-    schema = schema.replace("{", "[").replace("}", "]")
-    
-    return schema
+    # 过滤 CypherQuery 节点、将花括号替换为方括号（避免与 ChatPromptTemplate 的 input_variables 冲突）
+    # 的结果缓存在 Schema 快照中，只在 Schema 变化时重新计算
+    return get_graph_schema(graph).prompt_schema
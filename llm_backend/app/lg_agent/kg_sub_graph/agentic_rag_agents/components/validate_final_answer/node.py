@@ -3,10 +3,10 @@ from typing import Any, Callable, Coroutine, Dict
 from langchain_core.language_models import BaseChatModel
 from langchain_core.runnables.base import Runnable
 from langchain_neo4j import Neo4jGraph
+from app.lg_agent.kg_sub_graph.kg_schema import aget_graph_schema
 
 from ...components.state import OverallState
 from ..models import Task
-from ..utils.utils import retrieve_and_parse_schema_from_graph_for_prompts
 from .models import ValidateFinalAnswerResponse
 from .prompts import create_validate_final_answer_prompt_template
 
@@ -59,7 +59,7 @@ def create_validate_final_answer_node(
                 {
                     "question": state.get("question"),
                     "answer": state.get("summary"),
-                    "schema": retrieve_and_parse_schema_from_graph_for_prompts(graph),
+                    "schema": (await aget_graph_schema(graph)).prompt_schema,
                     "data": [
                         cypher.get("records") for cypher in state.get("cyphers", list())
                     ],
@@ -1,3 +1,4 @@
 from .embedder_protocol import EmbedderProtocol
+from .request_cache import RequestScope, aembed_queries, current_scope, request_scope
 
-__all__ = ["EmbedderProtocol"]
+__all__ = ["EmbedderProtocol", "RequestScope", "aembed_queries", "current_scope", "request_scope"]
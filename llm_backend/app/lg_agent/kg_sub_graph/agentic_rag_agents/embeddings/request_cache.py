@@ -0,0 +1,105 @@
+"""
+单次请求（一轮对话）内共享的向量缓存。
+
+同一轮对话里，子任务问题会被示例检索、预定义查询匹配等多个组件分别向量化。
+在 request_scope() 范围内，aembed_queries 按 (嵌入器, 文本) 缓存结果，同一个问题每轮最多向量化一次；
+并发请求同一文本时共享同一个 Future，只发起一次调用。范围之外不做缓存。
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Tuple
+import asyncio
+
+
+class RequestScope:
+    """一轮对话的缓存：向量，以及预取的检索结果（见 BaseCypherExampleRetriever.prefetch_examples）"""
+
+    def __init__(self):
+        self.embeddings: Dict[Tuple[int, str], asyncio.Future] = {}
+        self.prefetched: Dict[Hashable, asyncio.Future] = {}
+        self.tasks: List[asyncio.Task] = []
+        self.embed_calls = 0
+        self.embed_hits = 0
+
+    def close(self):
+        # 没有被用到的预取任务直接取消
+        for task in self.tasks:
+            if not task.done():
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "embeddings": len(self.embeddings),
+            "embed_calls": self.embed_calls,
+            "embed_hits": self.embed_hits,
+            "prefetched": len(self.prefetched),
+        }
+
+
+_current_scope: ContextVar[Optional[RequestScope]] = ContextVar("request_embedding_scope", default=None)
+
+
+@contextmanager
+def request_scope() -> Iterator[RequestScope]:
+    """开启一轮对话的缓存范围，LangGraph 节点运行在复制的上下文中，共享同一个 RequestScope"""
+    scope = RequestScope()
+    token = _current_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _current_scope.reset(token)
+        scope.close()
+
+
+def current_scope() -> Optional[RequestScope]:
+    return _current_scope.get()
+
+
+async def _embed_many(embedder: Any, texts: List[str]) -> List[List[float]]:
+    # 依次支持：LangChain Embeddings 的批量接口、EmbeddingBatcher 的 embed、只有同步 embed_query 的嵌入器
+    if hasattr(embedder, "aembed_documents"):
+        return await embedder.aembed_documents(texts)
+    if hasattr(embedder, "embed") and asyncio.iscoroutinefunction(embedder.embed):
+        return list(await asyncio.gather(*(embedder.embed(text) for text in texts)))
+    if hasattr(embedder, "embed_documents"):
+        return await asyncio.to_thread(embedder.embed_documents, texts)
+    return await asyncio.to_thread(lambda: [embedder.embed_query(text) for text in texts])
+
+
+async def aembed_queries(embedder: Any, texts: List[str]) -> List[List[float]]:
+    """向量化一组文本，结果与输入一一对应；在 request_scope 内时复用本轮已有的结果"""
+    scope = _current_scope.get()
+    if scope is None:
+        return await _embed_many(embedder, texts)
+
+    futures: List[asyncio.Future] = []
+    missing: Dict[str, asyncio.Future] = {}
+    loop = asyncio.get_running_loop()
+    for text in texts:
+        key = (id(embedder), text)
+        future = scope.embeddings.get(key)
+        if future is None:
+            future = loop.create_future()
+            scope.embeddings[key] = future
+            missing[text] = future
+        elif text not in missing:
+            scope.embed_hits += 1
+        futures.append(future)
+
+    if missing:
+        scope.embed_calls += 1
+        try:
+            vectors = await _embed_many(embedder, list(missing))
+        except BaseException as e:
+            # 失败的结果不缓存，之后的调用重新向量化
+            for text, future in missing.items():
+                scope.embeddings.pop((id(embedder), text), None)
+                if not future.done():
+                    future.set_exception(e)
+                    future.exception()
+            raise
+        for future, vector in zip(missing.values(), vectors):
+            future.set_result(vector)
+
+    return list(await asyncio.gather(*futures))
@@ -1,8 +1,14 @@
 from abc import ABC, abstractmethod
-from typing import Any
+from typing import Any, List
 from pydantic import BaseModel, ConfigDict
+import asyncio
 import re
 
+from ...embeddings.request_cache import current_scope
+
+# 生成 Cypher 时使用的少样本示例数量，规划阶段按同样的数量预取
+FEWSHOT_EXAMPLES_K = 3
+
 class BaseCypherExampleRetriever(BaseModel, ABC):
     """
     Abstract base class for an example retriever.
@@ -29,3 +35,63 @@ class BaseCypherExampleRetriever(BaseModel, ABC):
             格式化的示例字符串，每个示例包含问题和对应的Cypher查询
         """
         pass
+
+    async def aget_examples(self, query: str, k: int = 5) -> str:
+        """
+        get_examples 的异步版本，默认直接调用 get_examples。
+        需要调用 embedding 等远程服务的检索器应当覆盖此方法。
+        """
+        return self.get_examples(query, k)
+
+    async def aget_examples_batch(self, queries: List[str], k: int = 5) -> List[str]:
+        """
+        批量获取示例，结果与 queries 一一对应。
+        默认并发调用 aget_examples，支持一次查询多个向量的检索器应当覆盖此方法。
+        """
+        return list(await asyncio.gather(*(self.aget_examples(query, k) for query in queries)))
+
+    def prefetch_examples(self, queries: List[str], k: int = FEWSHOT_EXAMPLES_K) -> None:
+        """
+        在后台为本轮对话的所有子任务批量检索示例，只在 request_scope 范围内生效。
+        之后的 get_prefetched_examples 直接等待预取结果，不再单独检索。
+        """
+        scope = current_scope()
+        queries = [q for q in dict.fromkeys(queries) if q and (id(self), q, k) not in scope.prefetched] if scope else []
+        if not queries:
+            return
+
+        loop = asyncio.get_running_loop()
+        futures = {query: loop.create_future() for query in queries}
+        for query, future in futures.items():
+            scope.prefetched[(id(self), query, k)] = future
+
+        async def _prefetch():
+            try:
+                results = await self.aget_examples_batch(queries, k)
+            except BaseException as e:
+                for future in futures.values():
+                    if not future.done():
+                        future.set_exception(e)
+                        # 预取失败时由 get_prefetched_examples 重新检索，这里标记异常已处理
+                        future.exception()
+                raise
+            for future, result in zip(futures.values(), results):
+                if not future.done():
+                    future.set_result(result)
+
+        task = asyncio.create_task(_prefetch())
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        scope.tasks.append(task)
+
+    async def get_prefetched_examples(self, query: str, k: int = FEWSHOT_EXAMPLES_K) -> str:
+        """
+        优先使用 prefetch_examples 的结果，没有预取或预取失败时调用 aget_examples。
+        """
+        scope = current_scope()
+        future = scope.prefetched.get((id(self), query, k)) if scope else None
+        if future is not None:
+            try:
+                return await asyncio.shield(future)
+            except Exception:
+                pass
+        return await self.aget_examples(query, k)
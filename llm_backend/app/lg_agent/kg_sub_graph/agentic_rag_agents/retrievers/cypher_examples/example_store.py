@@ -0,0 +1,319 @@
+"""
+进程内的 Cypher 少样本示例库：从文件或数据库加载示例，向量化一次后保存在内存 ANN 索引中。
+"""
+
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import json
+import re
+import time
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.lg_agent.kg_sub_graph.agentic_rag_agents.embeddings.request_cache import aembed_queries
+
+logger = get_logger(service="cypher_examples")
+
+# 内置的示例文件，也用作数据库为空时的初始数据
+DEFAULT_EXAMPLES_FILE = Path(__file__).parent / "northwind_examples.json"
+
+# 关键词匹配使用的模式：(问题中的模式, 示例类别关键词)
+IMPORTANT_PATTERNS = [
+    (r'产品|商品', '产品'),
+    (r'类别|分类', '类别'),
+    (r'供应商', '供应商'),
+    (r'订单', '订单'),
+    (r'客户', '客户'),
+    (r'员工', '员工'),
+    (r'物流|配送', '物流'),
+    (r'评价|评论', '评价'),
+    (r'手册|说明书', '手册')
+]
+
+
+def _read_examples_file(path: Path) -> List[Dict[str, str]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class ExampleSource(ABC):
+    """示例数据源，version 用于低成本地判断示例是否有变化"""
+
+    @abstractmethod
+    async def version(self) -> str: ...
+
+    @abstractmethod
+    async def load(self) -> List[Dict[str, str]]: ...
+
+    @abstractmethod
+    async def add(self, examples: List[Dict[str, str]]) -> None: ...
+
+
+class FileExampleSource(ExampleSource):
+    """JSON 文件数据源：[{"category": ..., "question": ..., "cypher": ...}, ...]"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    async def version(self) -> str:
+        stat = self.path.stat()
+        return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+    async def load(self) -> List[Dict[str, str]]:
+        return await asyncio.to_thread(_read_examples_file, self.path)
+
+    async def add(self, examples: List[Dict[str, str]]) -> None:
+        def _append():
+            current = _read_examples_file(self.path) if self.path.exists() else []
+            current.extend(examples)
+            tmp_path = self.path.with_suffix(".json.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(current, f, ensure_ascii=False, indent=2)
+            tmp_path.replace(self.path)
+
+        await asyncio.to_thread(_append)
+
+
+class DatabaseExampleSource(ExampleSource):
+    """cypher_examples 表数据源，表为空时写入内置示例"""
+
+    def __init__(self):
+        self._table_ready = False
+
+    async def _ensure_table(self):
+        if self._table_ready:
+            return
+        from app.core.database import engine
+        from app.models.cypher_example import CypherExample
+
+        async with engine.begin() as conn:
+            await conn.run_sync(CypherExample.__table__.create, checkfirst=True)
+        self._table_ready = True
+
+    async def version(self) -> str:
+        from sqlalchemy import func, select
+        from app.core.database import AsyncSessionLocal
+        from app.models.cypher_example import CypherExample
+
+        # 加载时先取版本，新库上表还不存在
+        await self._ensure_table()
+        async with AsyncSessionLocal() as db:
+            row = (await db.execute(
+                select(func.count(CypherExample.id), func.max(CypherExample.id), func.max(CypherExample.updated_at))
+            )).one()
+        return f"{row[0]}:{row[1]}:{row[2]}"
+
+    async def load(self) -> List[Dict[str, str]]:
+        from sqlalchemy import select
+        from app.core.database import AsyncSessionLocal
+        from app.models.cypher_example import CypherExample
+
+        await self._ensure_table()
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(select(CypherExample).order_by(CypherExample.id))).scalars().all()
+        if not rows:
+            seed = await asyncio.to_thread(_read_examples_file, DEFAULT_EXAMPLES_FILE)
+            await self.add(seed)
+            logger.info(f"Seeded cypher_examples with {len(seed)} built-in examples")
+            return seed
+        return [{"category": r.category, "question": r.question, "cypher": r.cypher} for r in rows]
+
+    async def add(self, examples: List[Dict[str, str]]) -> None:
+        from app.core.database import AsyncSessionLocal
+        from app.models.cypher_example import CypherExample
+
+        async with AsyncSessionLocal() as db:
+            db.add_all([
+                CypherExample(category=e.get("category"), question=e["question"], cypher=e["cypher"])
+                for e in examples
+            ])
+            await db.commit()
+
+
+def default_example_source() -> ExampleSource:
+    if settings.CYPHER_EXAMPLES_SOURCE == "database":
+        return DatabaseExampleSource()
+    return FileExampleSource(Path(settings.CYPHER_EXAMPLES_FILE) if settings.CYPHER_EXAMPLES_FILE else DEFAULT_EXAMPLES_FILE)
+
+
+class CypherExampleStore:
+    """Cypher 少样本示例库
+
+    - 示例来自文件或数据库，问题文本向量化一次后放进 faiss 索引（按规模选择 Flat / HNSW / IVF）
+    - 检索时只需要一次问题向量（本轮对话内共享，嵌入合并器另有 LRU）和一次内存索引查询，不经过远程向量索引
+    - 后台任务每隔 CYPHER_EXAMPLES_RELOAD_INTERVAL 秒检查数据源版本，变化时只对新增的问题重新向量化，
+      建好新索引后整体替换，检索不会读到半成品
+    - 索引尚未建好或向量化失败时退回关键词匹配
+    """
+
+    def __init__(self, source: Optional[ExampleSource] = None, embedder=None, reload_interval: Optional[int] = None):
+        self.source = source or default_example_source()
+        self.reload_interval = reload_interval or settings.CYPHER_EXAMPLES_RELOAD_INTERVAL
+        self._embedder = embedder
+        # (示例列表, 索引) 作为一个整体替换
+        self._state: Tuple[List[Dict[str, str]], Any] = (_read_examples_file(DEFAULT_EXAMPLES_FILE), None)
+        self._vectors: Dict[str, np.ndarray] = {}
+        self._version: Optional[str] = None
+        self._load_lock: Optional[asyncio.Lock] = None
+        self._reloader: Optional[asyncio.Task] = None
+        self.loads = 0
+        self.searches = 0
+        self.fallbacks = 0
+        self.last_search_ms = 0.0
+
+    @property
+    def examples(self) -> List[Dict[str, str]]:
+        return self._state[0]
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            from app.services.redis_semantic_cache import semantic_cache_registry
+            self._embedder = semantic_cache_registry.get_embedder()
+        return self._embedder
+
+    async def load(self, force: bool = False) -> bool:
+        """数据源有变化时重新加载，返回是否重建了索引"""
+        if self._load_lock is None:
+            self._load_lock = asyncio.Lock()
+        async with self._load_lock:
+            version = await self.source.version()
+            if not force and version == self._version and self._state[1] is not None:
+                return False
+
+            start = time.perf_counter()
+            examples = [e for e in await self.source.load() if e.get("question") and e.get("cypher")]
+            questions = [e["question"] for e in examples]
+            missing = [q for q in dict.fromkeys(questions) if q not in self._vectors]
+            if missing:
+                vectors = await asyncio.gather(*(self.embedder.embed(q) for q in missing))
+                for question, vector in zip(missing, vectors):
+                    self._vectors[question] = np.asarray(vector, dtype=np.float32)
+
+            index = None
+            if examples:
+                from app.services.vector_index_manager import IncrementalIndexWriter
+
+                matrix = np.vstack([self._vectors[q] for q in questions])
+                matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+                writer = IncrementalIndexWriter(matrix.shape[1], len(examples))
+                writer.add(matrix)
+                index = writer.finish()
+
+            # 丢弃已删除示例的向量
+            self._vectors = {q: self._vectors[q] for q in questions}
+            self._state = (examples, index)
+            self._version = version
+            self.loads += 1
+            logger.info(
+                f"Loaded {len(examples)} cypher examples ({len(missing)} embedded) "
+                f"in {(time.perf_counter() - start) * 1000:.0f}ms"
+            )
+            return True
+
+    async def add_examples(self, examples: List[Dict[str, str]]):
+        """写入数据源并立即重建索引"""
+        await self.source.add(examples)
+        await self.load(force=True)
+
+    async def search(self, query: str, k: int = 5) -> List[Dict[str, str]]:
+        """返回与 query 最相似的 k 个示例"""
+        examples, index = self._state
+        if index is None:
+            try:
+                await self.load()
+            except Exception as e:
+                logger.warning(f"Failed to load cypher examples, using keyword matching: {str(e)}")
+            examples, index = self._state
+        if index is None or not examples:
+            self.fallbacks += 1
+            return self.keyword_search(query, k)
+
+        try:
+            # 同一轮对话中已经向量化过的问题直接复用
+            [vector] = await aembed_queries(self.embedder, [query])
+            vector = np.array(vector, dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"Failed to embed query, using keyword matching: {str(e)}")
+            self.fallbacks += 1
+            return self.keyword_search(query, k)
+
+        start = time.perf_counter()
+        vector /= max(float(np.linalg.norm(vector)), 1e-12)
+        _, indices = index.search(vector.reshape(1, -1), min(k, len(examples)))
+        self.last_search_ms = (time.perf_counter() - start) * 1000
+        self.searches += 1
+        return [examples[i] for i in indices[0] if i >= 0]
+
+    def keyword_search(self, query: str, k: int = 5) -> List[Dict[str, str]]:
+        """基于关键词和类别的相关性匹配"""
+        examples = self.examples
+        query_words = set(re.findall(r'\w+', query.lower()))
+
+        def compute_relevance(example):
+            score = 0
+            example_words = set(re.findall(r'\w+', example["question"].lower()))
+
+            # 计算单词重叠数
+            overlap = len(query_words.intersection(example_words))
+            if overlap > 0:
+                score += overlap * 2
+
+            # 检查是否包含一些特定的关键词
+            for pattern, category in IMPORTANT_PATTERNS:
+                if re.search(pattern, query):
+                    # 如果示例问题也包含相关模式，增加分数
+                    if re.search(pattern, example["question"]):
+                        score += 3
+                    # 检查是否属于相关类别
+                    if category in (example.get("category") or ""):
+                        score += 2
+            return score
+
+        scored_examples = [(example, compute_relevance(example)) for example in examples]
+        scored_examples.sort(key=lambda x: x[1], reverse=True)
+        return [example for example, _ in scored_examples[:k]]
+
+    def start(self):
+        """启动后台热加载任务，已在运行时不重复启动"""
+        if self._reloader is None or self._reloader.done():
+            self._reloader = asyncio.create_task(self._reload_loop())
+
+    async def stop(self):
+        if self._reloader is not None:
+            self._reloader.cancel()
+            try:
+                await self._reloader
+            except asyncio.CancelledError:
+                pass
+            self._reloader = None
+
+    async def _reload_loop(self):
+        while True:
+            try:
+                await self.load()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Cypher example reload failed: {str(e)}")
+            await asyncio.sleep(self.reload_interval)
+
+    def stats(self) -> Dict[str, Any]:
+        examples, index = self._state
+        return {
+            "examples": len(examples),
+            "indexed": index is not None,
+            "version": self._version,
+            "loads": self.loads,
+            "searches": self.searches,
+            "fallbacks": self.fallbacks,
+            "last_search_ms": round(self.last_search_ms, 3),
+        }
+
+
+# 进程内共享的示例库
+cypher_example_store = CypherExampleStore()
@@ -3,17 +3,28 @@ LangChain Embedder Base: https://github.com/langchain-ai/langchain/blob/master/l
 Neo4j GraphRAG Embedder Base: https://github.com/neo4j/neo4j-graphrag-python/blob/main/src/neo4j_graphrag/embeddings/base.py
 """
 
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
+import asyncio
+import threading
 
-from neo4j import Driver, Record
+from neo4j import Driver, Record, RoutingControl
 from neo4j_graphrag.retrievers import VectorRetriever
 from neo4j_graphrag.types import RetrieverResultItem
-from pydantic import Field
+from pydantic import Field, PrivateAttr
 
-from ....embeddings import EmbedderProtocol
+from ....embeddings import EmbedderProtocol, aembed_queries
 from ....exceptions import CypherExampleRetrieverError
 from ..base import BaseCypherExampleRetriever
 
+# 一次请求检索多个问题向量的近邻
+BATCH_VECTOR_SEARCH_QUERY = """
+UNWIND range(0, size($query_vectors) - 1) AS query_index
+CALL db.index.vector.queryNodes($vector_index_name, $top_k, $query_vectors[query_index])
+YIELD node, score
+RETURN query_index, node.question AS question, node.cypherStatement AS cypherStatement, score
+ORDER BY query_index, score DESC
+"""
+
 
 class Neo4jVectorSearchCypherExampleRetriever(BaseCypherExampleRetriever):
     neo4j_driver: Driver = Field(
@@ -27,6 +38,24 @@ class Neo4jVectorSearchCypherExampleRetriever(BaseCypherExampleRetriever):
         description="The embedder to generate an embedding from an input query."
     )
 
+    # VectorRetriever 初始化时会查询数据库版本和向量索引信息，每个实例只创建一次
+    _retriever: Optional[VectorRetriever] = PrivateAttr(default=None)
+    _retriever_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def retriever(self) -> VectorRetriever:
+        if self._retriever is None:
+            with self._retriever_lock:
+                if self._retriever is None:
+                    self._retriever = VectorRetriever(
+                        driver=self.neo4j_driver,
+                        index_name=self.vector_index_name,
+                        neo4j_database=self.neo4j_database,
+                        result_formatter=self._result_formatter,
+                        return_properties=["question", "cypherStatement"],
+                    )
+        return self._retriever
+
     def get_examples(self, query: str, k: int = 5, *args: Any, **kwargs: Any) -> str:
         """
         Perform vector similarity search between the provided query and queries that exist in the Neo4j database.
@@ -50,19 +79,62 @@ class Neo4jVectorSearchCypherExampleRetriever(BaseCypherExampleRetriever):
         else:
             return ""
 
-    def _retrieve_examples(self, query: str, k: int) -> List[Dict[str, Any]]:
+    async def aget_examples(self, query: str, k: int = 5, *args: Any, **kwargs: Any) -> str:
+        """
+        Async version of `get_examples`. The query embedding is shared with other components
+        within the same request scope, and the vector search runs in a worker thread.
+        """
+
         try:
-            embedding = self._embed_query(query)
+            [embedding] = await aembed_queries(self.embedder, [query])
+            # 在工作线程里访问 self.retriever，首次创建 VectorRetriever 时的索引查询不阻塞事件循环
+            result = await asyncio.to_thread(lambda: self.retriever.search(query_vector=embedding, top_k=k))
+            examples = [x.content for x in result.items]
+        except Exception as e:
+            raise CypherExampleRetrieverError(
+                f"Error occurred while retrieving Cypher examples: {e}"
+            )
+        return self._format_examples_list(examples)
+
+    async def aget_examples_batch(self, queries: List[str], k: int = 5) -> List[str]:
+        """
+        Retrieve examples for several queries with a single embedding call and a single Cypher vector search.
+        Returns one formatted examples string per query, in the same order as `queries`.
+        """
 
-            retriever = VectorRetriever(
-                driver=self.neo4j_driver,
-                index_name=self.vector_index_name,
-                neo4j_database=self.neo4j_database,
-                result_formatter=self._result_formatter,
-                return_properties=["question", "cypherStatement"],
+        if not queries:
+            return []
+        unique_queries = list(dict.fromkeys(queries))
+        try:
+            embeddings = await aembed_queries(self.embedder, unique_queries)
+            records, _, _ = await asyncio.to_thread(
+                self.neo4j_driver.execute_query,
+                BATCH_VECTOR_SEARCH_QUERY,
+                {
+                    "query_vectors": [list(embedding) for embedding in embeddings],
+                    "vector_index_name": self.vector_index_name,
+                    "top_k": k,
+                },
+                database_=self.neo4j_database,
+                routing_=RoutingControl.READ,
+            )
+        except Exception as e:
+            raise CypherExampleRetrieverError(
+                f"Error occurred while retrieving Cypher examples: {e}"
             )
 
-            result = retriever.search(query_vector=embedding, top_k=k)
+        examples: Dict[str, List[Dict[str, Any]]] = {query: [] for query in unique_queries}
+        for record in records:
+            examples[unique_queries[record["query_index"]]].append(
+                {"question": record["question"], "cypherStatement": record["cypherStatement"]}
+            )
+        return [self._format_examples_list(examples[query]) for query in queries]
+
+    def _retrieve_examples(self, query: str, k: int) -> List[Dict[str, Any]]:
+        try:
+            embedding = self._embed_query(query)
+
+            result = self.retriever.search(query_vector=embedding, top_k=k)
 
             return [x.content for x in result.items]
         except Exception as e:
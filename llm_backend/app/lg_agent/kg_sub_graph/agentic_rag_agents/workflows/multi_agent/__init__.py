@@ -1,6 +1,7 @@
-from .multi_tool import create_multi_tool_workflow
+from .multi_tool import create_multi_tool_workflow, get_multi_tool_workflow
 
 
 __all__ = [
     "create_multi_tool_workflow",
+    "get_multi_tool_workflow",
 ]
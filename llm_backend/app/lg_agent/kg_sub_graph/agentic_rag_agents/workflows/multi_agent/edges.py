@@ -4,9 +4,14 @@ from typing import List, Literal
 
 from langgraph.types import Send
 
+from app.core.logger import get_logger
+from app.lg_agent.kg_sub_graph.kg_cypher_cache import normalize_task
+
 from ...components.state import OverallState, ToolSelectionOutputState
 from ...components.text2cypher.state import CypherOutputState
 
+logger = get_logger(service="multi_agent_edges")
+
 
 def guardrails_conditional_edge(
     state: OverallState,
@@ -59,7 +64,18 @@ def query_mapper_edge(state: OverallState) -> List[Send]:
 
 
 def map_reduce_planner_to_tool_selection(state: OverallState) -> List[Send]:
-    """Map each identified task in the planner stage to a tool_selection node."""
+    """
+    Map each identified task in the planner stage to a tool_selection node.
+    Identical tasks (after normalization) are only sent once; the concurrency of the branches
+    is bounded by the branch scheduler wrapped around the tool nodes.
+    """
+    tasks = state.get("tasks", list())
+    unique_tasks = {}
+    for task in tasks:
+        unique_tasks.setdefault(normalize_task(task.question), task)
+    if len(unique_tasks) < len(tasks):
+        logger.info(f"Deduplicated planner tasks: {len(tasks)} -> {len(unique_tasks)}")
+
     return [
         Send(
             "tool_selection",
@@ -68,7 +84,7 @@ def map_reduce_planner_to_tool_selection(state: OverallState) -> List[Send]:
                 "parent_task": task.parent_task,
             },
         )
-        for task in state.get("tasks", list())
+        for task in unique_tasks.values()
     ]
 
 
@@ -1,4 +1,6 @@
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+import threading
+import time
 
 from langchain_core.language_models import BaseChatModel
 from langchain_neo4j import Neo4jGraph
@@ -42,6 +44,16 @@ from .edges import (
     guardrails_conditional_edge,
     map_reduce_planner_to_tool_selection,
 )
+from .scheduler import branch_scheduler
+from app.lg_agent.kg_sub_graph.kg_schema import get_graph_schema
+from app.core.logger import get_logger
+
+logger = get_logger(service="multi_tool_workflow")
+
+# 编译好的工作流缓存，最多保留的份数（模型客户端在事件循环变化时会重建，旧的条目随之失效）
+MAX_COMPILED_WORKFLOWS = 8
+_compiled_workflows: Dict[Tuple, Tuple] = {}
+_compile_lock = threading.Lock()
 
 from dataclasses import dataclass, field
 # 强制要求数据类中的所有字段必须以关键字参数的形式提供。即不能以位置参数的方式传递。
@@ -108,10 +120,10 @@ def create_multi_tool_workflow(
     )
 
     # 2. 如果通过guardrails，则会针对用户的问题进行任务分解
-    planner = create_planner_node(llm=llm)
+    planner = create_planner_node(llm=llm, cypher_example_retriever=cypher_example_retriever)
 
     # 3. 创建cypher_query节点，用来根据用户的问题生成Cypher查询语句
-    cypher_query = create_cypher_query_node()
+    cypher_query = create_cypher_query_node(cypher_example_retriever=cypher_example_retriever)
 
     predefined_cypher = create_predefined_cypher_node(
         graph=graph, predefined_cypher_dict=predefined_cypher_dict
@@ -134,11 +146,12 @@ def create_multi_tool_workflow(
 
     main_graph_builder.add_node(guardrails)
     main_graph_builder.add_node(planner)
-    main_graph_builder.add_node("cypher_query", cypher_query)
-    main_graph_builder.add_node(predefined_cypher)
-    main_graph_builder.add_node("customer_tools", customer_tools)
+    # 子任务分支的节点受全局和用户级并发上限约束，排队时预定义查询优先
+    main_graph_builder.add_node("cypher_query", branch_scheduler.limit("cypher_query", cypher_query))
+    main_graph_builder.add_node("predefined_cypher", branch_scheduler.limit("predefined_cypher", predefined_cypher))
+    main_graph_builder.add_node("customer_tools", branch_scheduler.limit("customer_tools", customer_tools))
     main_graph_builder.add_node(summarize)
-    main_graph_builder.add_node(tool_selection)
+    main_graph_builder.add_node("tool_selection", branch_scheduler.limit("tool_selection", tool_selection))
     main_graph_builder.add_node(final_answer)
 
 
@@ -163,3 +176,68 @@ def create_multi_tool_workflow(
 
     return main_graph_builder.compile()
 
+
+def get_multi_tool_workflow(
+    llm: BaseChatModel,
+    graph: Neo4jGraph,
+    tool_schemas: List[type[BaseModel]],
+    predefined_cypher_dict: Dict[str, str],
+    cypher_example_retriever: BaseCypherExampleRetriever,
+    scope_description: Optional[str] = None,
+    llm_cypher_validation: bool = True,
+    max_attempts: int = 3,
+    attempt_cypher_execution_on_final_attempt: bool = False,
+    default_to_text2cypher: bool = True,
+) -> CompiledStateGraph:
+    """
+    返回缓存的多工具工作流，参数与 create_multi_tool_workflow 相同。
+
+    同一组 (模型, 图, 配置) 只编译一次；guardrails 的提示词中包含图 Schema，
+    所以 Schema 版本变化时重新编译。编译好的 StateGraph 不保存调用状态，可以被并发的请求共享。
+    """
+    schema_version = get_graph_schema(graph).version if graph is not None else 0
+    key = (
+        id(llm),
+        id(graph),
+        tuple(tool_schemas),
+        id(predefined_cypher_dict),
+        id(cypher_example_retriever),
+        scope_description,
+        llm_cypher_validation,
+        max_attempts,
+        attempt_cypher_execution_on_final_attempt,
+        default_to_text2cypher,
+    )
+
+    with _compile_lock:
+        entry = _compiled_workflows.get(key)
+        if entry is not None and entry[0] == schema_version:
+            return entry[2]
+
+        start = time.perf_counter()
+        workflow = create_multi_tool_workflow(
+            llm=llm,
+            graph=graph,
+            tool_schemas=tool_schemas,
+            predefined_cypher_dict=predefined_cypher_dict,
+            cypher_example_retriever=cypher_example_retriever,
+            scope_description=scope_description,
+            llm_cypher_validation=llm_cypher_validation,
+            max_attempts=max_attempts,
+            attempt_cypher_execution_on_final_attempt=attempt_cypher_execution_on_final_attempt,
+            default_to_text2cypher=default_to_text2cypher,
+        )
+        # 同时保存键中各对象的引用，避免对象被回收后 id 被复用
+        _compiled_workflows.pop(key, None)
+        _compiled_workflows[key] = (
+            schema_version,
+            (llm, graph, predefined_cypher_dict, cypher_example_retriever),
+            workflow,
+        )
+        while len(_compiled_workflows) > MAX_COMPILED_WORKFLOWS:
+            _compiled_workflows.pop(next(iter(_compiled_workflows)))
+        logger.info(
+            f"Compiled multi tool workflow (schema version {schema_version}) "
+            f"in {(time.perf_counter() - start) * 1000:.0f}ms"
+        )
+        return workflow
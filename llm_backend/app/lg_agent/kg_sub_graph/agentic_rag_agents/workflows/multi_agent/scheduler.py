@@ -0,0 +1,169 @@
+"""
+规划阶段拆出的子任务分支的并发调度。
+
+planner 之后每个子任务都是一个 tool_selection 分支，随后进入 predefined_cypher / cypher_query / customer_tools。
+LangGraph 会同时启动同一步里的所有分支，这里给这些节点加上进程级和用户级的并发上限，
+排队时按优先级放行：预定义查询（开销小）先于工具选择，工具选择先于 Text2Cypher 和 GraphRAG 查询。
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+import asyncio
+import functools
+import heapq
+import itertools
+import time
+
+from app.core.config import settings
+from app.core.logger import get_logger
+
+logger = get_logger(service="branch_scheduler")
+
+# 数值越小越先获得执行槽位
+BRANCH_PRIORITIES: Dict[str, int] = {
+    "predefined_cypher": 0,
+    "tool_selection": 1,
+    "cypher_query": 2,
+    "customer_tools": 2,
+}
+
+_branch_owner: ContextVar[Optional[Hashable]] = ContextVar("branch_owner", default=None)
+
+
+@contextmanager
+def branch_owner(owner: Optional[Hashable]) -> Iterator[None]:
+    """标记当前请求所属的用户，范围内运行的分支计入该用户的并发上限"""
+    token = _branch_owner.set(owner)
+    try:
+        yield
+    finally:
+        _branch_owner.reset(token)
+
+
+class PriorityLimiter:
+    """带优先级的信号量：槽位释放时交给优先级最高（数值最小）、其次最早排队的等待者"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.in_use = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    @property
+    def idle(self) -> bool:
+        return self.in_use == 0 and not self.waiting
+
+    async def acquire(self, priority: int):
+        if self.in_use < self.capacity and not self.waiting:
+            self.in_use += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 已经分配到槽位后才被取消时把槽位交给下一个等待者
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # 槽位直接转交，in_use 不变
+                future.set_result(None)
+                return
+        self.in_use -= 1
+
+
+class BranchScheduler:
+    """子任务分支的并发调度器
+
+    - 全局最多 AGENT_BRANCH_MAX_CONCURRENCY 个分支节点同时运行
+    - 同一用户最多 AGENT_BRANCH_MAX_PER_USER 个，防止单个问题拆出的大量子任务占满全局槽位
+    - 先获取用户槽位再获取全局槽位，两者都按 BRANCH_PRIORITIES 排队
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None, max_per_user: Optional[int] = None):
+        self.max_concurrency = max_concurrency or settings.AGENT_BRANCH_MAX_CONCURRENCY
+        self.max_per_user = max_per_user or settings.AGENT_BRANCH_MAX_PER_USER
+        self._global: Optional[PriorityLimiter] = None
+        self._users: Dict[Hashable, PriorityLimiter] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.started = 0
+        self.queued = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _check_loop(self):
+        # asyncio.Future 绑定在事件循环上，事件循环变化时重建
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._global = PriorityLimiter(self.max_concurrency)
+            self._users = {}
+            self._loop = loop
+
+    async def run(self, name: str, func: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any) -> Any:
+        self._check_loop()
+        priority = BRANCH_PRIORITIES.get(name, max(BRANCH_PRIORITIES.values()))
+        owner = _branch_owner.get()
+        user_limiter = None
+        if owner is not None:
+            user_limiter = self._users.get(owner)
+            if user_limiter is None:
+                user_limiter = self._users[owner] = PriorityLimiter(self.max_per_user)
+        global_limiter = self._global
+
+        start = time.perf_counter()
+        if (user_limiter is not None and user_limiter.in_use >= user_limiter.capacity) or global_limiter.in_use >= global_limiter.capacity:
+            self.queued += 1
+        if user_limiter is not None:
+            await user_limiter.acquire(priority)
+        try:
+            await global_limiter.acquire(priority)
+            try:
+                wait = time.perf_counter() - start
+                self.started += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+                if wait >= 1.0:
+                    logger.info(f"Branch {name} waited {wait * 1000:.0f}ms for a slot (user={owner})")
+                return await func(*args, **kwargs)
+            finally:
+                global_limiter.release()
+        finally:
+            if user_limiter is not None:
+                user_limiter.release()
+                if user_limiter.idle:
+                    self._users.pop(owner, None)
+
+    def limit(self, name: str, func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        """包装 LangGraph 节点函数，保留函数名和类型注解（节点名和 Command 路由依赖它们）"""
+
+        @functools.wraps(func)
+        async def limited(*args: Any, **kwargs: Any) -> Any:
+            return await self.run(name, func, *args, **kwargs)
+
+        return limited
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_per_user": self.max_per_user,
+            "running": self._global.in_use if self._global else 0,
+            "waiting": self._global.waiting if self._global else 0,
+            "active_users": len(self._users),
+            "started": self.started,
+            "queued": self.queued,
+            "avg_wait_ms": round(self.total_wait / self.started * 1000, 2) if self.started else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+        }
+
+
+branch_scheduler = BranchScheduler()
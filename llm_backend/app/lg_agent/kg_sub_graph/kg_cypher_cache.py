@@ -0,0 +1,200 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import json
+import re
+import time
+
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.lg_agent.kg_sub_graph.kg_neo4j_conn import aquery, get_neo4j_graph
+from app.lg_agent.kg_sub_graph.kg_schema import graph_schema_service
+
+logger = get_logger(service="kg_cypher_cache")
+
+# 节点数和关系数都由计数存储直接返回，不扫描数据，用来低成本地判断图数据是否变化；
+# 只能发现数量变化，属性修改（SET）或先删后建的数据要由写入方调用 invalidate()，否则等结果过期
+DATA_VERSION_QUERY = """
+MATCH (n) WITH count(n) AS nodes
+MATCH ()-[r]->() RETURN nodes, count(r) AS relationships
+"""
+
+_TRAILING_PUNCTUATION = "？?。.!！；;，, "
+
+
+def normalize_task(task: str) -> str:
+    """问题归一化：去掉首尾空白和结尾标点，合并连续空白，英文转小写"""
+    return re.sub(r"\s+", " ", task or "").strip().rstrip(_TRAILING_PUNCTUATION).lower()
+
+
+class CypherCache:
+    """Cypher 语句与查询结果缓存
+
+    - 语句缓存：归一化的任务文本 -> 通过校验的 Cypher，命中时跳过生成和校验；
+      条目记录生成时的 Schema 版本，Schema 变化后自动失效
+    - 结果缓存：(语句, 参数, 图版本) -> 查询结果，保留 CYPHER_RESULT_CACHE_TTL 秒；
+      相同查询并发执行时只访问一次数据库
+    - 图版本由 Schema 版本和节点/关系总数组成，每隔 CYPHER_CACHE_VERSION_CHECK_INTERVAL 秒检查一次，
+      变化时清空结果缓存
+    - 节点/关系总数只反映数量变化：属性修改（SET）、数量不变的先删后建不会被发现，
+      这类修改在 CYPHER_RESULT_CACHE_TTL 秒后结果过期才可见。应用内的写入路径（索引任务完成、
+      /api/neo4j/cypher-cache/invalidate 接口）会调用 invalidate() 立即清空
+    """
+
+    def __init__(
+        self,
+        statement_size: Optional[int] = None,
+        statement_ttl: Optional[float] = None,
+        result_size: Optional[int] = None,
+        result_ttl: Optional[float] = None,
+        check_interval: Optional[float] = None
+    ):
+        self.statement_size = statement_size or settings.CYPHER_STATEMENT_CACHE_SIZE
+        self.statement_ttl = statement_ttl if statement_ttl is not None else settings.CYPHER_STATEMENT_CACHE_TTL
+        self.result_size = result_size or settings.CYPHER_RESULT_CACHE_SIZE
+        self.result_ttl = result_ttl if result_ttl is not None else settings.CYPHER_RESULT_CACHE_TTL
+        self.check_interval = check_interval if check_interval is not None else settings.CYPHER_CACHE_VERSION_CHECK_INTERVAL
+
+        self._statements: "OrderedDict[str, Tuple[str, int, float]]" = OrderedDict()
+        self._results: "OrderedDict[Tuple[str, str, str], Tuple[List[Dict[str, Any]], float]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str, str], asyncio.Future] = {}
+        self._data_fingerprint: Optional[Tuple[int, int]] = None
+        self._data_version = 0
+        self._checked_at = 0.0
+        self._check_lock: Optional[asyncio.Lock] = None
+
+        self.statement_hits = 0
+        self.statement_misses = 0
+        self.result_hits = 0
+        self.result_misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _schema_version() -> int:
+        # 只读取已缓存快照的版本，查缓存时不访问数据库；快照由生成和校验节点按指纹刷新
+        try:
+            return graph_schema_service.current_version(get_neo4j_graph())
+        except Exception:
+            return 0
+
+    # ---------- 语句缓存 ----------
+
+    def get_statement(self, task: str) -> Optional[str]:
+        """返回该任务之前通过校验的 Cypher，没有或已失效时返回 None"""
+        key = normalize_task(task)
+        entry = self._statements.get(key)
+        if entry is not None:
+            statement, schema_version, stored_at = entry
+            if schema_version == self._schema_version() and time.monotonic() - stored_at < self.statement_ttl:
+                self._statements.move_to_end(key)
+                self.statement_hits += 1
+                return statement
+            self._statements.pop(key, None)
+        self.statement_misses += 1
+        return None
+
+    def put_statement(self, task: str, statement: str):
+        """保存通过校验的 Cypher，只应在校验没有错误时调用"""
+        key = normalize_task(task)
+        if not key or not statement:
+            return
+        self._statements[key] = (statement, self._schema_version(), time.monotonic())
+        self._statements.move_to_end(key)
+        while len(self._statements) > self.statement_size:
+            self._statements.popitem(last=False)
+
+    # ---------- 结果缓存 ----------
+
+    async def graph_version(self) -> str:
+        """当前图版本，按检查间隔刷新，检查失败时沿用旧版本"""
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            if self._check_lock is None:
+                self._check_lock = asyncio.Lock()
+            async with self._check_lock:
+                if time.monotonic() - self._checked_at >= self.check_interval:
+                    try:
+                        rows = await aquery(DATA_VERSION_QUERY)
+                        row = rows[0] if rows else {}
+                        fingerprint = (row.get("nodes", 0), row.get("relationships", 0))
+                        if self._data_fingerprint is not None and fingerprint != self._data_fingerprint:
+                            logger.info(f"Graph data changed {self._data_fingerprint} -> {fingerprint}, clearing result cache")
+                            self._bump_data_version()
+                        self._data_fingerprint = fingerprint
+                    except Exception as e:
+                        logger.warning(f"Graph data version check failed: {str(e)}")
+                    self._checked_at = time.monotonic()
+        return f"{self._schema_version()}:{self._data_version}"
+
+    def _bump_data_version(self):
+        self._data_version += 1
+        self._results.clear()
+        self.invalidations += 1
+
+    async def query(self, statement: str, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """执行只读 Cypher 查询，结果在有效期内复用"""
+        if self.result_ttl <= 0:
+            return await aquery(statement, params)
+
+        key = (statement, json.dumps(params or {}, sort_keys=True, ensure_ascii=False, default=str), await self.graph_version())
+        entry = self._results.get(key)
+        if entry is not None:
+            records, expires_at = entry
+            if time.monotonic() < expires_at:
+                self._results.move_to_end(key)
+                self.result_hits += 1
+                return [dict(record) for record in records]
+            self._results.pop(key, None)
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.result_hits += 1
+            return [dict(record) for record in await asyncio.shield(future)]
+
+        self.result_misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            records = await aquery(statement, params)
+        except BaseException as e:
+            future.set_exception(e)
+            # 等待同一查询的请求会收到同样的异常，这里标记异常已处理
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        future.set_result(records)
+        # 图版本在查询期间变化时不写入旧结果
+        if key[2] == f"{self._schema_version()}:{self._data_version}":
+            self._results[key] = (records, time.monotonic() + self.result_ttl)
+            while len(self._results) > self.result_size:
+                self._results.popitem(last=False)
+        return [dict(record) for record in records]
+
+    def invalidate(self, statements: bool = True):
+        """清空结果缓存（默认连同语句缓存），在导入数据或修改图结构之后调用"""
+        self._bump_data_version()
+        self._checked_at = 0.0
+        if statements:
+            self._statements.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        def ratio(hits: int, misses: int) -> float:
+            return round(hits / (hits + misses), 3) if hits + misses else 0.0
+
+        return {
+            "statements": len(self._statements),
+            "statement_hits": self.statement_hits,
+            "statement_misses": self.statement_misses,
+            "statement_hit_ratio": ratio(self.statement_hits, self.statement_misses),
+            "results": len(self._results),
+            "result_hits": self.result_hits,
+            "result_misses": self.result_misses,
+            "result_hit_ratio": ratio(self.result_hits, self.result_misses),
+            "data_version": self._data_version,
+            "data_fingerprint": self._data_fingerprint,
+            "invalidations": self.invalidations,
+        }
+
+
+cypher_cache = CypherCache()
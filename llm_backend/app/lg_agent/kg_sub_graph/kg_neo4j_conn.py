@@ -1,7 +1,12 @@
+from typing import Any, Dict, List, Optional, Set
 from langchain_neo4j import Neo4jGraph
+from neo4j import AsyncGraphDatabase, AsyncDriver, Query, RoutingControl
 from app.core.config import settings
 from app.core.logger import get_logger
+import asyncio
 import logging
+import threading
+import time
 
 # 获取日志记录器
 logger = get_logger(service="kg_builder")
@@ -14,23 +19,208 @@ logging.getLogger("langchain_neo4j").setLevel(logging.ERROR)
 logging.getLogger("neo4j.io").setLevel(logging.ERROR)
 logging.getLogger("neo4j.bolt").setLevel(logging.ERROR)
 
+# 进程内共享的 Neo4jGraph 实例，Schema 由 kg_schema.graph_schema_service 读取和缓存
+_neo4j_graph: Optional[Neo4jGraph] = None
+_graph_lock = threading.Lock()
+
+
+def _driver_config() -> Dict[str, Any]:
+    return {
+        "max_connection_pool_size": settings.NEO4J_MAX_CONNECTION_POOL_SIZE,
+        "connection_acquisition_timeout": settings.NEO4J_CONNECTION_ACQUISITION_TIMEOUT,
+        "max_connection_lifetime": settings.NEO4J_MAX_CONNECTION_LIFETIME,
+    }
+
+
 def get_neo4j_graph() -> Neo4jGraph:
     """
-    创建并返回一个Neo4jGraph实例，使用配置文件中的设置。
+    返回进程内共享的Neo4jGraph实例，使用配置文件中的设置。
+
+    第一次调用时创建驱动，之后的调用直接复用，不再每次请求都新建驱动。
+    创建时不扫描 Schema，Schema 统一由 graph_schema_service 按指纹和 TTL 缓存。
     
     Returns:
         Neo4jGraph: 配置好的Neo4j图数据库连接实例
     """
-    logger.info(f"initialize Neo4j connection: {settings.NEO4J_URL}")
-    
-    try:
-        # 创建Neo4j图实例
-        neo4j_graph = Neo4jGraph(
-            url=settings.NEO4J_URL,
-            username=settings.NEO4J_USERNAME,
-            password=settings.NEO4J_PASSWORD,
-            database=settings.NEO4J_DATABASE
-        )
-        return neo4j_graph
-    except Exception as e:
-        raise
\ No newline at end of file
+    global _neo4j_graph
+    if _neo4j_graph is not None:
+        return _neo4j_graph
+
+    with _graph_lock:
+        if _neo4j_graph is None:
+            logger.info(f"initialize Neo4j connection: {settings.NEO4J_URL}")
+            _neo4j_graph = Neo4jGraph(
+                url=settings.NEO4J_URL,
+                username=settings.NEO4J_USERNAME,
+                password=settings.NEO4J_PASSWORD,
+                database=settings.NEO4J_DATABASE,
+                timeout=settings.NEO4J_QUERY_TIMEOUT,
+                refresh_schema=False,
+                driver_config=_driver_config()
+            )
+    return _neo4j_graph
+
+
+class AsyncNeo4jPool:
+    """进程内共享的异步 Neo4j 驱动
+
+    - 连接池大小、获取连接超时、连接存活时间来自 settings
+    - 查询在等待连接前先获取同样大小的信号量，等待时间即连接池的排队时间，可以直接统计
+    - 每条查询都有超时，超时后取消并抛出 asyncio.TimeoutError
+    - 连接池指标（使用中的连接、排队时间）定期写入日志
+    """
+
+    def __init__(self):
+        self._driver: Optional[AsyncDriver] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._closing: Set[asyncio.Task] = set()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.waiting = 0
+        self.queries = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._last_log = time.monotonic()
+
+    def _get_driver(self) -> AsyncDriver:
+        # 异步驱动绑定在创建它的事件循环上
+        loop = asyncio.get_running_loop()
+        if self._driver is None or loop is not self._loop:
+            if self._driver is not None:
+                self._close_stale_driver(self._driver, self._loop)
+            self._driver = AsyncGraphDatabase.driver(
+                settings.NEO4J_URL,
+                auth=(settings.NEO4J_USERNAME, settings.NEO4J_PASSWORD),
+                **_driver_config()
+            )
+            self._semaphore = asyncio.Semaphore(settings.NEO4J_MAX_CONNECTION_POOL_SIZE)
+            self._loop = loop
+            logger.info(f"Created async Neo4j driver: {settings.NEO4J_URL} (pool size {settings.NEO4J_MAX_CONNECTION_POOL_SIZE})")
+        return self._driver
+
+    def _close_stale_driver(self, driver: AsyncDriver, loop: Optional[asyncio.AbstractEventLoop]):
+        """关闭事件循环切换前创建的驱动，释放它的连接池"""
+        if loop is not None and loop.is_running():
+            # 旧事件循环仍在其他线程中运行，在它上面关闭
+            asyncio.run_coroutine_threadsafe(driver.close(), loop)
+            return
+        task = asyncio.get_running_loop().create_task(self._close_quietly(driver))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    async def _close_quietly(driver: AsyncDriver):
+        try:
+            await driver.close()
+        except Exception as e:
+            # 旧事件循环已关闭时连接无法正常断开，底层 socket 随驱动一起回收
+            logger.debug(f"Error closing stale Neo4j driver: {str(e)}")
+
+    async def query(
+        self,
+        query: str,
+        params: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        routing: RoutingControl = RoutingControl.READ
+    ) -> List[Dict[str, Any]]:
+        """执行 Cypher 查询，返回与 Neo4jGraph.query 相同格式的结果
+
+        默认以只读事务执行：查询语句大多由大模型生成，即使校验遗漏了写子句，数据库也会拒绝写入。
+        """
+        driver = self._get_driver()
+        timeout = timeout or settings.NEO4J_QUERY_TIMEOUT
+
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        wait = time.perf_counter() - start
+        self._record_acquire(wait)
+
+        try:
+            # 服务端事务超时之外再加一层客户端超时，网络异常时也不会一直挂起
+            records, _, _ = await asyncio.wait_for(
+                driver.execute_query(
+                    Query(query, timeout=timeout),
+                    parameters_=params or {},
+                    database_=settings.NEO4J_DATABASE,
+                    routing_=routing
+                ),
+                timeout=timeout + 1
+            )
+            return [record.data() for record in records]
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning(f"Neo4j query timed out after {timeout}s: {query[:200]}")
+            raise
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.in_use -= 1
+            self._semaphore.release()
+            self._maybe_log()
+
+    def _record_acquire(self, wait: float):
+        self.queries += 1
+        self.in_use += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        if wait * 1000 >= settings.NEO4J_POOL_WAIT_WARN_MS:
+            logger.warning(f"Waited {wait * 1000:.1f}ms for a Neo4j connection ({self.in_use} in use, {self.waiting} waiting)")
+
+    def _maybe_log(self):
+        if time.monotonic() - self._last_log >= settings.NEO4J_POOL_STATS_INTERVAL:
+            logger.info(f"Neo4j pool stats: {self.stats()}")
+            self._last_log = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pool_size": settings.NEO4J_MAX_CONNECTION_POOL_SIZE,
+            "in_use": self.in_use,
+            "peak_in_use": self.peak_in_use,
+            "waiting": self.waiting,
+            "queries": self.queries,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": self.total_wait / self.queries * 1000 if self.queries else 0.0,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+    async def close(self):
+        if self._driver is not None:
+            await self._driver.close()
+            self._driver = None
+            self._loop = None
+
+
+neo4j_pool = AsyncNeo4jPool()
+
+
+async def aquery(
+    query: str,
+    params: Optional[Dict[str, Any]] = None,
+    timeout: Optional[float] = None,
+    routing: RoutingControl = RoutingControl.READ
+) -> List[Dict[str, Any]]:
+    """通过共享的异步驱动执行 Cypher 查询，默认只读"""
+    return await neo4j_pool.query(query, params, timeout, routing)
+
+
+async def close_neo4j():
+    """关闭异步驱动和共享的 Neo4jGraph，在应用关闭时调用"""
+    global _neo4j_graph
+    await neo4j_pool.close()
+    with _graph_lock:
+        if _neo4j_graph is not None:
+            _neo4j_graph.close()
+            _neo4j_graph = None
@@ -0,0 +1,278 @@
+from typing import Any, Dict, List, Optional
+import asyncio
+import hashlib
+import itertools
+import json
+import threading
+import time
+import weakref
+
+import regex as re
+from langchain_neo4j import Neo4jGraph
+from langchain_neo4j.chains.graph_qa.cypher_utils import CypherQueryCorrector, Schema
+
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.lg_agent.kg_sub_graph.kg_neo4j_conn import aquery
+from app.lg_agent.kg_sub_graph.agentic_rag_agents.components.utils.regex_patterns import get_cypher_query_node_graph_schema
+
+logger = get_logger(service="kg_schema")
+
+# 只读取标签、关系类型和属性名，不扫描数据，用来判断 Schema 是否变化
+FINGERPRINT_QUERY = """
+CALL db.labels() YIELD label
+WITH collect(label) AS labels
+CALL db.relationshipTypes() YIELD relationshipType
+WITH labels, collect(relationshipType) AS types
+CALL db.propertyKeys() YIELD propertyKey
+RETURN labels, types, collect(propertyKey) AS keys
+"""
+
+
+def _strip_cypher_query_nodes(schema: str) -> str:
+    # 过滤掉对用户查询不相关的内部结构信息
+    if "CypherQuery" in schema:
+        schema = re.sub(get_cypher_query_node_graph_schema(), r"\2", schema, flags=re.MULTILINE)
+    return schema
+
+
+class GraphSchemaSnapshot:
+    """某一版本的图 Schema 及由它派生的所有结构
+
+    - schema: Neo4jGraph.schema 原文，用于 Cypher 生成和修正的提示词
+    - prompt_schema: 去掉 CypherQuery 节点、花括号替换为方括号，可直接拼进提示词模版
+    - escaped_schema: 去掉 CypherQuery 节点、花括号转义为 {{ }}
+    - structured_schema / validation_schema: 原始结构化 Schema 和对应的 Neo4jStructuredSchema，
+      后者的枚举/范围表在首次使用后缓存
+    - corrector: 按关系定义构建好的 CypherQueryCorrector
+    """
+
+    def __init__(self, schema: str, structured_schema: Dict[str, Any], fingerprint: str, version: int):
+        self.schema = schema
+        self.structured_schema = structured_schema
+        self.fingerprint = fingerprint
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.checked_at = self.loaded_at
+
+        filtered = _strip_cypher_query_nodes(schema)
+        self.prompt_schema = filtered.replace("{", "[").replace("}", "]")
+        self.escaped_schema = filtered.replace("{", "{{").replace("}", "}}")
+        self.corrector = CypherQueryCorrector([
+            Schema(el["start"], el["type"], el["end"])
+            for el in structured_schema.get("relationships", list())
+        ])
+        self._validation_schema = None
+
+    @property
+    def validation_schema(self):
+        """结构化 Schema 的 Pydantic 模型
+
+        只有 enhanced_schema 的结构化 Schema 才带有属性取值，普通 Schema 校验会失败，
+        因此延迟到第一次使用时构建，失败时和原来一样抛出异常。
+        """
+        if self._validation_schema is None:
+            from app.lg_agent.kg_sub_graph.agentic_rag_agents.components.text2cypher.validation.models import Neo4jStructuredSchema
+
+            validation_schema = Neo4jStructuredSchema.model_validate(self.structured_schema)
+            # 提前计算枚举/范围表，之后每次校验直接复用
+            validation_schema.get_node_properties_enum()
+            validation_schema.get_relationship_properties_enum()
+            validation_schema.get_node_property_values_enum()
+            validation_schema.get_relationship_property_values_enum()
+            validation_schema.get_node_property_values_range()
+            validation_schema.get_relationship_property_values_range()
+            self._validation_schema = validation_schema
+        return self._validation_schema
+
+    def correct_relationship_direction(self, cypher_statement: str) -> str:
+        return self.corrector(cypher_statement)
+
+
+class GraphSchemaService:
+    """进程内缓存的图 Schema 服务
+
+    - 每个 Neo4jGraph 只做一次 APOC Schema 扫描，提示词字符串、结构化 Schema、
+      CypherQueryCorrector 和枚举/范围表都从同一个快照中取
+    - 每隔 NEO4J_SCHEMA_CHECK_INTERVAL 秒用 db.labels / db.relationshipTypes / db.propertyKeys
+      计算一次指纹，只有指纹变化或快照超过 NEO4J_SCHEMA_TTL 秒时才重新扫描
+    - 指纹检查失败时继续使用旧快照
+    - 异步代码使用 aget：指纹查询走异步驱动，APOC 扫描放到线程中执行，不阻塞事件循环
+    - 版本号在整个服务内单调递增，invalidate 之后重新扫描得到的也是新版本号，
+      按版本号缓存的工作流和查询结果不会把新旧 Schema 当成同一个
+    """
+
+    def __init__(self, ttl: Optional[float] = None, check_interval: Optional[float] = None):
+        self.ttl = ttl if ttl is not None else settings.NEO4J_SCHEMA_TTL
+        self.check_interval = check_interval if check_interval is not None else settings.NEO4J_SCHEMA_CHECK_INTERVAL
+        self._snapshots: "weakref.WeakKeyDictionary[Neo4jGraph, GraphSchemaSnapshot]" = weakref.WeakKeyDictionary()
+        self._versions = itertools.count(1)
+        self._lock = threading.Lock()
+        self._async_lock: Optional[asyncio.Lock] = None
+        self._lock_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.hits = 0
+        self.checks = 0
+        self.refreshes = 0
+
+    @staticmethod
+    def fingerprint(graph: Neo4jGraph) -> str:
+        return GraphSchemaService._fingerprint_rows(graph.query(FINGERPRINT_QUERY))
+
+    @staticmethod
+    def _fingerprint_rows(rows: List[Dict[str, Any]]) -> str:
+        row = rows[0] if rows else {}
+        payload = json.dumps(
+            {key: sorted(row.get(key) or []) for key in ("labels", "types", "keys")},
+            separators=(",", ":")
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _is_fresh(self, snapshot: Optional[GraphSchemaSnapshot], now: float) -> bool:
+        return (
+            snapshot is not None
+            and now - snapshot.checked_at < self.check_interval
+            and now - snapshot.loaded_at < self.ttl
+        )
+
+    def get(self, graph: Neo4jGraph) -> GraphSchemaSnapshot:
+        """返回当前有效的 Schema 快照，必要时检查指纹或重新扫描"""
+        snapshot = self._snapshots.get(graph)
+        if self._is_fresh(snapshot, time.monotonic()):
+            self.hits += 1
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshots.get(graph)
+            now = time.monotonic()
+            if snapshot is None:
+                return self._refresh(graph, None, "initial load")
+            if now - snapshot.loaded_at >= self.ttl:
+                return self._refresh(graph, snapshot, "ttl expired")
+            if now - snapshot.checked_at >= self.check_interval:
+                self.checks += 1
+                try:
+                    fingerprint = self.fingerprint(graph)
+                except Exception as e:
+                    logger.warning(f"Schema fingerprint check failed, keeping version {snapshot.version}: {str(e)}")
+                    fingerprint = snapshot.fingerprint
+                snapshot.checked_at = now
+                if fingerprint != snapshot.fingerprint:
+                    return self._refresh(graph, snapshot, "fingerprint changed", fingerprint)
+            self.hits += 1
+            return snapshot
+
+    def _get_async_lock(self) -> asyncio.Lock:
+        # asyncio.Lock 绑定在事件循环上，事件循环变化时重建
+        loop = asyncio.get_running_loop()
+        if self._async_lock is None or loop is not self._lock_loop:
+            self._async_lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._async_lock
+
+    async def aget(self, graph: Neo4jGraph) -> GraphSchemaSnapshot:
+        """get 的异步版本，同一事件循环内的并发调用只做一次检查或扫描"""
+        snapshot = self._snapshots.get(graph)
+        if self._is_fresh(snapshot, time.monotonic()):
+            self.hits += 1
+            return snapshot
+
+        async with self._get_async_lock():
+            snapshot = self._snapshots.get(graph)
+            now = time.monotonic()
+            if snapshot is None:
+                return await asyncio.to_thread(self._refresh_if_current, graph, None, "initial load")
+            if now - snapshot.loaded_at >= self.ttl:
+                return await asyncio.to_thread(self._refresh_if_current, graph, snapshot, "ttl expired")
+            if now - snapshot.checked_at >= self.check_interval:
+                self.checks += 1
+                try:
+                    fingerprint = self._fingerprint_rows(await aquery(FINGERPRINT_QUERY))
+                except Exception as e:
+                    logger.warning(f"Schema fingerprint check failed, keeping version {snapshot.version}: {str(e)}")
+                    fingerprint = snapshot.fingerprint
+                snapshot.checked_at = now
+                if fingerprint != snapshot.fingerprint:
+                    return await asyncio.to_thread(
+                        self._refresh_if_current, graph, snapshot, "fingerprint changed", fingerprint
+                    )
+            self.hits += 1
+            return snapshot
+
+    def _refresh_if_current(
+        self,
+        graph: Neo4jGraph,
+        previous: Optional[GraphSchemaSnapshot],
+        reason: str,
+        fingerprint: Optional[str] = None
+    ) -> GraphSchemaSnapshot:
+        """在工作线程中扫描，与同步的 get 共用线程锁；快照已被其他调用替换时直接返回新快照"""
+        with self._lock:
+            current = self._snapshots.get(graph)
+            if current is not None and current is not previous:
+                return current
+            return self._refresh(graph, previous, reason, fingerprint)
+
+    def _refresh(
+        self,
+        graph: Neo4jGraph,
+        previous: Optional[GraphSchemaSnapshot],
+        reason: str,
+        fingerprint: Optional[str] = None
+    ) -> GraphSchemaSnapshot:
+        start = time.perf_counter()
+        if fingerprint is None:
+            fingerprint = self.fingerprint(graph)
+        graph.refresh_schema()
+        snapshot = GraphSchemaSnapshot(
+            schema=graph.schema,
+            structured_schema=graph.structured_schema,
+            fingerprint=fingerprint,
+            version=next(self._versions)
+        )
+        self._snapshots[graph] = snapshot
+        self.refreshes += 1
+        logger.info(
+            f"Loaded graph schema version {snapshot.version} ({reason}) "
+            f"in {(time.perf_counter() - start) * 1000:.0f}ms"
+        )
+        return snapshot
+
+    def current_version(self, graph: Neo4jGraph) -> int:
+        """当前快照的版本号，不检查指纹也不触发刷新，还没有快照时返回 0"""
+        snapshot = self._snapshots.get(graph)
+        return snapshot.version if snapshot is not None else 0
+
+    def invalidate(self, graph: Optional[Neo4jGraph] = None):
+        """丢弃快照，下次 get 时重新扫描，例如在导入数据、修改图结构之后调用"""
+        with self._lock:
+            if graph is None:
+                self._snapshots.clear()
+            else:
+                self._snapshots.pop(graph, None)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "hits": self.hits,
+            "checks": self.checks,
+            "refreshes": self.refreshes,
+            "snapshots": [
+                {
+                    "version": snapshot.version,
+                    "fingerprint": snapshot.fingerprint[:12],
+                    "age": round(now - snapshot.loaded_at, 1),
+                }
+                for snapshot in list(self._snapshots.values())
+            ],
+        }
+
+
+graph_schema_service = GraphSchemaService()
+
+
+def get_graph_schema(graph: Neo4jGraph) -> GraphSchemaSnapshot:
+    return graph_schema_service.get(graph)
+
+
+async def aget_graph_schema(graph: Neo4jGraph) -> GraphSchemaSnapshot:
+    return await graph_schema_service.aget(graph)
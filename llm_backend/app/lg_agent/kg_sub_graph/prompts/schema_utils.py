@@ -2,9 +2,9 @@
 工具函数，用于安全地从Neo4j数据库提取和处理数据库结构信息
 """
 
-import re
 from typing import Optional, Dict, Any
 from langchain_neo4j import Neo4jGraph
+from app.lg_agent.kg_sub_graph.kg_schema import get_graph_schema
 
 def safe_get_schema(graph: Optional[Neo4jGraph] = None) -> str:
     """
@@ -20,23 +20,10 @@ def safe_get_schema(graph: Optional[Neo4jGraph] = None) -> str:
         return ""
     
     try:
-        # 获取原始schema字符串
-        schema: str = graph.get_schema
-        
-        # 过滤不相关的内部节点信息
-        if "CypherQuery" in schema:
-            schema = re.sub(
-                r"^(- \*\*CypherQuery\*\*[\s\S]+?)(^Relationship properties|- \*)", 
-                r"\2", 
-                schema, 
-                flags=re.MULTILINE
-            )
-        
-        # 转义所有花括号，避免与模板变量冲突
+        # 过滤不相关的内部节点信息，并转义所有花括号，避免与模板变量冲突
         # 例如: {name} -> {{name}}
-        schema = schema.replace("{", "{{").replace("}", "}}")
-        
-        return schema
+        # 处理结果随 Schema 快照缓存
+        return get_graph_schema(graph).escaped_schema
     except Exception as e:
         print(f"获取Neo4j数据库结构失败: {e}")
         return ""
@@ -10,28 +10,30 @@ from app.lg_agent.lg_prompts import (
     GENERATE_QUERIES_SYSTEM_PROMPT
 )
 from langchain_core.runnables import RunnableConfig
-from langchain_deepseek import ChatDeepSeek
-from langchain_ollama import ChatOllama
 from app.core.config import settings, ServiceType
 from app.core.logger import get_logger
 from typing import cast, Literal, TypedDict, List, Dict, Any
 from langchain_core.messages import BaseMessage
-from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.language_models import BaseChatModel
+from langgraph.graph.state import CompiledStateGraph
+from app.lg_agent.lg_checkpointer import create_checkpointer
 from langgraph.graph import END, START, StateGraph
 from app.lg_agent.lg_states import AgentState, InputState, Router, GradeHallucinations
+from app.lg_agent.lg_models import model_registry
 from app.lg_agent.kg_sub_graph.agentic_rag_agents.retrievers.cypher_examples.northwind_retriever import NorthwindCypherRetriever
 from app.lg_agent.kg_sub_graph.agentic_rag_agents.components.planner.node import create_planner_node
-from app.lg_agent.kg_sub_graph.agentic_rag_agents.workflows.multi_agent.multi_tool import create_multi_tool_workflow
+from app.lg_agent.kg_sub_graph.agentic_rag_agents.workflows.multi_agent.multi_tool import get_multi_tool_workflow
 from app.lg_agent.kg_sub_graph.kg_neo4j_conn import get_neo4j_graph
+from app.lg_agent.kg_sub_graph.kg_schema import aget_graph_schema
+from app.lg_agent.kg_sub_graph.agentic_rag_agents.embeddings import request_scope
+from app.lg_agent.kg_sub_graph.agentic_rag_agents.workflows.multi_agent.scheduler import branch_owner
 from pydantic import BaseModel
 from typing import Dict, List
 from langchain_core.messages import AIMessage
 from langchain_core.runnables.base import Runnable
-from app.lg_agent.kg_sub_graph.agentic_rag_agents.components.utils.utils import retrieve_and_parse_schema_from_graph_for_prompts
 from langchain_core.prompts import ChatPromptTemplate
 import base64
 import os
-import aiohttp
 import asyncio
 import json
 import time
@@ -74,11 +76,12 @@ async def analyze_and_route_query(
         # 对于Agent服务，使用deepseek-chat而不是deepseek-reasoner，因为reasoner不支持structured output
         # 但保留推理模型的配置信息用于日志记录
         agent_model = "deepseek-chat"
-        model = ChatDeepSeek(api_key=settings.DEEPSEEK_API_KEY, model_name=agent_model, temperature=0.7, tags=["router"])
         logger.info(f"Using DeepSeek agent model: {agent_model} (reasoning model: {settings.DEEPSEEK_REASON_MODEL} available for complex tasks)")
     else:
-        model = ChatOllama(model=settings.OLLAMA_AGENT_MODEL, base_url=settings.OLLAMA_BASE_URL, temperature=0.7, tags=["router"])
+        agent_model = None
         logger.info(f"Using Ollama model: {settings.OLLAMA_AGENT_MODEL}")
+    # 从注册表获取复用的结构化输出模型
+    router_model = model_registry.get_model("router", model_name=agent_model, schema=Router)
 
     # 拼接提示模版 + 用户的实时问题（包含历史上下文对话） 
     messages = [
@@ -89,7 +92,7 @@ async def analyze_and_route_query(
     
     # 使用结构化输出，输出问题类型
     response = cast(
-        Router, await model.with_structured_output(Router).ainvoke(messages)
+        Router, await router_model.ainvoke(messages)
     )
     logger.info(f"Analyze user query type completed, result: {response}")
     return {"router": response}
@@ -141,13 +144,8 @@ async def respond_to_general_query(
     """
     logger.info("-----generate general-query response-----")
     
-    # 使用大模型生成回复
-    if settings.AGENT_SERVICE == ServiceType.DEEPSEEK:
-        # 对于Agent服务，使用deepseek-chat而不是deepseek-reasoner
-        agent_model = "deepseek-chat"
-        model = ChatDeepSeek(api_key=settings.DEEPSEEK_API_KEY, model_name=agent_model, temperature=0.7, tags=["general_query"])
-    else:
-        model = ChatOllama(model=settings.OLLAMA_AGENT_MODEL, base_url=settings.OLLAMA_BASE_URL, temperature=0.7, tags=["general_query"])
+    # 使用大模型生成回复，对于Agent服务，使用deepseek-chat而不是deepseek-reasoner
+    model = model_registry.get_model("general_query", model_name="deepseek-chat")
     
     system_prompt = GENERAL_QUERY_SYSTEM_PROMPT.format(
         logic=state.router["logic"]
@@ -174,10 +172,7 @@ async def get_additional_info(
     logger.info("------continue to get additional info------")
     
     # 使用大模型生成回复
-    if settings.AGENT_SERVICE == ServiceType.DEEPSEEK:
-        model = ChatDeepSeek(api_key=settings.DEEPSEEK_API_KEY, model_name=settings.DEEPSEEK_MODEL, temperature=0.7, tags=["additional_info"])
-    else:
-        model = ChatOllama(model=settings.OLLAMA_AGENT_MODEL, base_url=settings.OLLAMA_BASE_URL, temperature=0.7, tags=["additional_info"])
+    model = model_registry.get_model("additional_info")
 
     # 如果用户的问题是电商相关，但与自己的业务无关，则需要返回"无关问题"
 
@@ -209,7 +204,7 @@ async def get_additional_info(
 
     # 动态从 Neo4j 图表中获取图表结构
     graph_context = (
-        f"\n参考图表结构来回答:\n{retrieve_and_parse_schema_from_graph_for_prompts(neo4j_graph)}"
+        f"\n参考图表结构来回答:\n{(await aget_graph_schema(neo4j_graph)).prompt_schema}"
         if neo4j_graph is not None
         else ""
     )
@@ -231,7 +226,7 @@ async def get_additional_info(
     )
 
     # 构建格式化输出的 Chain， 如果匹配，返回 continue，否则返回 end
-    guardrails_chain = full_system_prompt | model.with_structured_output(AdditionalGuardrailsOutput)
+    guardrails_chain = full_system_prompt | model_registry.get_model("additional_info", schema=AdditionalGuardrailsOutput)
     guardrails_output = await guardrails_chain.ainvoke(
             {"question": state.messages[-1].content if state.messages else ""}
         )
@@ -341,38 +336,34 @@ async def create_image_query(
             "temperature": 0.7
         }
         
-        # 发送API请求
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{base_url}/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=60  # 增加超时时间
-            ) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    image_description = result["choices"][0]["message"]["content"]
-                    logger.info(f"Successfully processed image and generated description")
-                    # 使用图片描述和用户问题生成最终回复
-                    # 从lg_prompts导入电商客服模板
-                    
-                    # 构建回复请求
-                    if settings.AGENT_SERVICE == ServiceType.DEEPSEEK:
-                        model = ChatDeepSeek(api_key=settings.DEEPSEEK_API_KEY, model_name=settings.DEEPSEEK_MODEL, temperature=0.7, tags=["image_query"])
-                    else:
-                        model = ChatOllama(model=settings.OLLAMA_AGENT_MODEL, base_url=settings.OLLAMA_BASE_URL, temperature=0.7, tags=["image_query"])
-                    # 使用专门的图片查询提示模板
-                    system_prompt = GET_IMAGE_SYSTEM_PROMPT.format(
-                        image_description=image_description
-                    )
-                    messages = [{"role": "system", "content": system_prompt}] + state.messages
-                    response = await model.ainvoke(messages)
-                    return {"messages": [response]}    
+        # 发送API请求，复用共享的会话和连接池
+        session = model_registry.get_session("vision", timeout=settings.VISION_REQUEST_TIMEOUT)
+        async with session.post(
+            f"{base_url}/chat/completions",
+            headers=headers,
+            json=payload
+        ) as response:
+            if response.status == 200:
+                result = await response.json()
+                image_description = result["choices"][0]["message"]["content"]
+                logger.info(f"Successfully processed image and generated description")
+                # 使用图片描述和用户问题生成最终回复
+                # 从lg_prompts导入电商客服模板
+                
+                # 构建回复请求
+                model = model_registry.get_model("image_query")
+                # 使用专门的图片查询提示模板
+                system_prompt = GET_IMAGE_SYSTEM_PROMPT.format(
+                    image_description=image_description
+                )
+                messages = [{"role": "system", "content": system_prompt}] + state.messages
+                response = await model.ainvoke(messages)
+                return {"messages": [response]}    
         
-                else:
-                    error_text = await response.text()
-                    logger.error(f"Vision API Request Failed: {response.status} - {error_text}")
-                    return {"messages": [AIMessage(content=f"抱歉，我无法查看这张图片，请重新上传。")]}
+            else:
+                error_text = await response.text()
+                logger.error(f"Vision API Request Failed: {response.status} - {error_text}")
+                return {"messages": [AIMessage(content=f"抱歉，我无法查看这张图片，请重新上传。")]}
 
 
 
@@ -389,6 +380,96 @@ async def create_file_query(
     
     # TODO
 
+# 电商经营范围，用于研究计划工作流的 guardrails
+RESEARCH_SCOPE_DESCRIPTION = """
+    个人电商经营范围：智能家居产品，包括但不限于：
+    - 智能照明（灯泡、灯带、开关）
+    - 智能安防（摄像头、门锁、传感器）
+    - 智能控制（温控器、遥控器、集线器）
+    - 智能音箱（语音助手、音响）
+    - 智能厨电（电饭煲、冰箱、洗碗机）
+    - 智能清洁（扫地机器人、洗衣机）
+    
+    不包含：服装、鞋类、体育用品、化妆品、食品等非智能家居产品。
+    """
+
+# 根据 Graph Schema 创建 Cypher 示例的检索器，进程内共享
+research_cypher_retriever = NorthwindCypherRetriever()
+
+
+def get_research_workflow(model: BaseChatModel, neo4j_graph) -> CompiledStateGraph:
+    """获取研究计划使用的多工具工作流，同一模型只编译一次"""
+    # 工具模式列表和预定义的 Cypher 查询
+    from app.lg_agent.kg_sub_graph.kg_tools_list import cypher_query, predefined_cypher, microsoft_graphrag_query
+    from app.lg_agent.kg_sub_graph.agentic_rag_agents.components.predefined_cypher.cypher_dict import predefined_cypher_dict
+    tool_schemas: List[type[BaseModel]] = [cypher_query, predefined_cypher, microsoft_graphrag_query]
+
+    return get_multi_tool_workflow(
+        llm=model,
+        graph=neo4j_graph,
+        tool_schemas=tool_schemas,
+        predefined_cypher_dict=predefined_cypher_dict,
+        cypher_example_retriever=research_cypher_retriever,
+        scope_description=RESEARCH_SCOPE_DESCRIPTION,
+        llm_cypher_validation=True,
+    )
+
+
+async def warmup_research_workflow():
+    """应用启动时预先读取图 Schema 并编译研究计划工作流，首个请求不再承担编译开销"""
+    start = time.perf_counter()
+    try:
+        model = model_registry.get_model("research_plan")
+        # 连接 Neo4j 和读取 Schema 是同步调用，放到线程中执行
+        neo4j_graph = await asyncio.to_thread(get_neo4j_graph)
+        await asyncio.to_thread(get_research_workflow, model, neo4j_graph)
+        logger.info(f"Research workflow warmed up in {(time.perf_counter() - start) * 1000:.0f}ms")
+    except Exception as e:
+        logger.warning(f"Research workflow warmup failed, will compile on first request: {e}")
+
+
+# 研究计划子图中执行查询的节点，每个节点完成时向前端推送一次 tool_result 事件
+RESEARCH_TOOL_NODES = ("predefined_cypher", "cypher_query", "customer_tools")
+# tool_result 事件中最多附带的记录条数
+RESEARCH_EVENT_MAX_RECORDS = 5
+
+
+def research_progress_events(node: str, update: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """把研究计划子图的节点输出转换成前端进度事件（type 为 guardrails / plan / tool_result / summary_ready）
+
+    子图在 create_research_plan 节点内执行，外层以 subgraphs=True、stream_mode="updates" 流式执行时，
+    子图每个节点完成后的输出会带着 ("create_research_plan:<task_id>",) 命名空间传到外层，由调用方转换成事件。
+    """
+    if not isinstance(update, dict):
+        return []
+    if node == "guardrails":
+        return [{"type": "guardrails", "next_action": update.get("next_action")}]
+    if node == "planner":
+        return [{"type": "plan", "tasks": [task.question for task in update.get("tasks", [])]}]
+    if node in RESEARCH_TOOL_NODES:
+        events = []
+        for cypher in update.get("cyphers", []):
+            cypher = cypher.model_dump() if hasattr(cypher, "model_dump") else dict(cypher)
+            records = cypher.get("records") or []
+            if isinstance(records, dict):
+                records = records.get("result", [])
+            if not isinstance(records, list):
+                records = [records]
+            events.append({
+                "type": "tool_result",
+                "tool": node,
+                "task": cypher.get("task"),
+                "statement": cypher.get("statement"),
+                "errors": cypher.get("errors") or [],
+                "record_count": len(records),
+                "records": records[:RESEARCH_EVENT_MAX_RECORDS],
+            })
+        return events
+    if node == "summarize":
+        return [{"type": "summary_ready"}]
+    return []
+
+
 async def create_research_plan(
     state: AgentState, *, config: RunnableConfig
 ) -> Dict[str, List[str] | str]:
@@ -404,54 +485,20 @@ async def create_research_plan(
     logger.info("------execute local knowledge base query------")
 
     # 使用大模型生成查询/多跳、并行查询计划
-    if settings.AGENT_SERVICE == ServiceType.DEEPSEEK:
-        model = ChatDeepSeek(api_key=settings.DEEPSEEK_API_KEY, model_name=settings.DEEPSEEK_MODEL, temperature=0.7, tags=["research_plan"])
-    else:
-        model = ChatOllama(model=settings.OLLAMA_AGENT_MODEL, base_url=settings.OLLAMA_BASE_URL, temperature=0.7, tags=["research_plan"])
+    model = model_registry.get_model("research_plan")
     
-    # 初始化必要参数
     # 1. Neo4j图数据库连接 - 使用配置中的连接信息
     try:
         neo4j_graph = get_neo4j_graph()
-        logger.info("success to get Neo4j graph database connection")
     except Exception as e:
         logger.error(f"failed to get Neo4j graph database connection: {e}")
+        raise
 
-    # 2. 创建自定义检索器实例，根据 Graph Schema 创建 Cypher 示例，用来引导大模型生成正确的Cypher 查询语句
-    cypher_retriever = NorthwindCypherRetriever()
-
-    # step 3. 定义工具模式列表    
-    from app.lg_agent.kg_sub_graph.kg_tools_list import cypher_query, predefined_cypher, microsoft_graphrag_query
-    tool_schemas: List[type[BaseModel]] = [cypher_query, predefined_cypher, microsoft_graphrag_query]
-
-    # 3. 预定义的Cypher查询 - 为电商场景定义有用的查询
-    from app.lg_agent.kg_sub_graph.agentic_rag_agents.components.predefined_cypher.cypher_dict import predefined_cypher_dict
-
-    # 定义电商经营范围
-    scope_description = """
-    个人电商经营范围：智能家居产品，包括但不限于：
-    - 智能照明（灯泡、灯带、开关）
-    - 智能安防（摄像头、门锁、传感器）
-    - 智能控制（温控器、遥控器、集线器）
-    - 智能音箱（语音助手、音响）
-    - 智能厨电（电饭煲、冰箱、洗碗机）
-    - 智能清洁（扫地机器人、洗衣机）
-    
-    不包含：服装、鞋类、体育用品、化妆品、食品等非智能家居产品。
-    """
-
-    # 创建多工具工作流
-    multi_tool_workflow = create_multi_tool_workflow(
-        llm=model,
-        graph=neo4j_graph,
-        tool_schemas=tool_schemas,
-        predefined_cypher_dict=predefined_cypher_dict,
-        cypher_example_retriever=cypher_retriever,
-        scope_description=scope_description,
-        llm_cypher_validation=True,
-    )
+    # 2. 获取多工具工作流，编译结果按模型缓存，Schema 变化时才重新编译
+    # 先异步检查 Schema 快照，编译缓存按快照版本命中时不会在事件循环上访问数据库
+    await aget_graph_schema(neo4j_graph)
+    multi_tool_workflow = get_research_workflow(model, neo4j_graph)
     
-    # return multi_tool_workflow
     # 准备输入状态
     last_message = state.messages[-1].content if state.messages else ""
     input_state = {
@@ -460,8 +507,10 @@ async def create_research_plan(
         "history": []
     }
     
-    # 执行工作流
-    response = await multi_tool_workflow.ainvoke(input_state)
+    # 执行工作流，本轮对话内的问题向量和预取的示例在各节点之间共享，子任务分支计入该用户的并发上限
+    # 子图作为嵌套图执行，外层以 subgraphs=True 流式执行时可以收到各节点的进度（见 research_progress_events）
+    with request_scope(), branch_owner(config.get("configurable", {}).get("user_id")):
+        response = await multi_tool_workflow.ainvoke(input_state)
     return {"messages": [AIMessage(content=response["answer"])]}
 
 async def check_hallucinations(
@@ -479,12 +528,8 @@ async def check_hallucinations(
     Returns:
         dict[str, Router]: A dictionary containing the 'router' key with the classification result (classification type and logic).
     """
-    if settings.AGENT_SERVICE == ServiceType.DEEPSEEK:
-        # 对于Agent服务，使用deepseek-chat而不是deepseek-reasoner
-        agent_model = "deepseek-chat"
-        model = ChatDeepSeek(api_key=settings.DEEPSEEK_API_KEY, model_name=agent_model, temperature=0.7, tags=["hallucinations"])
-    else:
-        model = ChatOllama(model=settings.OLLAMA_AGENT_MODEL, base_url=settings.OLLAMA_BASE_URL, temperature=0.7, tags=["hallucinations"])
+    # 对于Agent服务，使用deepseek-chat而不是deepseek-reasoner
+    hallucination_model = model_registry.get_model("hallucinations", model_name="deepseek-chat", schema=GradeHallucinations)
     
     system_prompt = CHECK_HALLUCINATIONS.format(
         documents=state.documents,
@@ -497,14 +542,14 @@ async def check_hallucinations(
 
     logger.info("---CHECK HALLUCINATIONS---")
     
-    response = cast(GradeHallucinations, await model.with_structured_output(GradeHallucinations).ainvoke(messages))
+    response = cast(GradeHallucinations, await hallucination_model.ainvoke(messages))
     
     return {"hallucination": response} 
 
 
-# 定义持久化存储，也可以使用SQLiteSaver()、PostgresSaver()等
+# 定义持久化存储，默认保存在 Redis 中，只保留每个线程最近的检查点，空闲线程按 TTL 清除
 # LangGraph官方地址：https://langchain-ai.github.io/langgraph/how-tos/persistence/
-checkpointer = MemorySaver()
+checkpointer = create_checkpointer()
 
 # 定义状态图
 builder = StateGraph(AgentState, input=InputState)
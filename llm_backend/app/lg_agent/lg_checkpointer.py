@@ -0,0 +1,483 @@
+"""
+LangGraph 会话检查点存储。
+
+MemorySaver 把每个线程的全部检查点历史保存在进程内，只增不减，进程重启后丢失。这里提供两种有界的实现：
+- RedisCheckpointSaver：检查点保存在 Redis 中，多个进程共享，重启后会话可以继续
+- BoundedMemorySaver：进程内存储，用于本地开发和测试
+
+两者都只保留每个线程（每个子图命名空间单独计数）最近 LANGGRAPH_CHECKPOINT_KEEP 个检查点；
+研究计划子图每轮对话使用新的命名空间，每个线程也只保留最近 LANGGRAPH_CHECKPOINT_KEEP 个子图命名空间。
+线程空闲超过 LANGGRAPH_THREAD_TTL 秒后清除。
+"""
+
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+import random
+import time
+
+import ormsgpack
+import redis.asyncio as aioredis
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.serde.base import SerializerProtocol
+
+from app.core.config import settings
+from app.core.logger import get_logger
+
+logger = get_logger(service="lg_checkpointer")
+
+
+def _next_version(current: Optional[str]) -> str:
+    # 与 MemorySaver 相同的版本号格式：递增整数 + 随机小数，保证字符串可比较
+    if current is None:
+        current_v = 0
+    elif isinstance(current, int):
+        current_v = current
+    else:
+        current_v = int(current.split(".")[0])
+    return f"{current_v + 1:032}.{random.random():016}"
+
+
+def _blob_field(channel: str, version: Any) -> str:
+    return f"{channel}\x00{version}"
+
+
+def _thread_config(thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> RunnableConfig:
+    return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}}
+
+
+class RedisCheckpointSaver(BaseCheckpointSaver[str]):
+    """基于 Redis 的检查点存储，只提供异步接口（graph.astream / graph.aget_state 等）
+
+    每个 (线程, 命名空间) 使用以下键，前缀为 {prefix}:{thread_id}:{checkpoint_ns}：
+    - :index        有序集合，成员为检查点 ID（分数相同，按 ID 字典序即时间顺序排列）
+    - :checkpoints  哈希，检查点 ID -> (检查点, 元数据, 父检查点 ID)，不含通道值
+    - :versions     哈希，检查点 ID -> 各通道版本，压缩时据此判断哪些通道值不再被引用
+    - :blobs        哈希，(通道, 版本) -> 通道值，未变化的通道在多个检查点之间共享
+    - :writes:{id}  哈希，该检查点的待写入数据
+    另有 {prefix}:{thread_id}:namespaces 有序集合按首次出现时间记录线程用到的命名空间（根命名空间排在最后）。
+
+    每次写入检查点后删除超出保留数量的旧检查点及其独占的通道值、超出保留数量的旧子图命名空间，
+    并刷新这些键的过期时间。
+
+    检查点读写在每个图步骤的关键路径上，使用独立的阻塞式连接池：连接用尽时排队等待，
+    不与语义缓存争用共享连接池，也不会像普通连接池那样直接抛出 MaxConnectionsError。
+    """
+
+    def __init__(
+        self,
+        redis_url: Optional[str] = None,
+        prefix: str = "lg:checkpoint",
+        keep: Optional[int] = None,
+        ttl: Optional[int] = None,
+        max_connections: Optional[int] = None,
+        serde: Optional[SerializerProtocol] = None,
+    ):
+        super().__init__(serde=serde)
+        self.redis_url = redis_url or settings.REDIS_URL
+        self.max_connections = max_connections or settings.LANGGRAPH_CHECKPOINT_MAX_CONNECTIONS
+        self.prefix = prefix
+        self.keep = max(1, keep or settings.LANGGRAPH_CHECKPOINT_KEEP)
+        self.ttl = ttl if ttl is not None else settings.LANGGRAPH_THREAD_TTL
+        self._redis = None
+        self.puts = 0
+        self.reads = 0
+        self.compacted = 0
+        self.total_put_ms = 0.0
+        self.total_read_ms = 0.0
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            pool = aioredis.BlockingConnectionPool.from_url(self.redis_url, max_connections=self.max_connections)
+            self._redis = aioredis.Redis(connection_pool=pool)
+        return self._redis
+
+    async def aclose(self):
+        """关闭连接池，应用退出时调用"""
+        if self._redis is not None:
+            await self._redis.connection_pool.disconnect()
+            self._redis = None
+
+    def _key(self, thread_id: str, checkpoint_ns: str, kind: str) -> str:
+        return f"{self.prefix}:{thread_id}:{checkpoint_ns}:{kind}"
+
+    def _writes_key(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> str:
+        return f"{self.prefix}:{thread_id}:{checkpoint_ns}:writes:{checkpoint_id}"
+
+    def _namespaces_key(self, thread_id: str) -> str:
+        return f"{self.prefix}:{thread_id}:namespaces"
+
+    # ---------- 读取 ----------
+
+    async def _load_tuple(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> Optional[CheckpointTuple]:
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hget(self._key(thread_id, checkpoint_ns, "checkpoints"), checkpoint_id)
+        pipe.hgetall(self._writes_key(thread_id, checkpoint_ns, checkpoint_id))
+        record, raw_writes = await pipe.execute()
+        if record is None:
+            return None
+
+        checkpoint_type, checkpoint_data, metadata_type, metadata_data, parent_checkpoint_id = ormsgpack.unpackb(record)
+        checkpoint: Checkpoint = self.serde.loads_typed((checkpoint_type, checkpoint_data))
+
+        channel_values: Dict[str, Any] = {}
+        versions = list(checkpoint["channel_versions"].items())
+        if versions:
+            blobs = await self.redis.hmget(
+                self._key(thread_id, checkpoint_ns, "blobs"),
+                [_blob_field(channel, version) for channel, version in versions],
+            )
+            for (channel, _), blob in zip(versions, blobs):
+                if blob is None:
+                    continue
+                value_type, value_data = ormsgpack.unpackb(blob)
+                if value_type != "empty":
+                    channel_values[channel] = self.serde.loads_typed((value_type, value_data))
+
+        # 与 PostgresSaver 一致，待写入数据按 (task_id, idx) 排序
+        writes = sorted(ormsgpack.unpackb(value) for value in raw_writes.values())
+        return CheckpointTuple(
+            config=_thread_config(thread_id, checkpoint_ns, checkpoint_id),
+            checkpoint={**checkpoint, "channel_values": channel_values},
+            metadata=self.serde.loads_typed((metadata_type, metadata_data)),
+            parent_config=_thread_config(thread_id, checkpoint_ns, parent_checkpoint_id) if parent_checkpoint_id else None,
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((value_type, value_data)))
+                for task_id, _, channel, value_type, value_data, _ in writes
+            ],
+        )
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        start = time.perf_counter()
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        try:
+            checkpoint_id = get_checkpoint_id(config)
+            if not checkpoint_id:
+                latest = await self.redis.zrevrange(self._key(thread_id, checkpoint_ns, "index"), 0, 0)
+                if not latest:
+                    return None
+                checkpoint_id = latest[0].decode()
+            return await self._load_tuple(thread_id, checkpoint_ns, checkpoint_id)
+        finally:
+            self.reads += 1
+            self.total_read_ms += (time.perf_counter() - start) * 1000
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        if config is None:
+            raise ValueError("RedisCheckpointSaver 只支持按线程列出检查点，config 中需要 thread_id")
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns")
+        if checkpoint_ns is not None:
+            namespaces = [checkpoint_ns]
+        else:
+            namespaces = [m.decode() for m in await self.redis.zrevrange(self._namespaces_key(thread_id), 0, -1)]
+        config_checkpoint_id = get_checkpoint_id(config)
+        before_checkpoint_id = get_checkpoint_id(before) if before else None
+
+        for namespace in namespaces:
+            checkpoint_ids = await self.redis.zrevrange(self._key(thread_id, namespace, "index"), 0, -1)
+            for raw_id in checkpoint_ids:
+                checkpoint_id = raw_id.decode()
+                if config_checkpoint_id and checkpoint_id != config_checkpoint_id:
+                    continue
+                if before_checkpoint_id and checkpoint_id >= before_checkpoint_id:
+                    continue
+                checkpoint_tuple = await self._load_tuple(thread_id, namespace, checkpoint_id)
+                if checkpoint_tuple is None:
+                    continue
+                if filter and not all(checkpoint_tuple.metadata.get(k) == v for k, v in filter.items()):
+                    continue
+                if limit is not None:
+                    if limit <= 0:
+                        return
+                    limit -= 1
+                yield checkpoint_tuple
+
+    # ---------- 写入 ----------
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        start = time.perf_counter()
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = checkpoint["id"]
+
+        c = checkpoint.copy()
+        values: Dict[str, Any] = c.pop("channel_values")  # type: ignore[misc]
+        record = ormsgpack.packb([
+            *self.serde.dumps_typed(c),
+            *self.serde.dumps_typed(get_checkpoint_metadata(config, metadata)),
+            config["configurable"].get("checkpoint_id"),
+        ])
+        blobs = {
+            _blob_field(channel, version): ormsgpack.packb(
+                list(self.serde.dumps_typed(values[channel])) if channel in values else ["empty", b""]
+            )
+            for channel, version in new_versions.items()
+        }
+
+        index_key = self._key(thread_id, checkpoint_ns, "index")
+        checkpoints_key = self._key(thread_id, checkpoint_ns, "checkpoints")
+        versions_key = self._key(thread_id, checkpoint_ns, "versions")
+        blobs_key = self._key(thread_id, checkpoint_ns, "blobs")
+        namespaces_key = self._namespaces_key(thread_id)
+
+        pipe = self.redis.pipeline(transaction=False)
+        if blobs:
+            pipe.hset(blobs_key, mapping=blobs)
+        pipe.hset(checkpoints_key, checkpoint_id, record)
+        pipe.hset(versions_key, checkpoint_id, ormsgpack.packb(dict(checkpoint["channel_versions"])))
+        pipe.zadd(index_key, {checkpoint_id: 0})
+        # 根命名空间的分数为 inf，不会被当作旧的子图命名空间删除
+        pipe.zadd(namespaces_key, {checkpoint_ns: float("inf") if not checkpoint_ns else time.time()}, nx=True)
+        if self.ttl > 0:
+            for key in (index_key, checkpoints_key, versions_key, blobs_key, namespaces_key):
+                pipe.expire(key, self.ttl)
+        pipe.zcard(namespaces_key)
+        pipe.zrange(index_key, 0, -1)
+        *_, namespace_count, raw_ids = await pipe.execute()
+        checkpoint_ids = [raw_id.decode() for raw_id in raw_ids]
+
+        if len(checkpoint_ids) > self.keep:
+            await self._compact(thread_id, checkpoint_ns, checkpoint_ids)
+        if namespace_count > self.keep + 1:
+            stale = await self.redis.zrange(namespaces_key, 0, namespace_count - self.keep - 2)
+            for raw_ns in stale:
+                await self._delete_namespace(thread_id, raw_ns.decode())
+
+        self.puts += 1
+        self.total_put_ms += (time.perf_counter() - start) * 1000
+        return _thread_config(thread_id, checkpoint_ns, checkpoint_id)
+
+    async def _compact(self, thread_id: str, checkpoint_ns: str, checkpoint_ids: List[str]):
+        """删除最早的检查点，只保留最近 keep 个；checkpoint_ids 按时间升序"""
+        removed, kept = checkpoint_ids[:-self.keep], checkpoint_ids[-self.keep:]
+        versions_key = self._key(thread_id, checkpoint_ns, "versions")
+        raw_versions = await self.redis.hmget(versions_key, removed + kept)
+        versions = [ormsgpack.unpackb(raw) if raw else {} for raw in raw_versions]
+
+        kept_fields = {_blob_field(ch, v) for vs in versions[len(removed):] for ch, v in vs.items()}
+        dropped_fields = {_blob_field(ch, v) for vs in versions[:len(removed)] for ch, v in vs.items()} - kept_fields
+
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zrem(self._key(thread_id, checkpoint_ns, "index"), *removed)
+        pipe.hdel(self._key(thread_id, checkpoint_ns, "checkpoints"), *removed)
+        pipe.hdel(versions_key, *removed)
+        pipe.delete(*(self._writes_key(thread_id, checkpoint_ns, checkpoint_id) for checkpoint_id in removed))
+        if dropped_fields:
+            pipe.hdel(self._key(thread_id, checkpoint_ns, "blobs"), *dropped_fields)
+        if self.ttl > 0:
+            for checkpoint_id in kept:
+                pipe.expire(self._writes_key(thread_id, checkpoint_ns, checkpoint_id), self.ttl)
+        await pipe.execute()
+        self.compacted += len(removed)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        writes_key = self._writes_key(thread_id, checkpoint_ns, checkpoint_id)
+
+        pipe = self.redis.pipeline(transaction=False)
+        for idx, (channel, value) in enumerate(writes):
+            write_idx = WRITES_IDX_MAP.get(channel, idx)
+            field = f"{task_id}\x00{write_idx}"
+            value = ormsgpack.packb([task_id, write_idx, channel, *self.serde.dumps_typed(value), task_path])
+            # 普通写入只保存第一次，特殊通道（错误、中断等）覆盖旧值，与 MemorySaver 一致
+            if write_idx >= 0:
+                pipe.hsetnx(writes_key, field, value)
+            else:
+                pipe.hset(writes_key, field, value)
+        if self.ttl > 0:
+            pipe.expire(writes_key, self.ttl)
+        await pipe.execute()
+
+    async def _delete_namespace(self, thread_id: str, checkpoint_ns: str):
+        checkpoint_ids = await self.redis.zrange(self._key(thread_id, checkpoint_ns, "index"), 0, -1)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.delete(
+            *(self._key(thread_id, checkpoint_ns, kind) for kind in ("index", "checkpoints", "versions", "blobs")),
+            *(self._writes_key(thread_id, checkpoint_ns, raw_id.decode()) for raw_id in checkpoint_ids),
+        )
+        pipe.zrem(self._namespaces_key(thread_id), checkpoint_ns)
+        await pipe.execute()
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        namespaces_key = self._namespaces_key(thread_id)
+        for raw_ns in await self.redis.zrange(namespaces_key, 0, -1):
+            await self._delete_namespace(thread_id, raw_ns.decode())
+        await self.redis.delete(namespaces_key)
+
+    # ---------- 同步接口 ----------
+
+    def _sync_unsupported(self, *args, **kwargs):
+        raise NotImplementedError("RedisCheckpointSaver 只支持异步接口，请使用 graph.astream / graph.aget_state 等异步方法")
+
+    get_tuple = put = put_writes = delete_thread = _sync_unsupported
+
+    def list(self, *args, **kwargs) -> Iterator[CheckpointTuple]:
+        self._sync_unsupported()
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        return _next_version(current)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "redis",
+            "keep": self.keep,
+            "ttl": self.ttl,
+            "puts": self.puts,
+            "reads": self.reads,
+            "compacted": self.compacted,
+            "avg_put_ms": round(self.total_put_ms / self.puts, 3) if self.puts else 0.0,
+            "avg_read_ms": round(self.total_read_ms / self.reads, 3) if self.reads else 0.0,
+        }
+
+
+class BoundedMemorySaver(MemorySaver):
+    """有上限的进程内检查点存储
+
+    在 MemorySaver 的基础上，每次写入后只保留最近 keep 个检查点并删除不再被引用的通道值，
+    每个线程只保留最近 keep 个子图命名空间（storage 中命名空间按首次写入的顺序排列）；
+    写入时顺带清除空闲超过 ttl 秒的线程（最多每 EVICTION_INTERVAL 秒扫描一次）。
+    """
+
+    EVICTION_INTERVAL = 60.0
+
+    def __init__(self, keep: Optional[int] = None, ttl: Optional[int] = None, serde: Optional[SerializerProtocol] = None):
+        super().__init__(serde=serde)
+        self.keep = max(1, keep or settings.LANGGRAPH_CHECKPOINT_KEEP)
+        self.ttl = ttl if ttl is not None else settings.LANGGRAPH_THREAD_TTL
+        # (线程, 命名空间, 检查点 ID) -> 通道版本
+        self._versions: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self._last_access: Dict[str, float] = {}
+        self._evicted_at = time.monotonic()
+        self.puts = 0
+        self.compacted = 0
+        self.evicted = 0
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        self._last_access[config["configurable"]["thread_id"]] = time.monotonic()
+        return super().get_tuple(config)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        result = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        self._versions[(thread_id, checkpoint_ns, checkpoint["id"])] = dict(checkpoint["channel_versions"])
+        self._compact(thread_id, checkpoint_ns)
+        namespaces = [ns for ns in self.storage[thread_id] if ns]
+        for stale_ns in namespaces[:-self.keep]:
+            self._delete_namespace(thread_id, stale_ns)
+
+        now = time.monotonic()
+        self._last_access[thread_id] = now
+        if self.ttl > 0 and now - self._evicted_at >= min(self.EVICTION_INTERVAL, self.ttl):
+            self._evict_idle(now)
+        self.puts += 1
+        return result
+
+    def _compact(self, thread_id: str, checkpoint_ns: str):
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if len(checkpoints) <= self.keep:
+            return
+        checkpoint_ids = sorted(checkpoints)
+        removed, kept = checkpoint_ids[:-self.keep], checkpoint_ids[-self.keep:]
+        kept_blobs = {
+            (thread_id, checkpoint_ns, ch, v)
+            for checkpoint_id in kept
+            for ch, v in self._versions.get((thread_id, checkpoint_ns, checkpoint_id), {}).items()
+        }
+        for checkpoint_id in removed:
+            checkpoints.pop(checkpoint_id, None)
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            for ch, v in self._versions.pop((thread_id, checkpoint_ns, checkpoint_id), {}).items():
+                key = (thread_id, checkpoint_ns, ch, v)
+                if key not in kept_blobs:
+                    self.blobs.pop(key, None)
+        self.compacted += len(removed)
+
+    def _delete_namespace(self, thread_id: str, checkpoint_ns: str):
+        for checkpoint_id in self.storage[thread_id].pop(checkpoint_ns, {}):
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            for ch, v in self._versions.pop((thread_id, checkpoint_ns, checkpoint_id), {}).items():
+                self.blobs.pop((thread_id, checkpoint_ns, ch, v), None)
+
+    def _evict_idle(self, now: float):
+        """一次扫描清除所有空闲线程，避免逐个调用 delete_thread 反复遍历全部写入和通道值"""
+        self._evicted_at = now
+        expired: Set[str] = {t for t in self.storage if now - self._last_access.get(t, 0.0) > self.ttl}
+        if not expired:
+            return
+        for thread_id in expired:
+            self.storage.pop(thread_id, None)
+            self._last_access.pop(thread_id, None)
+        for store in (self.writes, self.blobs, self._versions):
+            for key in [k for k in store if k[0] in expired]:
+                del store[key]
+        self.evicted += len(expired)
+        logger.info(f"Evicted {len(expired)} idle LangGraph threads")
+
+    def delete_thread(self, thread_id: str) -> None:
+        super().delete_thread(thread_id)
+        self._last_access.pop(thread_id, None)
+        for key in [k for k in self._versions if k[0] == thread_id]:
+            del self._versions[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "keep": self.keep,
+            "ttl": self.ttl,
+            "threads": len(self.storage),
+            "checkpoints": sum(len(c) for namespaces in self.storage.values() for c in namespaces.values()),
+            "blobs": len(self.blobs),
+            "puts": self.puts,
+            "compacted": self.compacted,
+            "evicted": self.evicted,
+        }
+
+    async def aclose(self):
+        pass
+
+
+def create_checkpointer() -> BaseCheckpointSaver:
+    """按 LANGGRAPH_CHECKPOINTER 创建检查点存储"""
+    if settings.LANGGRAPH_CHECKPOINTER == "memory":
+        return BoundedMemorySaver()
+    return RedisCheckpointSaver()
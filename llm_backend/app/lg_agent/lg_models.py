@@ -0,0 +1,200 @@
+from typing import Any, Dict, List, Optional, Set, Tuple
+import asyncio
+import threading
+
+import aiohttp
+import httpx
+from langchain_core.language_models import BaseChatModel
+from langchain_core.runnables import Runnable
+from langchain_deepseek import ChatDeepSeek
+from langchain_ollama import ChatOllama
+
+from app.core.config import settings, ServiceType
+from app.core.logger import get_logger
+
+logger = get_logger(service="lg_models")
+
+
+class ModelRegistry:
+    """LangGraph 节点共享的模型客户端注册表
+
+    - 以 (provider, model, temperature, tag, schema) 为键缓存模型实例和结构化输出的 Runnable，
+      不再在每次节点调用时重新创建 ChatDeepSeek / ChatOllama
+      （tag 也是键的一部分：/api/langgraph/query 按 "research_plan" 等 tag 过滤流式输出）
+    - 所有 DeepSeek 实例共用一个 httpx.AsyncClient，keep-alive 连接和 TLS 会话跨请求复用
+    - 其它 HTTP 调用（如视觉模型）按名称共享 aiohttp.ClientSession
+    - HTTP 客户端绑定在创建它的事件循环上，事件循环变化时先关闭旧客户端（尽力而为）再整体重建
+    """
+
+    def __init__(self):
+        self._models: Dict[Tuple, BaseChatModel] = {}
+        self._runnables: Dict[Tuple, Runnable] = {}
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        # 正在关闭的旧客户端任务，保存引用避免被回收
+        self._closing: Set[asyncio.Task] = set()
+
+    def _check_loop(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not None and loop is not self._loop:
+            if self._loop is not None:
+                logger.info("Event loop changed, recreating model clients")
+            self._close_stale_clients(loop)
+            self._models.clear()
+            self._runnables.clear()
+            self._sessions.clear()
+            self._http_client = None
+            self._loop = loop
+
+    def _close_stale_clients(self, loop: asyncio.AbstractEventLoop):
+        """关闭事件循环切换前创建的 HTTP 客户端，释放它们的连接"""
+        sessions = [session for session in self._sessions.values() if not session.closed]
+        if not sessions and self._http_client is None:
+            return
+        closing = self._close_quietly(sessions, self._http_client)
+        if self._loop is not None and self._loop.is_running():
+            # 旧事件循环仍在其他线程中运行，在它上面关闭
+            asyncio.run_coroutine_threadsafe(closing, self._loop)
+            return
+        task = loop.create_task(closing)
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    async def _close_quietly(sessions: List[aiohttp.ClientSession], http_client: Optional[httpx.AsyncClient]):
+        for session in sessions:
+            try:
+                await session.close()
+            except Exception as e:
+                # 旧事件循环已关闭时连接无法正常断开，底层 socket 随对象一起回收
+                logger.debug(f"Error closing stale aiohttp session: {str(e)}")
+        if http_client is not None:
+            try:
+                await http_client.aclose()
+            except Exception as e:
+                logger.debug(f"Error closing stale httpx client: {str(e)}")
+
+    def _get_http_client(self) -> httpx.AsyncClient:
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.AGENT_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.AGENT_HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=settings.AGENT_HTTP_KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(settings.AGENT_REQUEST_TIMEOUT, connect=settings.AGENT_CONNECT_TIMEOUT)
+            )
+        return self._http_client
+
+    def _create_model(self, provider: ServiceType, model_name: str, temperature: float, tag: str) -> BaseChatModel:
+        if provider == ServiceType.DEEPSEEK:
+            return ChatDeepSeek(
+                api_key=settings.DEEPSEEK_API_KEY,
+                model_name=model_name,
+                temperature=temperature,
+                tags=[tag],
+                request_timeout=settings.AGENT_REQUEST_TIMEOUT,
+                http_async_client=self._get_http_client()
+            )
+        return ChatOllama(
+            model=model_name,
+            base_url=settings.OLLAMA_BASE_URL,
+            temperature=temperature,
+            tags=[tag],
+            # ChatOllama 内部各自持有 httpx 客户端，缓存实例后连接池同样跨请求复用
+            client_kwargs={
+                "timeout": httpx.Timeout(settings.AGENT_REQUEST_TIMEOUT, connect=settings.AGENT_CONNECT_TIMEOUT),
+                "limits": httpx.Limits(
+                    max_connections=settings.AGENT_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.AGENT_HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=settings.AGENT_HTTP_KEEPALIVE_EXPIRY
+                )
+            }
+        )
+
+    def get_model(
+        self,
+        tag: str,
+        model_name: Optional[str] = None,
+        temperature: float = 0.7,
+        schema: Optional[Any] = None
+    ) -> Runnable:
+        """获取模型，传入 schema 时返回 with_structured_output(schema) 的结果
+
+        model_name 为空时按 AGENT_SERVICE 使用默认模型：DeepSeek 为 DEEPSEEK_MODEL，Ollama 为 OLLAMA_AGENT_MODEL
+        """
+        provider = settings.AGENT_SERVICE
+        if provider == ServiceType.DEEPSEEK:
+            model_name = model_name or settings.DEEPSEEK_MODEL
+        else:
+            # Ollama 下所有节点统一使用 Agent 模型
+            model_name = settings.OLLAMA_AGENT_MODEL
+
+        with self._lock:
+            self._check_loop()
+            key = (provider, model_name, temperature, tag)
+            model = self._models.get(key)
+            if model is None:
+                model = self._create_model(provider, model_name, temperature, tag)
+                self._models[key] = model
+                logger.info(f"Created {provider.value} model client: {model_name} (tag={tag}, temperature={temperature})")
+            if schema is None:
+                return model
+
+            runnable_key = key + (schema,)
+            runnable = self._runnables.get(runnable_key)
+            if runnable is None:
+                runnable = model.with_structured_output(schema)
+                self._runnables[runnable_key] = runnable
+            return runnable
+
+    def get_session(self, name: str, timeout: Optional[float] = None) -> aiohttp.ClientSession:
+        """按名称获取共享的 aiohttp.ClientSession，必须在事件循环中调用"""
+        with self._lock:
+            self._check_loop()
+            session = self._sessions.get(name)
+            if session is None or session.closed:
+                session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(
+                        limit=settings.AGENT_HTTP_MAX_CONNECTIONS,
+                        keepalive_timeout=settings.AGENT_HTTP_KEEPALIVE_EXPIRY
+                    ),
+                    timeout=aiohttp.ClientTimeout(
+                        total=timeout or settings.AGENT_REQUEST_TIMEOUT,
+                        connect=settings.AGENT_CONNECT_TIMEOUT
+                    )
+                )
+                self._sessions[name] = session
+            return session
+
+    async def aclose(self):
+        """关闭所有 HTTP 连接，在应用关闭时调用"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            http_client = self._http_client
+            self._models.clear()
+            self._runnables.clear()
+            self._sessions.clear()
+            self._http_client = None
+        for session in sessions:
+            await session.close()
+        if http_client is not None:
+            await http_client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "models": [
+                {"provider": provider.value, "model": model_name, "temperature": temperature, "tag": tag}
+                for provider, model_name, temperature, tag in self._models
+            ],
+            "structured_outputs": len(self._runnables),
+            "sessions": list(self._sessions),
+        }
+
+
+model_registry = ModelRegistry()
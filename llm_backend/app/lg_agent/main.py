@@ -32,8 +32,9 @@ async def process_query(query):
     # async for c in graph.astream(input=inputState, stream_mode="values", config=thread):
     #     print(c, end="", flush=True)
 
-    if len(graph.get_state(thread)[-1]) > 0:
-        if len(graph.get_state(thread)[-1][0].interrupts) > 0:
+    state = await graph.aget_state(thread)
+    if len(state[-1]) > 0:
+        if len(state[-1][0].interrupts) > 0:
             response = input('\n响应可能包含不确定信息。重试生成？如果是，按"y"：')
             if response.lower() == 'y':
                 async for c, metadata in graph.astream(Command(resume=response), stream_mode="messages", config=thread):
@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, func
+from app.core.database import Base
+
+
+class CypherExample(Base):
+    """Text2Cypher 的少样本示例（问题 + Cypher）"""
+    __tablename__ = "cypher_examples"
+
+    id = Column(Integer, primary_key=True, index=True)
+    category = Column(String(50))
+    question = Column(String(500), nullable=False)
+    cypher = Column(Text, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,33 @@
+from sqlalchemy import Column, Integer, String, DateTime, Float, Text, func
+from app.core.database import Base
+import enum
+
+
+class JobStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCESS = "success"
+    ERROR = "error"
+    CANCELLED = "cancelled"
+
+    @property
+    def finished(self) -> bool:
+        return self in (JobStatus.SUCCESS, JobStatus.ERROR, JobStatus.CANCELLED)
+
+
+class IndexingJob(Base):
+    """GraphRAG 索引构建任务"""
+    __tablename__ = "indexing_jobs"
+
+    id = Column(String(36), primary_key=True)
+    user_id = Column(Integer, index=True, nullable=False)
+    file_path = Column(String(500), nullable=False)
+    original_name = Column(String(255))
+    status = Column(String(20), default=JobStatus.QUEUED.value, index=True)
+    progress = Column(Float, default=0.0)       # 0 - 1
+    stage = Column(String(100))                 # 当前执行的 workflow 名称
+    error = Column(Text)
+    result = Column(Text)                       # process_file 返回值 (JSON)
+    created_at = Column(DateTime, server_default=func.now())
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
@@ -1,12 +1,200 @@
-from typing import List, Dict
-from app.core.database import AsyncSessionLocal
+from typing import Any, List, Dict, Optional
+import asyncio
+import time
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, ReadSessionLocal
 from app.models.conversation import Conversation, DialogueType
 from app.models.message import Message
 from app.core.logger import get_logger
-from sqlalchemy import select
+from sqlalchemy import exists, insert, select, update
 
 logger = get_logger(service="conversation")
 
+
+class MessageWriteBehind:
+    """对话消息的后写缓冲
+
+    流式回复结束时只把消息放进内存缓冲区，后台任务每隔 CONVERSATION_FLUSH_INTERVAL 秒
+    （或缓冲达到 CONVERSATION_FLUSH_BATCH_SIZE 条时立即）把所有请求的消息合并写库：
+    - 一次查询确认会话存在并用 EXISTS 判断是否已有消息，不再读取全部消息行
+    - 所有消息用一条批量 INSERT 写入，首条消息所在会话的标题用一次批量 UPDATE 更新
+    - 批量写入失败时逐条重写，只有写不进去的那一轮保留在缓冲区中重试，超过 max_attempts 次后丢弃并记录日志
+    读取会话或消息列表前会先写入该用户/会话的缓冲消息（包括正在写入的批次）；应用退出时写入全部缓冲。
+    """
+
+    def __init__(self, flush_interval: Optional[float] = None, batch_size: Optional[int] = None, max_attempts: int = 3):
+        self.flush_interval = flush_interval or settings.CONVERSATION_FLUSH_INTERVAL
+        self.batch_size = batch_size or settings.CONVERSATION_FLUSH_BATCH_SIZE
+        self.max_attempts = max_attempts
+        self._pending: List[Dict[str, Any]] = []
+        # 正在写库的批次，写完之前读取也要等待
+        self._inflight: List[Dict[str, Any]] = []
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+        self.dropped = 0
+        self.last_flush_ms = 0.0
+
+    def enqueue(self, user_id: int, conversation_id: int, messages: List[Dict], response: str):
+        """缓冲一轮问答（用户问题 + 助手回复），不等待写库"""
+        # 获取用户的问题内容
+        user_content = next((msg["content"] for msg in messages if msg["role"] == "user"), "")
+        self._pending.append({
+            "user_id": user_id,
+            "conversation_id": conversation_id,
+            "user_content": user_content,
+            "response": response,
+            "attempts": 0,
+        })
+        self.enqueued += 1
+        self.start()
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def has_pending(self, user_id: Optional[int] = None, conversation_id: Optional[int] = None) -> bool:
+        return any(
+            (user_id is None or entry["user_id"] == user_id)
+            and (conversation_id is None or entry["conversation_id"] == conversation_id)
+            for entry in self._inflight + self._pending
+        )
+
+    async def flush(self):
+        """立即写入当前缓冲的全部消息"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return
+            self._inflight = batch
+            start = time.perf_counter()
+            try:
+                await self._write(batch)
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Error saving {len(batch)} conversation turns: {str(e)}", exc_info=True)
+                retry = await self._write_each(batch) if len(batch) > 1 else self._retry_or_drop(batch)
+                # 放回缓冲区头部，保持消息顺序
+                self._pending[:0] = retry
+                return
+            except BaseException:
+                # 写库过程中被取消（如应用退出），整批放回缓冲区，由后续 flush 写入
+                self._pending[:0] = batch
+                raise
+            finally:
+                self._inflight = []
+            self.batches += 1
+            self.last_flush_ms = (time.perf_counter() - start) * 1000
+
+    async def _write_each(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批量写入失败后逐条重写，避免一轮有问题的消息连累同批的其他用户，返回需要重试的条目"""
+        failed: List[Dict[str, Any]] = []
+        for index, entry in enumerate(batch):
+            try:
+                await self._write([entry])
+            except Exception as e:
+                logger.error(f"Error saving conversation turn for conversation {entry['conversation_id']}: {str(e)}")
+                failed.append(entry)
+            except BaseException:
+                self._pending[:0] = failed + batch[index:]
+                raise
+        return self._retry_or_drop(failed)
+
+    def _retry_or_drop(self, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        retry = []
+        for entry in entries:
+            entry["attempts"] += 1
+            if entry["attempts"] < self.max_attempts:
+                retry.append(entry)
+            else:
+                self.dropped += 1
+                logger.error(
+                    f"Dropping conversation messages after {entry['attempts']} attempts - "
+                    f"user_id: {entry['user_id']}, conversation_id: {entry['conversation_id']}, "
+                    f"user message: {entry['user_content'][:100]}"
+                )
+        return retry
+
+    async def _write(self, batch: List[Dict[str, Any]]):
+        conversation_ids = list(dict.fromkeys(entry["conversation_id"] for entry in batch))
+        async with AsyncSessionLocal() as db:
+            # 查询会话是否存在，以及是否已有消息
+            has_messages = exists().where(Message.conversation_id == Conversation.id).label("has_messages")
+            result = await db.execute(select(Conversation.id, has_messages).where(Conversation.id.in_(conversation_ids)))
+            found = {row.id: bool(row.has_messages) for row in result}
+
+            titles: Dict[int, str] = {}
+            rows: List[Dict[str, Any]] = []
+            for entry in batch:
+                conversation_id = entry["conversation_id"]
+                if conversation_id not in found:
+                    self.dropped += 1
+                    logger.error(f"Conversation {conversation_id} not found")
+                    continue
+                # 如果是第一条消息，更新会话标题
+                if not found[conversation_id] and conversation_id not in titles:
+                    titles[conversation_id] = ConversationService.get_conversation_title(entry["user_content"])
+                rows.append({"conversation_id": conversation_id, "sender": "user", "content": entry["user_content"]})
+                rows.append({"conversation_id": conversation_id, "sender": "assistant", "content": entry["response"]})
+
+            if rows:
+                await db.execute(insert(Message), rows)
+            if titles:
+                await db.execute(update(Conversation), [{"id": cid, "title": title} for cid, title in titles.items()])
+            await db.commit()
+            self.written += len(rows)
+
+    def start(self):
+        """启动后台写库任务，已在运行时不重复启动"""
+        if self._flusher is None or self._flusher.done():
+            self._wakeup = asyncio.Event()
+            self._stopping = asyncio.Event()
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """停止后台任务并写入剩余的缓冲消息
+
+        不取消后台任务：通知它退出并等待正在进行的写入完成，避免写到一半的批次丢失。
+        """
+        if self._flusher is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            await self._flusher
+            self._flusher = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._stopping.is_set():
+                break
+            await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending) + len(self._inflight),
+            "enqueued": self.enqueued,
+            "written_messages": self.written,
+            "batches": self.batches,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+        }
+
+
+# 进程内共享的消息写入缓冲
+message_writer = MessageWriteBehind()
+
+
 class ConversationService:
     @staticmethod
     def get_conversation_title(message: str, max_length: int = 20) -> str:
@@ -39,49 +227,9 @@ class ConversationService:
         messages: List[Dict], 
         response: str
     ):
-        """保存对话消息"""
+        """保存对话消息（放入后写缓冲，由 message_writer 批量写库）"""
         try:
-            async with AsyncSessionLocal() as db:
-                # 查询会话
-                stmt = select(Conversation).where(Conversation.id == conversation_id)
-                result = await db.execute(stmt)
-                conversation = result.scalar_one_or_none()
-                
-                if not conversation:
-                    logger.error(f"Conversation {conversation_id} not found")
-                    return
-                    
-                # 查询现有消息数量
-                stmt = select(Message).where(Message.conversation_id == conversation_id)
-                result = await db.execute(stmt)
-                messages_count = len(result.all())
-                
-                # 获取用户的问题内容
-                user_content = next((msg["content"] for msg in messages if msg["role"] == "user"), "")
-                
-                # 如果是第一条消息，更新会话标题
-                if messages_count == 0:
-                    title = ConversationService.get_conversation_title(user_content)
-                    conversation.title = title
-                
-                # 保存用户消息
-                user_message = Message(
-                    conversation_id=conversation_id,
-                    sender="user",
-                    content=user_content
-                )
-                db.add(user_message)
-                
-                # 保存助手回复
-                assistant_message = Message(
-                    conversation_id=conversation_id,
-                    sender="assistant",
-                    content=response
-                )
-                db.add(assistant_message)
-                
-                await db.commit()
-                
+            message_writer.enqueue(user_id, conversation_id, messages, response)
         except Exception as e:
             logger.error(f"Error saving conversation: {str(e)}", exc_info=True)
             logger.error(f"Error details - user_id: {user_id}, conversation_id: {conversation_id}")
@@ -91,7 +239,14 @@ class ConversationService:
     async def get_user_conversations(user_id: int) -> List[Dict]:
         """获取用户的所有会话"""
         try:
-            async with AsyncSessionLocal() as db:
+            # 新会话的标题在首条消息写库时才更新，先写入该用户缓冲中的消息；
+            # 刚写入时从主库读取，避免只读副本的复制延迟导致读不到
+            session_factory = ReadSessionLocal
+            if message_writer.has_pending(user_id=user_id):
+                await message_writer.flush()
+                session_factory = AsyncSessionLocal
+
+            async with session_factory() as db:
                 # 查询用户的所有会话，排除标题为"新会话"的对话
                 stmt = select(Conversation).where(
                     Conversation.user_id == user_id,
@@ -117,10 +272,24 @@ class ConversationService:
             raise
 
     @staticmethod
-    async def get_conversation_messages(conversation_id: int, user_id: int) -> List[Dict]:
-        """获取会话的所有消息"""
+    async def get_conversation_messages(
+        conversation_id: int,
+        user_id: int,
+        limit: Optional[int] = None,
+        before_id: Optional[int] = None
+    ) -> List[Dict]:
+        """获取会话的消息
+
+        不指定 limit 时返回全部消息；指定 limit 时按 id 做键集分页，返回 before_id 之前（更早）的最多 limit 条，
+        结果都按时间正序排列，加载更早的消息时把本页第一条的 id 作为下一次的 before_id
+        """
         try:
-            async with AsyncSessionLocal() as db:
+            session_factory = ReadSessionLocal
+            if message_writer.has_pending(conversation_id=conversation_id):
+                await message_writer.flush()
+                session_factory = AsyncSessionLocal
+
+            async with session_factory() as db:
                 # 首先验证会话属于该用户
                 stmt = select(Conversation).where(
                     Conversation.id == conversation_id,
@@ -132,13 +301,19 @@ class ConversationService:
                 if not conversation:
                     raise ValueError(f"Conversation {conversation_id} not found or not owned by user {user_id}")
                 
-                # 查询会话的所有消息
-                stmt = select(Message).where(
-                    Message.conversation_id == conversation_id
-                ).order_by(Message.created_at)
+                # 查询会话的消息，id 与写入顺序一致（同一批写入的消息 created_at 相同）
+                stmt = select(Message).where(Message.conversation_id == conversation_id)
+                if before_id is not None:
+                    stmt = stmt.where(Message.id < before_id)
+                if limit:
+                    stmt = stmt.order_by(Message.id.desc()).limit(limit)
+                else:
+                    stmt = stmt.order_by(Message.id)
                 
                 result = await db.execute(stmt)
                 messages = result.scalars().all()
+                if limit:
+                    messages = list(reversed(messages))
                 
                 return [
                     {
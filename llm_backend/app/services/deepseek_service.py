@@ -1,12 +1,12 @@
 from typing import List, Dict, AsyncGenerator, Callable, Optional
 from openai import AsyncOpenAI
-from app.core.config import settings
+from app.core.config import settings, CacheReplayMode
 import json
 from app.core.logger import get_logger
 from app.core.database import AsyncSessionLocal
 from app.models.conversation import Conversation, DialogueType
 from app.models.message import Message
-from app.services.redis_semantic_cache import RedisSemanticCache
+from app.services.redis_semantic_cache import semantic_cache_registry
 import time
 import asyncio
 
@@ -27,15 +27,32 @@ class DeepseekService:
             self.model = settings.DEEPSEEK_MODEL or model
             logger.info(f"Using chat model: {self.model}")
 
-        self.cache = RedisSemanticCache(prefix="deepseek")
+    async def _stream_cached_response(
+        self,
+        response: str,
+        mode: Optional[CacheReplayMode] = None
+    ) -> AsyncGenerator[str, None]:
+        """按回放策略流式返回缓存的响应"""
+        mode = mode or settings.CACHE_REPLAY_MODE
+
+        if mode == CacheReplayMode.INSTANT:
+            # 整段响应一帧发完
+            yield f"data: {json.dumps(response, ensure_ascii=False)}\n\n"
+            return
+
+        if mode == CacheReplayMode.TOKEN_RATE:
+            # 每 50ms 发一帧，帧大小按速率折算，整体速度接近模型实时生成
+            interval = 0.05
+            chunk_size = max(1, int(settings.CACHE_REPLAY_TOKENS_PER_SECOND * interval))
+        else:
+            # 固定大小的大块，不等待
+            interval = 0
+            chunk_size = settings.CACHE_REPLAY_CHUNK_SIZE
 
-    async def _stream_cached_response(self, response: str, delay: float = 0.05) -> AsyncGenerator[str, None]:
-        """模拟流式返回缓存的响应"""
-        # 每次返回4个字符
-        chunks = [response[i:i + 4] for i in range(0, len(response), 4)]
-        for chunk in chunks:
-            await asyncio.sleep(delay)  # 50ms延迟
-            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        for i in range(0, len(response), chunk_size):
+            if interval and i:
+                await asyncio.sleep(interval)
+            yield f"data: {json.dumps(response[i:i + chunk_size], ensure_ascii=False)}\n\n"
 
     async def generate_stream(
         self, 
@@ -46,8 +63,8 @@ class DeepseekService:
     ) -> AsyncGenerator[str, None]:
         """流式生成回复"""
         try:
-            # 为每个用户创建独立的缓存实例
-            cache = RedisSemanticCache(prefix="deepseek", user_id=user_id)
+            # 从注册表获取该用户的缓存命名空间
+            cache = semantic_cache_registry.get(prefix="deepseek", user_id=user_id)
             
             start_time = time.time()
             
@@ -57,7 +74,7 @@ class DeepseekService:
                 response_time = time.time() - start_time
                 logger.info(f"Cache hit! Response time: {response_time:.4f} seconds")
                 
-                # 模拟流式返回，因为速率太快了
+                # 按配置的回放策略返回缓存内容
                 async for chunk in self._stream_cached_response(cached_response):
                     yield chunk
                 
@@ -75,10 +92,10 @@ class DeepseekService:
 
             async for chunk in response:
                 if chunk.choices and chunk.choices[0].delta.content:
+                    # 缓存和回调保存原始文本，只在发送时做 JSON 编码
+                    full_response.append(chunk.choices[0].delta.content)
                     # 使用 ensure_ascii=False 来保持中文字符
                     content = json.dumps(chunk.choices[0].delta.content, ensure_ascii=False)
-
-                    full_response.append(content)
                     yield f"data: {content}\n\n"
             
             # 完整响应
@@ -121,8 +138,8 @@ class DeepseekService:
     ) -> AsyncGenerator[str, None]:
         """使用推理模型进行流式生成"""
         try:
-            # 为推理任务创建独立的缓存实例
-            cache = RedisSemanticCache(prefix="deepseek_reasoning", user_id=user_id)
+            # 推理任务使用独立的缓存命名空间
+            cache = semantic_cache_registry.get(prefix="deepseek_reasoning", user_id=user_id)
 
             start_time = time.time()
 
@@ -132,7 +149,7 @@ class DeepseekService:
                 response_time = time.time() - start_time
                 logger.info(f"Reasoning cache hit! Response time: {response_time:.4f} seconds")
 
-                # 模拟流式返回
+                # 按配置的回放策略返回缓存内容
                 async for chunk in self._stream_cached_response(cached_response):
                     yield chunk
 
@@ -153,8 +170,8 @@ class DeepseekService:
 
             async for chunk in response:
                 if chunk.choices and chunk.choices[0].delta.content:
+                    full_response.append(chunk.choices[0].delta.content)
                     content = json.dumps(chunk.choices[0].delta.content, ensure_ascii=False)
-                    full_response.append(content)
                     yield f"data: {content}\n\n"
 
             # 完整响应
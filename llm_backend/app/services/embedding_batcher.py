@@ -0,0 +1,131 @@
+from typing import Dict, List, Optional, Set, Tuple
+from collections import OrderedDict
+import hashlib
+import asyncio
+import openai
+from app.core.config import settings
+from app.core.logger import get_logger
+
+logger = get_logger(service="embedding_batcher")
+
+
+class EmbeddingBatcher:
+    """嵌入请求合并器
+
+    在 embeddings.create 前加三层:
+    1. 进程内 LRU：以 (模型, 文本哈希) 为键，命中直接返回
+    2. single-flight：相同文本正在请求中时，后来者等待同一个结果
+    3. 微批处理：几毫秒窗口内的不同文本合并成一次 embeddings.create(input=[...])
+    """
+
+    def __init__(
+        self,
+        client: openai.AsyncOpenAI,
+        model_name: str = None,
+        cache_size: int = None,
+        batch_window_ms: float = None,
+        max_batch_size: int = None
+    ):
+        self.client = client
+        self.model_name = model_name or settings.EMBEDDING_MODEL
+        self.cache_size = cache_size or settings.EMBEDDING_CACHE_SIZE
+        self.batch_window = (batch_window_ms if batch_window_ms is not None else settings.EMBEDDING_BATCH_WINDOW_MS) / 1000
+        self.max_batch_size = max_batch_size or settings.EMBEDDING_MAX_BATCH_SIZE
+
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._pending: List[Tuple[str, str]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # 事件循环只保存任务的弱引用，批次任务在完成前需要持有引用，否则可能被回收导致等待者永远挂起
+        self._batch_tasks: Set[asyncio.Task] = set()
+
+        # 运行指标
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.batches = 0
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode()).hexdigest()
+
+    async def embed(self, text: str) -> List[float]:
+        """获取单条文本的向量"""
+        key = self._key(text)
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return cached
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            # shield 保证某个等待者被取消时不影响其他等待者
+            return await asyncio.shield(future)
+
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._inflight[key] = future
+        self._pending.append((key, text))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, self._flush)
+
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        """把当前窗口内累积的请求作为一个批次发出"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, str]]):
+        self.batches += 1
+        try:
+            response = await self.client.embeddings.create(
+                model=self.model_name,
+                input=[text for _, text in batch]
+            )
+            vectors = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            if len(vectors) != len(batch):
+                raise ValueError(f"Expected {len(batch)} embeddings, got {len(vectors)}")
+        except Exception as e:
+            logger.error(f"Error getting embeddings for batch of {len(batch)}: {str(e)}", exc_info=True)
+            for key, _ in batch:
+                future = self._inflight.pop(key, None)
+                if future is not None and not future.done():
+                    future.set_exception(e)
+            return
+
+        for (key, _), vector in zip(batch, vectors):
+            self._remember(key, vector)
+            future = self._inflight.pop(key, None)
+            if future is not None and not future.done():
+                future.set_result(vector)
+
+    def _remember(self, key: str, vector: List[float]):
+        self._cache[key] = vector
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses + self.coalesced
+        return {
+            "cached": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "batches": self.batches,
+            "hit_rate": (self.hits + self.coalesced) / total if total else 0.0,
+            "avg_batch_size": self.misses / self.batches if self.batches else 0.0,
+        }
@@ -1,25 +1,73 @@
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from sentence_transformers import SentenceTransformer
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import numpy as np
 import faiss
-import json
+import asyncio
 from pathlib import Path
 import os
 import hashlib
 import time
 import PyPDF2
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.services.vector_index_manager import IncrementalIndexWriter, VectorIndexManager, get_index_manager
+
+logger = get_logger(service="embedding")
+
+# PDF 文本提取是纯 CPU 计算，放在独立进程中执行
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+# encode 和 index.add 在专用线程中串行执行，不占用事件循环
+_encode_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-encode")
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    global _pdf_pool
+    if _pdf_pool is None:
+        _pdf_pool = ProcessPoolExecutor(max_workers=settings.EMBEDDING_PDF_WORKERS)
+    return _pdf_pool
+
+
+def _count_pages(file_path: str) -> int:
+    with open(file_path, 'rb') as f:
+        return len(PyPDF2.PdfReader(f).pages)
+
+
+def _extract_pages(file_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """在子进程中提取 [start, end) 页的文本，返回 (页码, 文本)"""
+    with open(file_path, 'rb') as f:
+        pdf_reader = PyPDF2.PdfReader(f)
+        return [(i + 1, pdf_reader.pages[i].extract_text() or "") for i in range(start, end)]
+
+
+def chunk_text(text: str, tokenizer, max_tokens: int, overlap: int) -> List[str]:
+    """按 token 数切分文本，相邻块之间重叠 overlap 个 token"""
+    if not text.strip():
+        return []
+    offsets = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+    if len(offsets) <= max_tokens:
+        return [text]
+    step = max(1, max_tokens - overlap)
+    chunks = []
+    for start in range(0, len(offsets), step):
+        window = offsets[start:start + max_tokens]
+        chunks.append(text[window[0][0]:window[-1][1]])
+        if start + max_tokens >= len(offsets):
+            break
+    return chunks
+
 
 class EmbeddingService:
     def __init__(self):
         # 使用多语言模型以支持中文
         self.model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
-        self.index_dir = Path("indexes")
-        self.index_dir.mkdir(exist_ok=True)
+        # 索引由进程内共享的管理器统一打开和缓存
+        self.index_manager = get_index_manager()
+        self.index_dir = self.index_manager.index_dir
         
         # 初始化空索引和文档存储
         self.dimension = 384  # 修改为与模型输出维度一致
-        self.current_index = None
-        self.current_documents = {}
+        self.current_index_id: Optional[str] = None
     
     def _generate_safe_id(self, metadata: dict) -> str:
         """生成安全的文件ID"""
@@ -29,9 +77,9 @@ class EmbeddingService:
         # 使用MD5生成安全的文件名
         return hashlib.md5(file_info.encode()).hexdigest()
         
-    def _create_index(self) -> faiss.IndexFlatL2:
-        """创建新的 FAISS 索引"""
-        return faiss.IndexFlatL2(self.dimension)
+    def _create_index(self, corpus_size: int = 0) -> faiss.Index:
+        """按语料规模创建新的 FAISS 索引"""
+        return VectorIndexManager.build_index(self.dimension, corpus_size)
     
     def _get_index_path(self, file_path: str) -> str:
         """生成索引文件路径"""
@@ -39,137 +87,160 @@ class EmbeddingService:
         file_hash = hashlib.md5(file_path.encode()).hexdigest()
         return f"indexes/index_{file_hash}.bin"
     
-    async def create_embeddings(self, file_path: str, index_dir: str) -> Dict:
-        """从文件创建向量索引"""
+    def _chunk_pages(self, pages: List[Tuple[int, str]], file_path: str) -> List[Tuple[str, dict]]:
+        """把若干页切成带元数据的文本块"""
+        chunks = []
+        for page_no, text in pages:
+            for chunk_no, chunk in enumerate(chunk_text(
+                text,
+                self.model.tokenizer,
+                settings.EMBEDDING_CHUNK_TOKENS,
+                settings.EMBEDDING_CHUNK_OVERLAP
+            )):
+                chunks.append((chunk, {"page": page_no, "chunk": chunk_no, "source": file_path}))
+        return chunks
+
+    def _encode_and_add(self, writer: IncrementalIndexWriter, texts: List[str]):
+        """编码一批文本块并写入索引，在专用线程中执行"""
+        vectors = self.model.encode(
+            texts,
+            batch_size=settings.EMBEDDING_ENCODE_BATCH_SIZE,
+            convert_to_numpy=True
+        )
+        writer.add(vectors.astype('float32'))
+
+    async def create_embeddings(
+        self,
+        file_path: str,
+        index_dir: str,
+        progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Dict:
+        """从文件创建向量索引
+
+        页面提取、切块、编码和写索引按流水线进行：提取在进程池中并行，
+        每提取完一段页面就切块，攒满一个批次就编码并增量写入索引。
+        """
         try:
-            # 读取 PDF 文件内容
-            text_chunks = []
-            with open(file_path, 'rb') as f:
-                pdf_reader = PyPDF2.PdfReader(f)
-                for page in pdf_reader.pages:
-                    text_chunks.append(page.extract_text())
-            
-            # 创建索引
-            index = self._create_index()
-            
-            # 使用 SentenceTransformer 生成向量
-            vectors = self.model.encode(text_chunks)
-            vectors = vectors.astype('float32')  # 确保类型正确
-            
-            # 添加向量到索引
-            index.add(vectors)
-            
+            loop = asyncio.get_running_loop()
+            pdf_pool = _get_pdf_pool()
+            batch_size = settings.EMBEDDING_ENCODE_BATCH_SIZE
+
+            total_pages = await loop.run_in_executor(pdf_pool, _count_pages, file_path)
+            pages_per_task = settings.EMBEDDING_PAGES_PER_TASK
+            extract_tasks = [
+                loop.run_in_executor(pdf_pool, _extract_pages, file_path, start, min(start + pages_per_task, total_pages))
+                for start in range(0, total_pages, pages_per_task)
+            ]
+
+            progress = {"file": file_path, "pages_total": total_pages, "pages_done": 0, "chunks_embedded": 0}
+
+            def report(stage: str):
+                progress["stage"] = stage
+                logger.info(
+                    f"Embedding {Path(file_path).name}: {stage} "
+                    f"pages {progress['pages_done']}/{total_pages}, chunks {progress['chunks_embedded']}"
+                )
+                if progress_callback:
+                    progress_callback(dict(progress))
+
+            writer: Optional[IncrementalIndexWriter] = None
+            documents = {}
+            pending: List[Tuple[str, dict]] = []
+
+            async def flush(chunks: List[Tuple[str, dict]]):
+                await loop.run_in_executor(_encode_executor, self._encode_and_add, writer, [text for text, _ in chunks])
+                for text, metadata in chunks:
+                    documents[str(len(documents))] = {"text": text, "metadata": metadata}
+                progress["chunks_embedded"] = len(documents)
+
+            # 按页码顺序消费提取结果，编码与后续页面的提取重叠进行
+            for task in extract_tasks:
+                pages = await task
+                chunks = await loop.run_in_executor(_encode_executor, self._chunk_pages, pages, file_path)
+                progress["pages_done"] += len(pages)
+                pending.extend(chunks)
+
+                if writer is None and chunks:
+                    # 用第一段页面的切块密度估算全文块数，据此选择索引类型
+                    estimated = int(len(chunks) / len(pages) * total_pages)
+                    writer = IncrementalIndexWriter(self.dimension, estimated)
+
+                while len(pending) >= batch_size:
+                    batch, pending = pending[:batch_size], pending[batch_size:]
+                    await flush(batch)
+                report("embedding")
+
+            if writer is None:
+                raise ValueError("PDF 中没有可提取的文本")
+            if pending:
+                await flush(pending)
+
+            index = await loop.run_in_executor(_encode_executor, writer.finish)
+
             # 生成文件 ID
             file_hash = hashlib.md5(file_path.encode()).hexdigest()
             index_id = f"index_{file_hash}"
-            
-            # 创建文档数据
-            documents = {}
-            for i, text in enumerate(text_chunks):
-                documents[str(i)] = {
-                    "text": text,
-                    "metadata": {
-                        "page": i + 1,
-                        "source": file_path
-                    }
-                }
-            
+
             # 保存索引和文档数据
-            self._save_index(file_hash, index, documents)
-            
+            await asyncio.to_thread(self._save_index, file_hash, index, documents)
+            report("done")
+
             return {
                 "status": "success",
                 "index_id": index_id,
-                "chunks": len(text_chunks)
+                "chunks": len(documents),
+                "pages": total_pages
             }
-            
+
         except Exception as e:
             raise Exception(f"创建向量失败: {str(e)}")
     
     def _save_index(self, file_id: str, index: faiss.Index, documents: dict):
         """保存索引和文档数据"""
         try:
-            # 使用安全的文件名
-            index_path = self.index_dir / f"index_{file_id}.bin"  # 这里添加了 "index_" 前缀
-            docs_path = self.index_dir / f"docs_{file_id}.json"
-            
-            
-            # 保存 FAISS 索引
-            faiss.write_index(index, str(index_path))
-            
-            # 保存文档数据
-            with open(docs_path, 'w', encoding='utf-8') as f:
-                json.dump(documents, f, ensure_ascii=False, indent=2)
-                
+            # 文档写入 SQLite 侧车文件，索引写入 index_{file_id}.bin
+            self.index_manager.save(
+                f"index_{file_id}",
+                index,
+                ((int(i), doc["text"], doc["metadata"]) for i, doc in documents.items())
+            )
         except Exception as e:
             raise Exception(f"保存索引失败: {str(e)}")
     
     def _load_index(self, index_id: str):
         """加载索引和文档数据"""
         try:
-            # 保持与保存时相同的文件名格式
-            index_path = self.index_dir / f"{index_id}.bin"  # 这里没有添加 "index_" 前缀，因为 index_id 已经包含了
-            docs_path = self.index_dir / f"docs_{index_id.replace('index_', '')}.json"
-            
-            
-            if not index_path.exists() or not docs_path.exists():
-                # 尝试旧的文件名格式
-                old_index_path = self.index_dir / f"index_{index_id}.bin"
-                old_docs_path = self.index_dir / f"docs_{index_id}.json"
-                
-                if old_index_path.exists() and old_docs_path.exists():
-                    index_path = old_index_path
-                    docs_path = old_docs_path
-                else:
-                    raise FileNotFoundError(f"找不到索引文件: {index_id}")
-            
-            # 加载索引
-            self.current_index = faiss.read_index(str(index_path))
+            # 管理器会复用已打开的索引，旧版 JSON 文档会被自动迁移到 SQLite
+            index, store = self.index_manager.get(index_id)
             
             # 验证索引维度
-            if self.current_index.d != self.dimension:
-                raise ValueError(f"索引维度不匹配: 期望 {self.dimension}, 实际 {self.current_index.d}")
-            
-            # 加载文档数据
-            with open(docs_path, 'r', encoding='utf-8') as f:
-                self.current_documents = json.load(f)
+            if index.d != self.dimension:
+                raise ValueError(f"索引维度不匹配: 期望 {self.dimension}, 实际 {index.d}")
             
             # 验证是否有数据
-            if not self.current_documents:
+            document_count = store.count()
+            if not document_count:
                 raise ValueError("文档数据为空")
             
-            print(f"成功加载索引 {index_id}: {self.current_index.ntotal} 个向量, {len(self.current_documents)} 个文档")
+            self.current_index_id = index_id
+            logger.info(f"成功加载索引 {index_id}: {index.ntotal} 个向量, {document_count} 个文档")
             
         except Exception as e:
-            self.current_index = None
-            self.current_documents = {}
+            self.current_index_id = None
             raise Exception(f"加载索引失败: {str(e)}")
     
-    async def search(self, query: str, top_k: int = 3) -> List[dict]:
+    async def search(self, query: str, top_k: int = 3, index_id: Optional[str] = None) -> List[dict]:
         """搜索最相关的文档片段"""
         try:
-            if not self.current_index:
+            index_id = index_id or self.current_index_id
+            if not index_id:
                 raise Exception("未加载索引")
             
-            # 生成查询向量
-            query_vector = self.model.encode([query], convert_to_tensor=False)
-            query_vector = query_vector.astype('float32')
-            
-            # 搜索最相似的向量
-            distances, indices = self.current_index.search(query_vector, top_k)
-            
-            # 返回结果
-            results = []
-            for i in range(len(indices[0])):
-                idx_str = str(int(indices[0][i]))
-                if idx_str in self.current_documents:
-                    results.append({
-                        "score": float(distances[0][i]),
-                        "content": self.current_documents[idx_str]["text"],
-                        "metadata": self.current_documents[idx_str]["metadata"]
-                    })
+            # 生成查询向量，放到线程中执行避免阻塞事件循环
+            query_vector = await asyncio.to_thread(self.model.encode, [query], convert_to_tensor=False)
             
-            return results
+            # 在线程池中搜索最相似的向量，不同索引的查询互不阻塞
+            return await self.index_manager.asearch(index_id, query_vector, top_k)
                 
         except Exception as e:
             raise Exception(f"搜索失败: {str(e)}") 
\ No newline at end of file
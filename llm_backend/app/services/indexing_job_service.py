@@ -0,0 +1,290 @@
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+import asyncio
+import json
+import multiprocessing
+import queue
+import time
+import uuid
+
+from sqlalchemy import select, update
+from graphrag.callbacks.noop_workflow_callbacks import NoopWorkflowCallbacks
+from graphrag.logger.progress import Progress
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, engine
+from app.core.logger import get_logger
+from app.models.indexing_job import IndexingJob, JobStatus
+
+logger = get_logger(service="indexing_jobs")
+
+# 子进程使用 spawn 启动，不继承父进程的事件循环、数据库连接池和 Redis 连接
+_mp_context = multiprocessing.get_context("spawn")
+
+
+class JobProgressCallbacks(NoopWorkflowCallbacks):
+    """把 build_index 的 workflow 回调换算成整体进度，经队列发回父进程"""
+
+    def __init__(self, job_id: str, progress_queue):
+        self.job_id = job_id
+        self.queue = progress_queue
+        self.total = 0
+        self.completed = 0
+        self.stage: Optional[str] = None
+        self._last_sent = -1.0
+
+    def _send(self, fraction: float, force: bool = False):
+        progress = min(fraction, 1.0)
+        # 子 workflow 的 progress 回调非常频繁，只在变化超过 1% 或切换阶段时上报
+        if not force and progress - self._last_sent < 0.01:
+            return
+        self._last_sent = progress
+        self.queue.put(("progress", {"progress": progress, "stage": self.stage}))
+
+    def pipeline_start(self, names: list[str]) -> None:
+        self.total = len(names)
+
+    def workflow_start(self, name: str, instance: object) -> None:
+        self.stage = name
+        self._send(self.completed / self.total if self.total else 0.0, force=True)
+
+    def workflow_end(self, name: str, instance: object) -> None:
+        self.completed += 1
+        self._send(self.completed / self.total if self.total else 0.0, force=True)
+
+    def progress(self, progress: Progress) -> None:
+        if not self.total or progress.percent is None:
+            return
+        self._send((self.completed + progress.percent) / self.total)
+
+
+def _run_job(job_id: str, file_info: Dict[str, Any], progress_queue):
+    """子进程入口：在独立进程中运行 build_index"""
+    from app.services.indexing_service import IndexingService
+
+    try:
+        callbacks = JobProgressCallbacks(job_id, progress_queue)
+        result = asyncio.run(IndexingService().process_file(file_info, callbacks=[callbacks]))
+    except BaseException as e:
+        result = {"status": "error", "error": str(e)}
+    # 结果里可能带有异常对象，先序列化再跨进程传递
+    progress_queue.put(("result", json.dumps(result, ensure_ascii=False, default=str)))
+
+
+def job_to_dict(job: IndexingJob) -> Dict[str, Any]:
+    return {
+        "job_id": job.id,
+        "user_id": job.user_id,
+        "original_name": job.original_name,
+        "status": job.status,
+        "progress": job.progress,
+        "stage": job.stage,
+        "error": job.error,
+        "result": json.loads(job.result) if job.result else None,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+class IndexingJobManager:
+    """GraphRAG 索引任务队列
+
+    - 上传接口只负责落盘和登记任务，立即返回 job_id
+    - 任务状态持久化在 indexing_jobs 表中，服务重启后未完成的任务重新排队
+    - 最多 INDEXING_MAX_WORKERS 个任务同时运行，每个任务在独立进程中执行 build_index，
+      不占用 API 进程的事件循环和 CPU
+    - 运行中的任务通过终止子进程取消
+    """
+
+    def __init__(self, max_workers: int = None):
+        self.max_workers = max_workers or settings.INDEXING_MAX_WORKERS
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._workers: List[asyncio.Task] = []
+        self._processes: Dict[str, multiprocessing.Process] = {}
+        self._cancelled: set = set()
+
+    async def start(self):
+        if self._workers:
+            return
+        async with engine.begin() as conn:
+            await conn.run_sync(IndexingJob.__table__.create, checkfirst=True)
+
+        # 上次退出时没有跑完的任务重新排队
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(IndexingJob.id)
+                .where(IndexingJob.status.in_([JobStatus.QUEUED.value, JobStatus.RUNNING.value]))
+                .order_by(IndexingJob.created_at)
+            )
+            pending = [row[0] for row in result.all()]
+        for job_id in pending:
+            await self._update(job_id, status=JobStatus.QUEUED.value, progress=0.0, stage=None)
+            self._queue.put_nowait(job_id)
+        if pending:
+            logger.info(f"Re-queued {len(pending)} unfinished indexing jobs")
+
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_workers)]
+        logger.info(f"Indexing job manager started with {self.max_workers} workers")
+
+    async def stop(self):
+        running = dict(self._processes)
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        # 被中断的任务保持 queued 状态，下次启动时重新执行
+        for job_id, process in running.items():
+            process.terminate()
+            await asyncio.to_thread(process.join, 5)
+            await self._update(job_id, status=JobStatus.QUEUED.value, progress=0.0, stage=None)
+
+    async def submit(self, file_info: Dict[str, Any]) -> str:
+        """登记一个索引任务并排队"""
+        job_id = str(uuid.uuid4())
+        async with AsyncSessionLocal() as db:
+            db.add(IndexingJob(
+                id=job_id,
+                user_id=file_info.get("user_id", 0),
+                file_path=file_info["path"],
+                original_name=file_info.get("original_name"),
+                status=JobStatus.QUEUED.value,
+                progress=0.0
+            ))
+            await db.commit()
+        self._queue.put_nowait(job_id)
+        logger.info(f"Queued indexing job {job_id} for {file_info['path']}")
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[IndexingJob]:
+        async with AsyncSessionLocal() as db:
+            return await db.get(IndexingJob, job_id)
+
+    async def list_jobs(self, user_id: int, limit: int = 50) -> List[IndexingJob]:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(IndexingJob)
+                .where(IndexingJob.user_id == user_id)
+                .order_by(IndexingJob.created_at.desc())
+                .limit(limit)
+            )
+            return list(result.scalars().all())
+
+    async def cancel(self, job_id: str) -> Optional[IndexingJob]:
+        """取消任务：排队中的直接标记，运行中的终止子进程"""
+        job = await self.get(job_id)
+        if job is None or JobStatus(job.status).finished:
+            return job
+        self._cancelled.add(job_id)
+        process = self._processes.get(job_id)
+        if process is not None:
+            process.terminate()
+        await self._update(job_id, status=JobStatus.CANCELLED.value, finished_at=datetime.now())
+        logger.info(f"Cancelled indexing job {job_id}")
+        return await self.get(job_id)
+
+    async def _update(self, job_id: str, expected_status: Optional[str] = None, **values) -> int:
+        """更新任务字段，指定 expected_status 时只在状态仍为该值时更新，返回更新的行数"""
+        stmt = update(IndexingJob).where(IndexingJob.id == job_id)
+        if expected_status is not None:
+            stmt = stmt.where(IndexingJob.status == expected_status)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(stmt.values(**values))
+            await db.commit()
+            return result.rowcount
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Indexing job {job_id} failed: {str(e)}", exc_info=True)
+                await self._update(job_id, status=JobStatus.ERROR.value, error=str(e), finished_at=datetime.now())
+            finally:
+                self._processes.pop(job_id, None)
+                self._cancelled.discard(job_id)
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        job = await self.get(job_id)
+        if job is None or job.status != JobStatus.QUEUED.value or job_id in self._cancelled:
+            return
+
+        file_info = {
+            "path": job.file_path,
+            "original_name": job.original_name,
+            "user_id": job.user_id,
+        }
+        progress_queue = _mp_context.Queue()
+        process = _mp_context.Process(target=_run_job, args=(job_id, file_info, progress_queue), daemon=True)
+        process.start()
+        self._processes[job_id] = process
+        # 与 cancel() 并发时，只有任务仍在排队才标记为运行中，避免覆盖已写入的 CANCELLED
+        started = await self._update(
+            job_id, expected_status=JobStatus.QUEUED.value, status=JobStatus.RUNNING.value, started_at=datetime.now()
+        )
+        if not started:
+            process.terminate()
+            await asyncio.to_thread(process.join)
+            logger.info(f"Indexing job {job_id} was cancelled before it started")
+            return
+        logger.info(f"Started indexing job {job_id} in process {process.pid}")
+
+        result = None
+        last_write = 0.0
+        while True:
+            # 先取完队列中的消息再判断进程是否退出，避免丢掉最后的结果
+            messages = _drain(progress_queue)
+            for kind, payload in messages:
+                if kind == "result":
+                    result = payload
+                elif kind == "progress" and time.monotonic() - last_write >= settings.INDEXING_PROGRESS_INTERVAL:
+                    last_write = time.monotonic()
+                    if job_id not in self._cancelled:
+                        await self._update(job_id, **payload)
+            if not messages and not process.is_alive():
+                break
+            if not messages:
+                await asyncio.sleep(0.2)
+
+        await asyncio.to_thread(process.join)
+        if job_id in self._cancelled:
+            return
+
+        if result is None:
+            await self._update(
+                job_id,
+                expected_status=JobStatus.RUNNING.value,
+                status=JobStatus.ERROR.value,
+                error=f"Indexing process exited with code {process.exitcode}",
+                finished_at=datetime.now()
+            )
+            return
+
+        result_info = json.loads(result)
+        status = result_info.get("status")
+        if status == "success":
+            values = {"status": JobStatus.SUCCESS.value, "progress": 1.0}
+        else:
+            values = {"status": JobStatus.ERROR.value, "error": str(result_info.get("error") or result_info.get("errors"))}
+        await self._update(job_id, expected_status=JobStatus.RUNNING.value, result=result, finished_at=datetime.now(), **values)
+        logger.info(f"Indexing job {job_id} finished with status {status}")
+        if status == "success" and not result_info.get("skipped"):
+            # 索引在子进程中写入，由父进程清空本进程的 Cypher 查询结果缓存
+            from app.lg_agent.kg_sub_graph.kg_cypher_cache import cypher_cache
+            cypher_cache.invalidate(statements=False)
+
+
+def _drain(progress_queue) -> list:
+    messages = []
+    while True:
+        try:
+            messages.append(progress_queue.get_nowait())
+        except queue.Empty:
+            return messages
+
+
+indexing_job_manager = IndexingJobManager()
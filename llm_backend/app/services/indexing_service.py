@@ -2,14 +2,19 @@ import os
 import asyncio
 import logging
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Set, Tuple
 import mimetypes
 import shutil
 import uuid
+import hashlib
+import json
+import re
 
+import pandas as pd
 import graphrag.api as api
 from graphrag.config.load_config import load_config
 from graphrag.config.enums import IndexingMethod
+from graphrag.callbacks.workflow_callbacks import WorkflowCallbacks
 from graphrag.logger.rich_progress import RichProgressLogger
 from graphrag.index.typing.pipeline_run_result import PipelineRunResult
 
@@ -27,6 +32,8 @@ class IndexingService:
 
         # 默认配置文件
         self.default_config = 'settings.yaml'
+        # 文件类型 -> 配置文件，未列出的类型使用默认配置
+        self.config_mapping: Dict[str, str] = {}
         
     def _get_file_type(self, file_path: str) -> str:
         """获取文件MIME类型"""
@@ -37,12 +44,6 @@ class IndexingService:
         """根据文件类型获取对应的配置文件"""
         return self.config_mapping.get(file_type, self.default_config)
     
-    def _check_existing_index(self, file_path: str, output_dir: str) -> bool:
-        """检查文件是否已经建立索引"""
-        file_name = Path(file_path).stem
-        index_path = os.path.join(output_dir, f"{file_name}_index")
-        return os.path.exists(index_path)
-    
     def _prepare_user_directories(self, user_id: int) -> tuple:
         """为用户准备输入和输出目录"""
         # 生成用户UUID
@@ -58,10 +59,20 @@ class IndexingService:
         
         return user_input_dir, user_output_dir
     
-    def _copy_file_to_input_dir(self, file_path: str, input_dir: str) -> str:
+    @staticmethod
+    def _input_name(file_path: str, base_dir: Optional[str] = None) -> str:
+        """文件在输入目录中的名称，也是清单的键
+
+        单个文件用文件名；批量处理目录时子目录中的文件用相对路径（分隔符换成 "__"）区分同名文件，
+        顶层文件与单独上传时的名称一致。
+        """
+        if base_dir is None:
+            return os.path.basename(file_path)
+        return os.path.relpath(file_path, base_dir).replace(os.sep, "__")
+
+    def _copy_file_to_input_dir(self, file_path: str, input_dir: str, input_name: Optional[str] = None) -> str:
         """将文件复制到用户的输入目录"""
-        file_name = os.path.basename(file_path)
-        dest_path = os.path.join(input_dir, file_name)
+        dest_path = os.path.join(input_dir, input_name or self._input_name(file_path))
         
         # 复制文件
         shutil.copy2(file_path, dest_path)
@@ -69,8 +80,140 @@ class IndexingService:
         
         return dest_path
     
-    async def process_file(self, file_info: Dict[str, Any]) -> Dict[str, Any]:
-        """处理单个文件的索引构建"""
+    @staticmethod
+    def _file_hash(file_path: str) -> str:
+        """按块计算文件内容的 SHA-256"""
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    @staticmethod
+    def _manifest_path(output_dir: str) -> str:
+        return os.path.join(output_dir, "indexed_files.json")
+    
+    def _load_manifest(self, output_dir: str) -> Dict[str, str]:
+        """读取已建索引文件的 {文件名: 内容哈希}"""
+        path = self._manifest_path(output_dir)
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    
+    def _save_manifest(self, output_dir: str, entries: Dict[str, str]):
+        manifest = self._load_manifest(output_dir)
+        manifest.update(entries)
+        self._write_manifest(output_dir, manifest)
+    
+    def _write_manifest(self, output_dir: str, manifest: Dict[str, str]):
+        tmp_path = self._manifest_path(output_dir) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self._manifest_path(output_dir))
+    
+    @staticmethod
+    def _has_index(output_dir: str) -> bool:
+        """输出目录中已有完整索引时走增量更新"""
+        return os.path.exists(os.path.join(output_dir, "documents.parquet"))
+    
+    @staticmethod
+    def _indexed_titles(output_dir: str) -> Set[str]:
+        """索引 documents 表中的文档标题，GraphRAG 以输入文件名作为标题"""
+        path = os.path.join(output_dir, "documents.parquet")
+        if not os.path.exists(path):
+            return set()
+        return set(pd.read_parquet(path, columns=["title"])["title"])
+    
+    @staticmethod
+    def _file_pattern(names: List[str]) -> str:
+        """只匹配给定输入文件名的 file_pattern"""
+        return r"(^|[\\/])(" + "|".join(re.escape(name) for name in names) + ")$"
+    
+    def _plan_run(self, input_dir: str, output_dir: str, names: List[str]) -> Tuple[bool, List[str]]:
+        """决定增量更新还是全量重建，返回 (is_update, 本次运行读取的输入文件名)
+
+        GraphRAG 增量更新只按标题（文件名）识别新文档，索引中已有的文件名即使内容变了也会被跳过。
+        本次的文件中有索引里已有的文件名时，用输入目录中已建索引的文件加上本次的文件全量重建。
+        """
+        if not self._has_index(output_dir):
+            return False, names
+        titles = self._indexed_titles(output_dir)
+        if not titles.intersection(names):
+            return True, names
+        previous = [
+            name for name in dict.fromkeys([*self._load_manifest(output_dir), *sorted(titles)])
+            if name not in names and os.path.exists(os.path.join(input_dir, name))
+        ]
+        return False, previous + names
+    
+    async def _record_indexed(self, output_dir: str, entries: Dict[str, str], is_update: bool) -> List[str]:
+        """只把确实写入 documents 表的文件记入清单，返回没有写入的文件名
+
+        全量重建后清单只保留重建结果中的文件。
+        """
+        titles = await asyncio.to_thread(self._indexed_titles, output_dir)
+        manifest = self._load_manifest(output_dir)
+        if not is_update:
+            manifest = {name: file_hash for name, file_hash in manifest.items() if name in titles}
+        manifest.update({name: file_hash for name, file_hash in entries.items() if name in titles})
+        self._write_manifest(output_dir, manifest)
+        missing = [name for name in entries if name not in titles]
+        if missing:
+            logger.error(f"以下文件没有写入索引，未记入清单: {missing}")
+        return missing
+    
+    def _resolve_config_path(self, config_file: str) -> str:
+        config_path = os.path.join(self.data_dir, config_file)
+        if not os.path.exists(config_path):
+            logger.warning(f"配置文件不存在: {config_path}，使用默认配置")
+            config_path = os.path.join(self.data_dir, self.default_config)
+        return config_path
+    
+    async def _run_pipeline(
+        self,
+        config_path: str,
+        input_dir: str,
+        output_dir: str,
+        file_pattern: str,
+        is_update: bool,
+        callbacks: Optional[List[WorkflowCallbacks]] = None
+    ) -> List[Any]:
+        """执行一次 build_index，返回各 workflow 的错误列表"""
+        config_overrides = {
+            'input.base_dir': input_dir,
+            'output.base_dir': output_dir,
+            'input.file_pattern': file_pattern,
+            'input.concurrent_files': settings.INDEXING_PARSE_CONCURRENCY
+        }
+        graphrag_config = load_config(
+            Path(self.data_dir),
+            Path(config_path),
+            config_overrides
+        )
+        index_result = await api.build_index(
+            config=graphrag_config,
+            method=IndexingMethod.Standard,
+            is_update_run=is_update,
+            memory_profile=False,
+            callbacks=callbacks,
+            progress_logger=RichProgressLogger(prefix="graphrag-index")
+        )
+        errors = []
+        for workflow_result in index_result:
+            if workflow_result.errors:
+                errors.extend(workflow_result.errors)
+        return errors
+    
+    async def process_file(
+        self,
+        file_info: Dict[str, Any],
+        callbacks: Optional[List[WorkflowCallbacks]] = None
+    ) -> Dict[str, Any]:
+        """处理单个文件的索引构建
+
+        callbacks 会传给 api.build_index，用于上报各 workflow 的进度
+        """
         try:
             file_path = file_info['path']
             file_type = self._get_file_type(file_path)
@@ -81,52 +224,56 @@ class IndexingService:
             # 准备用户目录
             user_input_dir, user_output_dir = self._prepare_user_directories(user_id)
             
+            # 内容已经建过索引时跳过，不再复制和运行流水线
+            input_name = self._input_name(file_path)
+            file_hash = await asyncio.to_thread(self._file_hash, file_path)
+            manifest = self._load_manifest(user_output_dir)
+            if manifest.get(input_name) == file_hash or file_hash in manifest.values():
+                logger.info(f"文件内容未变化，跳过索引构建: {file_path}")
+                return {
+                    'original_file_path': file_path,
+                    'input_file_path': os.path.join(user_input_dir, input_name),
+                    'file_type': file_type,
+                    'status': 'success',
+                    'skipped': True,
+                    'user_id': user_id,
+                    'input_dir': user_input_dir,
+                    'output_dir': user_output_dir
+                }
+            
             # 复制文件到输入目录
-            input_file_path = self._copy_file_to_input_dir(file_path, user_input_dir)
+            input_file_path = self._copy_file_to_input_dir(file_path, user_input_dir, input_name)
             
             # 获取配置文件
             config_file = self._get_config_file(file_type)
             logger.info(f"使用配置文件: {config_file}")
             
-            # 检查是否需要增量更新
-            is_update = self._check_existing_index(input_file_path, user_output_dir)
-            
-            # 准备配置
-            config_path = os.path.join(self.data_dir, config_file)
-            if not os.path.exists(config_path):
-                logger.warning(f"配置文件不存在: {config_path}，使用默认配置")
-                config_path = os.path.join(self.data_dir, self.default_config)
-            
-            # 设置配置覆盖
-            config_overrides = {
-                'input.base_dir': user_input_dir,
-                'output.base_dir': user_output_dir,
-                # 更新文件匹配模式以匹配文件名
-                'input.file_pattern': f".*{os.path.basename(input_file_path)}$$"
-            }
-            
-            # 加载配置
-            graphrag_config = load_config(
-                Path(self.data_dir),
-                Path(config_path),
-                config_overrides
+            # 新文件名走增量更新，索引中已有同名文件时全量重建
+            is_update, run_names = await asyncio.to_thread(
+                self._plan_run, user_input_dir, user_output_dir, [input_name]
             )
             
-            # 创建进度记录器
-            progress_logger = RichProgressLogger(prefix="graphrag-index")
+            # 准备配置
+            config_path = self._resolve_config_path(config_file)
             
             logger.info(f"开始{'增量更新' if is_update else '构建'}索引: {input_file_path}")
             logger.info(f"输入目录: {user_input_dir}")
             logger.info(f"输出目录: {user_output_dir}")
             
-            # 执行索引构建
-            index_result = await api.build_index(
-                config=graphrag_config,
-                method=IndexingMethod.Standard,
-                is_update_run=is_update,
-                memory_profile=False,
-                progress_logger=progress_logger
+            # 执行索引构建，增量更新时文件匹配模式只匹配当前文件
+            errors = await self._run_pipeline(
+                config_path,
+                user_input_dir,
+                user_output_dir,
+                self._file_pattern(run_names),
+                is_update,
+                callbacks
             )
+            if not errors:
+                # 记入清单，批量处理目录时跳过未修改的文件
+                missing = await self._record_indexed(user_output_dir, {input_name: file_hash}, is_update)
+                if missing:
+                    errors = [f"文件没有写入索引: {name}" for name in missing]
             
             # 处理结果
             result_info = {
@@ -142,11 +289,10 @@ class IndexingService:
             }
             
             # 检查是否有错误
-            for workflow_result in index_result:
-                if workflow_result.errors:
-                    result_info['status'] = 'error'
-                    result_info['errors'] = workflow_result.errors
-                    logger.error(f"索引构建失败: {workflow_result.errors}")
+            if errors:
+                result_info['status'] = 'error'
+                result_info['errors'] = errors
+                logger.error(f"索引构建失败: {errors}")
             
             return result_info
             
@@ -158,25 +304,112 @@ class IndexingService:
                 'error': str(e)
             }
     
-    async def process_directory(self, directory_path: str, user_id: int = 0) -> Dict[str, Any]:
-        """处理整个目录的索引构建"""
+    async def _stage_file(self, file_path: str, input_name: str, file_hash: str, input_dir: str) -> str:
+        """把需要建索引的文件复制到输入目录，内容相同的已有文件不再复制，返回输入文件路径"""
+        dest_path = os.path.join(input_dir, input_name)
+        if not os.path.exists(dest_path) or await asyncio.to_thread(self._file_hash, dest_path) != file_hash:
+            await asyncio.to_thread(shutil.copy2, file_path, dest_path)
+        return dest_path
+    
+    async def process_directory(
+        self,
+        directory_path: str,
+        user_id: int = 0,
+        callbacks: Optional[List[WorkflowCallbacks]] = None
+    ) -> Dict[str, Any]:
+        """批量处理整个目录的索引构建
+
+        1. 按内容哈希跳过已经建过索引且未修改的文件，目录内内容相同的文件只处理一次，跳过的文件不复制到输入目录
+        2. 哈希计算和复制在有界并发中执行
+        3. 新文件按配置文件分组，每组只运行一次 build_index（已有索引时为一次增量更新，
+           有内容变化的同名文件时为一次全量重建），不再每个文件各跑一遍完整流水线
+        4. 运行后只把确实写入 documents 表的文件记入清单
+        """
         try:
-            results = []
+            user_input_dir, user_output_dir = self._prepare_user_directories(user_id)
+            manifest = self._load_manifest(user_output_dir)
+
+            file_paths = []
             for root, _, files in os.walk(directory_path):
                 for file in files:
                     file_path = os.path.join(root, file)
-                    file_info = {
-                        'path': file_path,
-                        'original_name': file,
-                        'user_id': user_id
-                    }
-                    result = await self.process_file(file_info)
-                    results.append(result)
-            
+                    file_paths.append((file_path, self._input_name(file_path, directory_path)))
+
+            semaphore = asyncio.Semaphore(settings.INDEXING_PARSE_CONCURRENCY)
+
+            async def hash_file(file_path: str) -> str:
+                async with semaphore:
+                    return await asyncio.to_thread(self._file_hash, file_path)
+
+            hashes = await asyncio.gather(*(hash_file(path) for path, _ in file_paths))
+
+            # 先按哈希决定跳过哪些文件，只复制需要建索引的文件
+            to_stage: List[Tuple[str, str, str]] = []
+            seen_hashes = set(manifest.values())
+            skipped = []
+            for (file_path, name), file_hash in zip(file_paths, hashes):
+                if manifest.get(name) == file_hash or file_hash in seen_hashes:
+                    skipped.append(name)
+                    continue
+                seen_hashes.add(file_hash)
+                to_stage.append((file_path, name, file_hash))
+
+            async def stage(file_path: str, name: str, file_hash: str) -> str:
+                async with semaphore:
+                    return await self._stage_file(file_path, name, file_hash, user_input_dir)
+
+            input_paths = await asyncio.gather(*(stage(*item) for item in to_stage))
+
+            # 按配置文件分组需要建索引的文件
+            groups: Dict[str, Dict[str, str]] = {}
+            for (_, name, file_hash), input_path in zip(to_stage, input_paths):
+                config_file = self._get_config_file(self._get_file_type(input_path))
+                groups.setdefault(config_file, {})[name] = file_hash
+
+            logger.info(f"目录 {directory_path}: 共 {len(file_paths)} 个文件，跳过 {len(skipped)} 个未修改的文件")
+
+            results = []
+            for config_file, entries in groups.items():
+                # 新文件名走增量更新，有内容变化的同名文件时全量重建
+                is_update, run_names = await asyncio.to_thread(
+                    self._plan_run, user_input_dir, user_output_dir, list(entries)
+                )
+                logger.info(f"开始{'增量更新' if is_update else '构建'}索引: {len(run_names)} 个文件, 配置: {config_file}")
+
+                errors = await self._run_pipeline(
+                    self._resolve_config_path(config_file),
+                    user_input_dir,
+                    user_output_dir,
+                    self._file_pattern(run_names),
+                    is_update,
+                    callbacks
+                )
+                if not errors:
+                    # 只有确实写入索引的文件才记入清单
+                    missing = await self._record_indexed(user_output_dir, entries, is_update)
+                    if missing:
+                        errors = [f"文件没有写入索引: {name}" for name in missing]
+                result_info = {
+                    'files': list(entries),
+                    'config_used': config_file,
+                    'is_update': is_update,
+                    'status': 'success'
+                }
+                if errors:
+                    result_info['status'] = 'error'
+                    result_info['errors'] = errors
+                    logger.error(f"索引构建失败: {errors}")
+                results.append(result_info)
+
             return {
-                'status': 'success',
-                'processed_files': len(results),
-                'results': results
+                'status': 'error' if any(r['status'] == 'error' for r in results) else 'success',
+                'processed_files': sum(len(r['files']) for r in results),
+                'skipped_files': skipped,
+                'pipeline_runs': len(results),
+                'results': results,
+                'user_id': user_id,
+                'input_dir': user_input_dir,
+                'output_dir': user_output_dir
             }
             
         except Exception as e:
@@ -184,4 +417,4 @@ class IndexingService:
             return {
                 'status': 'error',
                 'error': str(e)
-            }
\ No newline at end of file
+            }
@@ -1,225 +1,602 @@
-from typing import Dict, List, Optional
-import redis
-import hashlib
-import numpy as np
-import json
-import time
-import aiohttp
-import openai
-from app.core.config import settings
-from app.core.logger import get_logger
-import asyncio
-from datetime import datetime
-
-logger = get_logger(service="redis_cache")
-
-class RedisSemanticCache:
-    """基于语义的 Redis 缓存实现"""
-    
-    def __init__(
-        self,
-        redis_url: str = None,
-        model_name: str = None,
-        score_threshold: float = None,
-        prefix: str = "cache",
-        user_id: Optional[int] = None,  # 添加用户ID
-        max_cache_size: int = 1000,  # 每个用户最大缓存条数
-        cleanup_interval: int = 3600  # 清理间隔(秒)
-    ):
-        self.redis = redis.from_url(redis_url or settings.REDIS_URL)
-        self.model_name = model_name or settings.EMBEDDING_MODEL
-        self.score_threshold = score_threshold or settings.REDIS_CACHE_THRESHOLD
-        self.prefix = f"{prefix}:{user_id}" if user_id else prefix
-        self.max_cache_size = max_cache_size
-        self.cleanup_interval = cleanup_interval
-
-        # 配置OpenAI客户端用于嵌入
-        self.embedding_client = openai.AsyncOpenAI(
-            api_key=settings.EMBEDDING_API_KEY,
-            base_url=settings.EMBEDDING_BASE_URL
-        )
-
-        # 启动自动清理任务
-        asyncio.create_task(self._auto_cleanup())
-        
-    async def _get_embedding(self, text: str) -> List[float]:
-        """使用OpenAI兼容API生成文本向量"""
-        try:
-            response = await self.embedding_client.embeddings.create(
-                model=self.model_name,
-                input=text
-            )
-            return response.data[0].embedding
-        except Exception as e:
-            logger.error(f"Error getting embedding: {str(e)}", exc_info=True)
-            # 如果API失败，尝试使用本地fallback（可选）
-            raise
-
-    async def get_embedding(self, text: str) -> List[float]:
-        """获取文本向量"""
-        try:
-            # 使用OpenAI兼容API的embedding接口
-            embedding = await self._get_embedding(text)
-            if not embedding:
-                raise ValueError("Failed to get embedding")
-            return embedding
-        except Exception as e:
-            logger.error(f"Error in get_embedding: {str(e)}", exc_info=True)
-            raise
-        
-    def _get_vector_key(self, message: str) -> str:
-        """生成向量存储的键名"""
-        message_hash = hashlib.md5(message.encode()).hexdigest()
-        return f"{self.prefix}:vec:{message_hash}"
-        
-    def _get_response_key(self, message: str) -> str:
-        """生成响应存储的键名"""
-        message_hash = hashlib.md5(message.encode()).hexdigest()
-        return f"{self.prefix}:resp:{message_hash}"
-        
-    def _get_metadata_key(self, message: str) -> str:
-        """生成元数据存储的键名"""
-        message_hash = hashlib.md5(message.encode()).hexdigest()
-        return f"{self.prefix}:meta:{message_hash}"
-
-    def _get_last_user_message(self, messages: List[Dict]) -> str:
-        """获取最后一条用户消息"""
-        for msg in reversed(messages):
-            if msg["role"] == "user":
-                return msg["content"]
-        return ""
-
-    async def _auto_cleanup(self):
-        """自动清理过期和超量的缓存"""
-        while True:
-            try:
-                # 获取当前用户的所有缓存键
-                pattern = f"{self.prefix}:meta:*"
-                all_keys = [key.decode('utf-8') for key in self.redis.keys(pattern)]  # 解码key
-                
-                if len(all_keys) > self.max_cache_size:
-                    # 按访问时间排序
-                    cache_items = []
-                    for key in all_keys:
-                        metadata = json.loads(self.redis.get(key.encode('utf-8')).decode('utf-8'))  # 编码key再获取
-                        cache_items.append((key, metadata.get("last_access", 0)))
-                    
-                    # 按最后访问时间排序
-                    cache_items.sort(key=lambda x: x[1])
-                    
-                    # 删除最旧的条目直到达到限制
-                    items_to_remove = len(all_keys) - self.max_cache_size
-                    for key, _ in cache_items[:items_to_remove]:
-                        hash_id = key.split(":")[-1]
-                        await self._remove_cache_item(hash_id)
-                        
-                logger.info(f"Cache cleanup completed for prefix {self.prefix}")
-                
-            except Exception as e:
-                logger.error(f"Error in cache cleanup: {str(e)}", exc_info=True)
-                
-            await asyncio.sleep(self.cleanup_interval)
-
-    async def _remove_cache_item(self, hash_id: str):
-        """删除一个缓存项的所有相关键"""
-        try:
-            # 所有key都需要编码
-            self.redis.delete(
-                f"{self.prefix}:vec:{hash_id}".encode('utf-8'),
-                f"{self.prefix}:resp:{hash_id}".encode('utf-8'),
-                f"{self.prefix}:meta:{hash_id}".encode('utf-8')
-            )
-        except Exception as e:
-            logger.error(f"Error removing cache item: {str(e)}", exc_info=True)
-
-    async def _update_metadata(self, message: str):
-        """更新缓存项的元数据"""
-        try:
-            meta_key = self._get_metadata_key(message)
-            # 从Redis读取的是bytes,需要解码
-            current_meta = self.redis.get(meta_key)
-            if current_meta:
-                current_meta = json.loads(current_meta.decode('utf-8'))
-            else:
-                current_meta = {"access_count": 0}
-                
-            metadata = {
-                "last_access": datetime.now().timestamp(),
-                "access_count": current_meta["access_count"] + 1
-            }
-            self.redis.set(meta_key, json.dumps(metadata), ex=settings.REDIS_CACHE_EXPIRE)
-        except Exception as e:
-            logger.error(f"Error updating metadata: {str(e)}", exc_info=True)
-
-    async def lookup(self, messages: List[Dict]) -> Optional[str]:
-        """查找缓存的响应"""
-        try:
-            user_message = self._get_last_user_message(messages)
-            if not user_message:
-                return None
-
-            current_vector = await self.get_embedding(user_message)
-            
-            # 获取当前用户的所有缓存向量
-            pattern = f"{self.prefix}:vec:*"
-            all_vectors = [key.decode('utf-8') for key in self.redis.keys(pattern)]  # 解码key
-            max_similarity = 0
-            most_similar_key = None
-            
-            for vec_key in all_vectors:
-                cached_vector = json.loads(self.redis.get(vec_key.encode('utf-8')).decode('utf-8'))  # 编码key再获取
-                similarity = np.dot(current_vector, cached_vector) / (
-                    np.linalg.norm(current_vector) * np.linalg.norm(cached_vector)
-                )
-                
-                if similarity > max_similarity:
-                    max_similarity = similarity
-                    most_similar_key = vec_key
-            
-            if max_similarity >= self.score_threshold and most_similar_key:
-                hash_id = most_similar_key.split(":")[-1]
-                resp_key = f"{self.prefix}:resp:{hash_id}"
-                cached_response = self.redis.get(resp_key.encode('utf-8'))  # 编码key
-                
-                if cached_response:
-                    # 更新访问元数据
-                    await self._update_metadata(user_message)
-                    logger.info(f"Cache hit with similarity: {max_similarity:.4f}")
-                    return cached_response.decode('utf-8')
-                    
-            return None
-            
-        except Exception as e:
-            logger.error(f"Error in lookup: {str(e)}", exc_info=True)
-            return None
-
-    async def update(self, messages: List[Dict], response: str, expire: int = None):
-        """更新缓存"""
-        try:
-            user_message = self._get_last_user_message(messages)
-            if not user_message:
-                return
-
-            vector = await self.get_embedding(user_message)
-            
-            vec_key = self._get_vector_key(user_message)
-            resp_key = self._get_response_key(user_message)
-            meta_key = self._get_metadata_key(user_message)
-            
-            expire = expire or settings.REDIS_CACHE_EXPIRE
-            
-            # 存储向量、响应和元数据 - 确保存储为字符串
-            self.redis.set(vec_key, json.dumps(vector), ex=expire)
-            self.redis.set(resp_key, response.encode('utf-8'), ex=expire)  # 编码为bytes
-            
-            metadata = {
-                "created_at": datetime.now().timestamp(),
-                "last_access": datetime.now().timestamp(),
-                "access_count": 1
-            }
-            self.redis.set(meta_key, json.dumps(metadata), ex=expire)
-            
-            logger.info(f"Cache updated for message: {user_message[:50]}...")
-            
-        except Exception as e:
-            logger.error(f"Error in update: {str(e)}", exc_info=True) 
\ No newline at end of file
+from typing import Dict, List, Optional, Tuple
+import redis.asyncio as aioredis
+from redis.exceptions import ResponseError
+from redis.commands.search.field import TagField, VectorField
+from redis.commands.search.query import Query
+try:
+    from redis.commands.search.index_definition import IndexDefinition, IndexType
+except ImportError:  # redis-py < 6
+    from redis.commands.search.indexDefinition import IndexDefinition, IndexType
+import hashlib
+import re
+import numpy as np
+import time
+import threading
+import openai
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.services.embedding_batcher import EmbeddingBatcher
+import asyncio
+from datetime import datetime
+
+logger = get_logger(service="redis_cache")
+
+# 向量在 Hash 中的字段名
+VECTOR_FIELD = "embedding"
+# 缓存项所属用户的 TAG 字段名，所有用户共用一个向量索引，检索时按该字段过滤
+USER_FIELD = "user_id"
+
+
+def _to_blob(vector) -> bytes:
+    """将向量打包为 float32 二进制"""
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+    """L2 归一化，归一化后点积即为余弦相似度"""
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def _index_schema(prefix: str, dim: int) -> Tuple[list, IndexDefinition]:
+    """HNSW 向量索引的字段定义，索引 {prefix}:vec:* 下的所有 Hash，用户 ID 作为 TAG 字段"""
+    fields = [
+        TagField(USER_FIELD),
+        VectorField(
+            VECTOR_FIELD,
+            "HNSW",
+            {
+                "TYPE": "FLOAT32",
+                "DIM": dim,
+                "DISTANCE_METRIC": "COSINE",
+                "M": settings.REDIS_CACHE_HNSW_M,
+                "EF_CONSTRUCTION": settings.REDIS_CACHE_HNSW_EF_CONSTRUCTION,
+            },
+        )
+    ]
+    return fields, IndexDefinition(prefix=[f"{prefix}:vec:"], index_type=IndexType.HASH)
+
+
+# 按 URL 共享的连接池，所有缓存实例复用同一组连接
+_pools: Dict[str, aioredis.ConnectionPool] = {}
+
+
+def get_redis_client(redis_url: str = None) -> aioredis.Redis:
+    """获取基于共享连接池的异步 Redis 客户端"""
+    url = redis_url or settings.REDIS_URL
+    pool = _pools.get(url)
+    if pool is None:
+        pool = aioredis.ConnectionPool.from_url(url, max_connections=settings.REDIS_MAX_CONNECTIONS)
+        _pools[url] = pool
+    return aioredis.Redis(connection_pool=pool)
+
+
+class LocalVectorIndex:
+    """进程内的向量矩阵，RediSearch 不可用时的降级检索方案"""
+
+    def __init__(self):
+        self._ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._matrix: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        self.loaded_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def load(self, items: List[Tuple[str, np.ndarray]]):
+        """用 Redis 中的全量向量重建矩阵"""
+        with self._lock:
+            self._ids = [hash_id for hash_id, _ in items]
+            self._positions = {hash_id: i for i, hash_id in enumerate(self._ids)}
+            if items:
+                self._matrix = np.vstack([_normalize(vec) for _, vec in items]).astype(np.float32)
+            else:
+                self._matrix = None
+            self.loaded_at = time.time()
+
+    def add(self, hash_id: str, vector: np.ndarray):
+        """新增或覆盖一个向量，容量不足时按倍数扩容"""
+        vector = _normalize(np.asarray(vector, dtype=np.float32))
+        with self._lock:
+            if hash_id in self._positions:
+                self._matrix[self._positions[hash_id]] = vector
+                return
+            size = len(self._ids)
+            if self._matrix is None:
+                self._matrix = np.empty((16, vector.shape[0]), dtype=np.float32)
+            elif size >= self._matrix.shape[0]:
+                grown = np.empty((self._matrix.shape[0] * 2, self._matrix.shape[1]), dtype=np.float32)
+                grown[:size] = self._matrix[:size]
+                self._matrix = grown
+            self._matrix[size] = vector
+            self._positions[hash_id] = size
+            self._ids.append(hash_id)
+
+    def remove(self, hash_id: str):
+        """删除一个向量，用最后一行填补空位"""
+        with self._lock:
+            pos = self._positions.pop(hash_id, None)
+            if pos is None:
+                return
+            last = len(self._ids) - 1
+            if pos != last:
+                last_id = self._ids[last]
+                self._matrix[pos] = self._matrix[last]
+                self._ids[pos] = last_id
+                self._positions[last_id] = pos
+            self._ids.pop()
+
+    def search(self, vector, top_k: int = 1) -> List[Tuple[str, float]]:
+        """矩阵乘法一次算出全部相似度，argpartition 取 top-k"""
+        query = _normalize(np.asarray(vector, dtype=np.float32))
+        with self._lock:
+            size = len(self._ids)
+            if size == 0 or self._matrix is None or self._matrix.shape[1] != query.shape[0]:
+                return []
+            scores = self._matrix[:size] @ query
+            top_k = min(top_k, size)
+            if top_k < size:
+                candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+            else:
+                candidates = np.arange(size)
+            ordered = candidates[np.argsort(-scores[candidates])]
+            return [(self._ids[i], float(scores[i])) for i in ordered]
+
+
+# 按缓存前缀共享的本地索引，所有请求共用同一份矩阵
+_local_indexes: Dict[str, LocalVectorIndex] = {}
+# RediSearch 模块是否可用，进程内只探测一次
+_redisearch_available: Optional[bool] = None
+# 已确认存在的 RediSearch 索引
+_created_indexes: set = set()
+
+
+def _user_tag(user_id: Optional[int]) -> str:
+    """缓存项的用户 TAG，未指定用户的命名空间使用 0"""
+    return str(user_id or 0)
+
+
+class RedisSemanticCache:
+    """基于语义的 Redis 缓存实现
+
+    每个缓存项由三个键组成（namespace 为 {prefix}:{user_id}，未指定用户时为 {prefix}）:
+    - {prefix}:vec:{user_id}:{hash} Hash，float32 向量和用户 TAG，供向量索引检索
+    - {namespace}:resp:{hash}       String，缓存的回复
+    - {namespace}:meta:{hash}       Hash，创建时间/最后访问时间/访问次数
+    另外 {namespace}:lru 是以 last_access 为分数的有序集合，用于 LRU 淘汰。
+    所有用户共用 {prefix}:vecidx 一个 HNSW 索引，检索时用 @user_id 过滤，不会随用户数增加索引。
+    """
+
+    def __init__(
+        self,
+        redis_url: str = None,
+        model_name: str = None,
+        score_threshold: float = None,
+        prefix: str = "cache",
+        user_id: Optional[int] = None,  # 添加用户ID
+        max_cache_size: int = 1000,  # 每个用户最大缓存条数
+        vector_backend: str = None,  # auto / redisearch / local
+        embedding_client: Optional[openai.AsyncOpenAI] = None,  # 由注册表传入共享的嵌入客户端
+        embedder: Optional[EmbeddingBatcher] = None  # 由注册表传入共享的嵌入合并器
+    ):
+        self.redis = get_redis_client(redis_url)
+        self.model_name = model_name or settings.EMBEDDING_MODEL
+        self.score_threshold = score_threshold or settings.REDIS_CACHE_THRESHOLD
+        self.base_prefix = prefix
+        self.prefix = f"{prefix}:{user_id}" if user_id else prefix
+        self.user_tag = _user_tag(user_id)
+        self.vector_prefix = f"{prefix}:vec:{self.user_tag}:"
+        self.max_cache_size = max_cache_size
+        self.vector_backend = vector_backend or settings.REDIS_CACHE_VECTOR_BACKEND
+        self.index_name = f"{prefix}:vecidx"
+        self.lru_key = f"{self.prefix}:lru"
+
+        # 配置OpenAI客户端用于嵌入
+        self.embedding_client = embedding_client or openai.AsyncOpenAI(
+            api_key=settings.EMBEDDING_API_KEY,
+            base_url=settings.EMBEDDING_BASE_URL
+        )
+        # 同一条消息在 lookup 和 update 中各取一次向量，经过合并器后只请求一次
+        self.embedder = embedder or EmbeddingBatcher(self.embedding_client, self.model_name)
+
+    async def _get_embedding(self, text: str) -> List[float]:
+        """使用OpenAI兼容API生成文本向量"""
+        try:
+            return await self.embedder.embed(text)
+        except Exception as e:
+            logger.error(f"Error getting embedding: {str(e)}", exc_info=True)
+            # 如果API失败，尝试使用本地fallback（可选）
+            raise
+
+    async def get_embedding(self, text: str) -> List[float]:
+        """获取文本向量"""
+        try:
+            # 使用OpenAI兼容API的embedding接口
+            embedding = await self._get_embedding(text)
+            if not embedding:
+                raise ValueError("Failed to get embedding")
+            return embedding
+        except Exception as e:
+            logger.error(f"Error in get_embedding: {str(e)}", exc_info=True)
+            raise
+
+    def _get_hash_id(self, message: str) -> str:
+        """缓存项的唯一标识"""
+        return hashlib.md5(message.encode()).hexdigest()
+
+    def _get_vector_key(self, message: str) -> str:
+        """生成向量存储的键名"""
+        return f"{self.vector_prefix}{self._get_hash_id(message)}"
+
+    def _get_response_key(self, message: str) -> str:
+        """生成响应存储的键名"""
+        return f"{self.prefix}:resp:{self._get_hash_id(message)}"
+
+    def _get_metadata_key(self, message: str) -> str:
+        """生成元数据存储的键名"""
+        return f"{self.prefix}:meta:{self._get_hash_id(message)}"
+
+    def _get_last_user_message(self, messages: List[Dict]) -> str:
+        """获取最后一条用户消息"""
+        for msg in reversed(messages):
+            if msg["role"] == "user":
+                return msg["content"]
+        return ""
+
+    async def _use_redisearch(self) -> bool:
+        """判断是否走 RediSearch HNSW 检索"""
+        global _redisearch_available
+        if self.vector_backend == "local":
+            return False
+        if _redisearch_available is None:
+            try:
+                await self.redis.execute_command("FT._LIST")
+                _redisearch_available = True
+            except ResponseError:
+                _redisearch_available = False
+                logger.warning("RediSearch module not available, falling back to local vector index")
+        return _redisearch_available
+
+    async def _ensure_index(self, dim: int):
+        """按需创建所有用户共用的 HNSW 向量索引"""
+        if self.index_name in _created_indexes:
+            return
+        try:
+            await self.redis.ft(self.index_name).info()
+        except ResponseError:
+            fields, definition = _index_schema(self.base_prefix, dim)
+            await self.redis.ft(self.index_name).create_index(fields, definition=definition)
+            logger.info(f"Created vector index {self.index_name} (dim={dim})")
+            await self._drop_legacy_indexes()
+        _created_indexes.add(self.index_name)
+
+    async def _drop_legacy_indexes(self):
+        """删除旧版本按用户创建的 {prefix}[:{user_id}]:idx 索引，只删索引不删键，旧键按 TTL 过期"""
+        pattern = re.compile(rf"^{re.escape(self.base_prefix)}(:\d+)?:idx$")
+        try:
+            names = [n.decode("utf-8") if isinstance(n, bytes) else n for n in await self.redis.execute_command("FT._LIST")]
+            for name in names:
+                if pattern.match(name):
+                    await self.redis.ft(name).dropindex(delete_documents=False)
+                    logger.info(f"Dropped legacy vector index {name}")
+        except ResponseError as e:
+            logger.warning(f"Error dropping legacy vector indexes: {str(e)}")
+
+    async def _get_local_index(self) -> LocalVectorIndex:
+        """获取本地向量矩阵，超过同步间隔时从 Redis 重新加载"""
+        index = _local_indexes.get(self.prefix)
+        if index is None:
+            index = _local_indexes.setdefault(self.prefix, LocalVectorIndex())
+        if time.time() - index.loaded_at > settings.REDIS_CACHE_LOCAL_REFRESH:
+            index.load(await self._load_vectors())
+        return index
+
+    async def _load_vectors(self) -> List[Tuple[str, np.ndarray]]:
+        """SCAN 当前前缀的全部向量并用 pipeline 批量读取"""
+        keys = [key async for key in self.redis.scan_iter(match=f"{self.vector_prefix}*", count=1000)]
+        if not keys:
+            return []
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.hget(key, VECTOR_FIELD)
+            blobs = await pipe.execute(raise_on_error=False)
+        items = []
+        for key, blob in zip(keys, blobs):
+            # 跳过旧格式(JSON 字符串)或已过期的键
+            if not blob or isinstance(blob, Exception):
+                continue
+            items.append((key.decode('utf-8').split(":")[-1], np.frombuffer(blob, dtype=np.float32)))
+        return items
+
+    async def search(self, vector: List[float], top_k: int = 1) -> List[Tuple[str, float]]:
+        """一次调用返回最相似的 top-k 缓存项及其余弦相似度"""
+        if await self._use_redisearch():
+            query = (
+                Query(f"(@{USER_FIELD}:{{{self.user_tag}}})=>[KNN {top_k} @{VECTOR_FIELD} $vec AS score]")
+                .sort_by("score")
+                .return_fields("score")
+                .paging(0, top_k)
+                .dialect(2)
+            )
+            try:
+                result = await self.redis.ft(self.index_name).search(query, query_params={"vec": _to_blob(vector)})
+            except ResponseError:
+                # 索引尚未创建(还没有写入过缓存)
+                return []
+            # RediSearch 返回的是余弦距离，转换为相似度
+            return [(doc.id.split(":")[-1], 1 - float(doc.score)) for doc in result.docs]
+        return (await self._get_local_index()).search(vector, top_k)
+
+    async def _evict(self) -> int:
+        """按 LRU 有序集合淘汰超出上限的缓存项，返回删除的条数"""
+        # 最后访问早于过期时间的成员对应的键必然已经过期，直接移出有序集合
+        expired_before = time.time() - settings.REDIS_CACHE_EXPIRE
+        await self.redis.zremrangebyscore(self.lru_key, "-inf", expired_before)
+
+        total = await self.redis.zcard(self.lru_key)
+        if total <= self.max_cache_size:
+            return 0
+        hash_ids = await self.redis.zrange(self.lru_key, 0, total - self.max_cache_size - 1)
+        await self._remove_cache_items([h.decode('utf-8') for h in hash_ids])
+        return len(hash_ids)
+
+    async def _remove_cache_items(self, hash_ids: List[str]):
+        """用一个 pipeline 删除多个缓存项的所有相关键"""
+        if not hash_ids:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for hash_id in hash_ids:
+                    pipe.delete(
+                        f"{self.vector_prefix}{hash_id}",
+                        f"{self.prefix}:resp:{hash_id}",
+                        f"{self.prefix}:meta:{hash_id}"
+                    )
+                pipe.zrem(self.lru_key, *hash_ids)
+                await pipe.execute()
+            if self.prefix in _local_indexes:
+                for hash_id in hash_ids:
+                    _local_indexes[self.prefix].remove(hash_id)
+        except Exception as e:
+            logger.error(f"Error removing cache items: {str(e)}", exc_info=True)
+
+    async def _remove_cache_item(self, hash_id: str):
+        """删除一个缓存项的所有相关键"""
+        await self._remove_cache_items([hash_id])
+
+    async def _update_metadata(self, hash_id: str):
+        """更新缓存项的元数据，并刷新其在 LRU 有序集合中的位置
+
+        向量、回复和元数据的过期时间一起刷新，避免常被命中的缓存项只剩元数据和 LRU 成员。
+        """
+        try:
+            now = datetime.now().timestamp()
+            expire = settings.REDIS_CACHE_EXPIRE
+            meta_key = f"{self.prefix}:meta:{hash_id}"
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.hset(meta_key, "last_access", now)
+                pipe.hincrby(meta_key, "access_count", 1)
+                pipe.expire(f"{self.vector_prefix}{hash_id}", expire)
+                pipe.expire(f"{self.prefix}:resp:{hash_id}", expire)
+                pipe.expire(meta_key, expire)
+                pipe.zadd(self.lru_key, {hash_id: now})
+                pipe.expire(self.lru_key, expire)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Error updating metadata: {str(e)}", exc_info=True)
+
+    async def lookup(self, messages: List[Dict]) -> Optional[str]:
+        """查找缓存的响应"""
+        try:
+            user_message = self._get_last_user_message(messages)
+            if not user_message:
+                return None
+
+            current_vector = await self.get_embedding(user_message)
+
+            # 通过向量索引一次取回最相似的缓存项
+            matches = await self.search(current_vector, top_k=1)
+            if not matches:
+                return None
+            hash_id, max_similarity = matches[0]
+
+            if max_similarity >= self.score_threshold:
+                cached_response = await self.redis.get(f"{self.prefix}:resp:{hash_id}")
+
+                if cached_response:
+                    # 更新命中项的访问元数据
+                    await self._update_metadata(hash_id)
+                    logger.info(f"Cache hit with similarity: {max_similarity:.4f}")
+                    return cached_response.decode('utf-8')
+                # 响应已过期，同步清理本地矩阵中的向量
+                if self.prefix in _local_indexes:
+                    _local_indexes[self.prefix].remove(hash_id)
+
+            return None
+
+        except Exception as e:
+            logger.error(f"Error in lookup: {str(e)}", exc_info=True)
+            return None
+
+    async def update(self, messages: List[Dict], response: str, expire: int = None):
+        """更新缓存"""
+        try:
+            user_message = self._get_last_user_message(messages)
+            if not user_message:
+                return
+
+            vector = await self.get_embedding(user_message)
+
+            hash_id = self._get_hash_id(user_message)
+            vec_key = self._get_vector_key(user_message)
+            resp_key = self._get_response_key(user_message)
+            meta_key = self._get_metadata_key(user_message)
+
+            expire = expire or settings.REDIS_CACHE_EXPIRE
+            now = datetime.now().timestamp()
+
+            if await self._use_redisearch():
+                await self._ensure_index(len(vector))
+
+            # 向量、响应、元数据和 LRU 索引在一个事务中写入
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(vec_key, meta_key)  # 清理可能存在的旧格式(JSON 字符串)键
+                # 向量以 float32 二进制存入 Hash，供 RediSearch 建立 HNSW 索引
+                pipe.hset(vec_key, mapping={VECTOR_FIELD: _to_blob(vector), USER_FIELD: self.user_tag})
+                pipe.expire(vec_key, expire)
+                pipe.set(resp_key, response.encode('utf-8'), ex=expire)  # 编码为bytes
+                pipe.hset(meta_key, mapping={
+                    "created_at": now,
+                    "last_access": now,
+                    "access_count": 1
+                })
+                pipe.expire(meta_key, expire)
+                pipe.zadd(self.lru_key, {hash_id: now})
+                pipe.expire(self.lru_key, expire)
+                await pipe.execute()
+
+            if not await self._use_redisearch():
+                (await self._get_local_index()).add(hash_id, np.asarray(vector, dtype=np.float32))
+
+            logger.info(f"Cache updated for message: {user_message[:50]}...")
+
+        except Exception as e:
+            logger.error(f"Error in update: {str(e)}", exc_info=True)
+
+
+async def close_redis_pools():
+    """关闭所有共享连接池，应用退出时调用"""
+    for pool in _pools.values():
+        await pool.disconnect()
+    _pools.clear()
+
+
+class SemanticCacheRegistry:
+    """语义缓存注册表
+
+    按 (prefix, user_id) 复用缓存命名空间，所有命名空间共用一个 Redis 连接池、
+    一个嵌入客户端和一个后台清理任务，避免每个请求都新建连接和常驻任务。
+    """
+
+    def __init__(self, cleanup_interval: int = None, idle_timeout: int = None):
+        self.cleanup_interval = cleanup_interval or settings.REDIS_CACHE_CLEANUP_INTERVAL
+        # 命名空间闲置超过该时长后从注册表移除，此时其 Redis 键也已过期
+        self.idle_timeout = idle_timeout or settings.REDIS_CACHE_EXPIRE
+        self._namespaces: Dict[str, RedisSemanticCache] = {}
+        self._last_used: Dict[str, float] = {}
+        self._embedding_client: Optional[openai.AsyncOpenAI] = None
+        self._embedders: Dict[str, EmbeddingBatcher] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+
+        # 清理任务的运行指标
+        self.sweep_runs = 0
+        self.last_sweep_duration = 0.0
+        self.total_sweep_duration = 0.0
+        self.last_sweep_removed = 0
+
+    @property
+    def embedding_client(self) -> openai.AsyncOpenAI:
+        if self._embedding_client is None:
+            self._embedding_client = openai.AsyncOpenAI(
+                api_key=settings.EMBEDDING_API_KEY,
+                base_url=settings.EMBEDDING_BASE_URL
+            )
+        return self._embedding_client
+
+    def get_embedder(self, model_name: str = None) -> EmbeddingBatcher:
+        """按模型共享嵌入合并器，使 LRU 与请求合并跨命名空间生效"""
+        model_name = model_name or settings.EMBEDDING_MODEL
+        embedder = self._embedders.get(model_name)
+        if embedder is None:
+            embedder = EmbeddingBatcher(self.embedding_client, model_name)
+            self._embedders[model_name] = embedder
+        return embedder
+
+    def get(self, prefix: str = "cache", user_id: Optional[int] = None) -> RedisSemanticCache:
+        """获取(或创建)一个缓存命名空间"""
+        namespace = f"{prefix}:{user_id}" if user_id else prefix
+        cache = self._namespaces.get(namespace)
+        if cache is None:
+            cache = RedisSemanticCache(
+                prefix=prefix,
+                user_id=user_id,
+                embedding_client=self.embedding_client,
+                embedder=self.get_embedder()
+            )
+            self._namespaces[namespace] = cache
+        self._last_used[namespace] = time.time()
+        self.start()
+        return cache
+
+    def start(self):
+        """启动全局清理任务，已在运行时不重复启动"""
+        if self._sweeper is not None and not self._sweeper.done():
+            return
+        try:
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep_loop())
+        except RuntimeError:
+            # 没有运行中的事件循环，等下一次 get 时再启动
+            pass
+
+    async def stop(self):
+        """停止清理任务"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+    async def sweep(self) -> int:
+        """对所有命名空间执行一次 LRU 淘汰，并移除闲置的命名空间"""
+        start_time = time.perf_counter()
+        removed = 0
+        now = time.time()
+        for namespace, cache in list(self._namespaces.items()):
+            try:
+                removed += await cache._evict()
+            except Exception as e:
+                logger.error(f"Error in cache cleanup for {namespace}: {str(e)}", exc_info=True)
+            if now - self._last_used.get(namespace, 0) > self.idle_timeout:
+                self._namespaces.pop(namespace, None)
+                self._last_used.pop(namespace, None)
+                _local_indexes.pop(namespace, None)
+
+        duration = time.perf_counter() - start_time
+        self.sweep_runs += 1
+        self.last_sweep_duration = duration
+        self.total_sweep_duration += duration
+        self.last_sweep_removed = removed
+        return removed
+
+    async def _sweep_loop(self):
+        """全局唯一的后台清理循环"""
+        while True:
+            await asyncio.sleep(self.cleanup_interval)
+            try:
+                removed = await self.sweep()
+                logger.info(
+                    f"Cache cleanup completed: namespaces={len(self._namespaces)}, "
+                    f"removed={removed}, duration={self.last_sweep_duration:.4f}s"
+                )
+            except Exception as e:
+                logger.error(f"Error in cache cleanup: {str(e)}", exc_info=True)
+
+    def stats(self) -> Dict:
+        """注册表运行指标"""
+        return {
+            "live_namespaces": len(self._namespaces),
+            "sweeper_running": self._sweeper is not None and not self._sweeper.done(),
+            "sweep_runs": self.sweep_runs,
+            "last_sweep_duration": self.last_sweep_duration,
+            "avg_sweep_duration": self.total_sweep_duration / self.sweep_runs if self.sweep_runs else 0.0,
+            "last_sweep_removed": self.last_sweep_removed,
+            "connection_pools": len(_pools),
+            "embedders": {name: embedder.stats() for name, embedder in self._embedders.items()},
+        }
+
+
+# 进程内共享的缓存注册表
+semantic_cache_registry = SemanticCacheRegistry()
@@ -0,0 +1,257 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from collections import OrderedDict
+from pathlib import Path
+import asyncio
+import json
+import math
+import sqlite3
+import threading
+import numpy as np
+import faiss
+from app.core.config import settings
+from app.core.logger import get_logger
+
+logger = get_logger(service="vector_index")
+
+
+class DocumentStore:
+    """基于 SQLite 的文档侧车存储，按向量 id 取回文本和元数据
+
+    替代原来带缩进的 JSON 文档映射：查询时只读取命中的几行，不再整体加载。
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def write(self, rows: Iterable[Tuple[int, str, dict]]):
+        """用 (id, text, metadata) 行整体替换文档，id 与 FAISS 中的向量序号一致
+
+        先清空旧行再写入（同一事务），重建索引后分块变少时不会残留旧文档，count() 与 ntotal 保持一致。
+        """
+        conn = self._connect()
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "id INTEGER PRIMARY KEY, text TEXT NOT NULL, metadata TEXT NOT NULL)"
+            )
+            conn.execute("DELETE FROM chunks")
+            conn.executemany(
+                "INSERT INTO chunks (id, text, metadata) VALUES (?, ?, ?)",
+                ((i, text, json.dumps(metadata, ensure_ascii=False, separators=(",", ":"))) for i, text, metadata in rows)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get(self, ids: List[int]) -> Dict[int, dict]:
+        """按 id 批量读取文档"""
+        if not ids:
+            return {}
+        conn = self._connect()
+        try:
+            placeholders = ",".join("?" * len(ids))
+            cursor = conn.execute(f"SELECT id, text, metadata FROM chunks WHERE id IN ({placeholders})", ids)
+            return {row[0]: {"text": row[1], "metadata": json.loads(row[2])} for row in cursor}
+        finally:
+            conn.close()
+
+    def count(self) -> int:
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        finally:
+            conn.close()
+
+    @classmethod
+    def from_legacy_json(cls, json_path: Path, path: Path) -> "DocumentStore":
+        """把旧版 docs_*.json 迁移到 SQLite"""
+        with open(json_path, "r", encoding="utf-8") as f:
+            documents = json.load(f)
+        store = cls(path)
+        store.write((int(i), doc["text"], doc["metadata"]) for i, doc in documents.items())
+        logger.info(f"Migrated {len(documents)} documents from {json_path.name} to {path.name}")
+        return store
+
+
+class VectorIndexManager:
+    """多租户向量索引管理器
+
+    - 以 index_id 为键同时保持多个索引打开，超出上限时按 LRU 关闭
+    - 索引文件通过 faiss.IO_FLAG_MMAP 内存映射，不再整体读入内存
+    - 按语料规模选择 Flat / HNSW / IVF 索引
+    - search 在线程池中执行，不同 index_id 的查询可以并发
+    """
+
+    def __init__(self, index_dir: str = None, max_open: int = None):
+        self.index_dir = Path(index_dir or settings.VECTOR_INDEX_DIR)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.max_open = max_open or settings.VECTOR_INDEX_MAX_OPEN
+        self._open: "OrderedDict[str, Tuple[faiss.Index, DocumentStore]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+
+    def _paths(self, index_id: str) -> Tuple[Path, Path]:
+        file_id = index_id.replace("index_", "", 1)
+        return self.index_dir / f"index_{file_id}.bin", self.index_dir / f"docs_{file_id}.sqlite"
+
+    @staticmethod
+    def build_index(dimension: int, corpus_size: int) -> faiss.Index:
+        """按语料规模选择索引类型
+
+        小语料用暴力检索最准确；中等规模用 HNSW；大规模用 IVF，需要先 train。
+        """
+        if corpus_size >= settings.VECTOR_INDEX_IVF_THRESHOLD:
+            nlist = int(4 * math.sqrt(corpus_size))
+            quantizer = faiss.IndexFlatL2(dimension)
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+            index.nprobe = settings.VECTOR_INDEX_IVF_NPROBE
+            return index
+        if corpus_size >= settings.VECTOR_INDEX_HNSW_THRESHOLD:
+            index = faiss.IndexHNSWFlat(dimension, settings.VECTOR_INDEX_HNSW_M)
+            index.hnsw.efSearch = settings.VECTOR_INDEX_HNSW_EF_SEARCH
+            return index
+        return faiss.IndexFlatL2(dimension)
+
+    def save(self, index_id: str, index: faiss.Index, documents: Iterable[Tuple[int, str, dict]]):
+        """持久化索引和文档，并替换已打开的旧版本"""
+        index_path, docs_path = self._paths(index_id)
+        DocumentStore(docs_path).write(documents)
+        tmp_path = index_path.with_suffix(".bin.tmp")
+        faiss.write_index(index, str(tmp_path))
+        tmp_path.replace(index_path)
+        with self._lock:
+            self._open.pop(index_id, None)
+
+    def _read_index(self, index_path: Path) -> faiss.Index:
+        try:
+            return faiss.read_index(str(index_path), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            # 部分索引类型不支持内存映射，退回普通读取
+            return faiss.read_index(str(index_path))
+
+    def get(self, index_id: str) -> Tuple[faiss.Index, DocumentStore]:
+        """获取已打开的索引，未打开时加载"""
+        with self._lock:
+            entry = self._open.get(index_id)
+            if entry is not None:
+                self._open.move_to_end(index_id)
+                return entry
+            load_lock = self._load_locks.setdefault(index_id, threading.Lock())
+
+        # 同一个索引只加载一次，不同索引可以并行加载
+        with load_lock:
+            with self._lock:
+                entry = self._open.get(index_id)
+            if entry is not None:
+                return entry
+
+            index_path, docs_path = self._paths(index_id)
+            if not index_path.exists():
+                raise FileNotFoundError(f"找不到索引文件: {index_id}")
+            if not docs_path.exists():
+                legacy_docs = docs_path.with_suffix(".json")
+                if not legacy_docs.exists():
+                    raise FileNotFoundError(f"找不到文档数据: {index_id}")
+                DocumentStore.from_legacy_json(legacy_docs, docs_path)
+
+            entry = (self._read_index(index_path), DocumentStore(docs_path))
+            with self._lock:
+                self._open[index_id] = entry
+                while len(self._open) > self.max_open:
+                    evicted, _ = self._open.popitem(last=False)
+                    logger.info(f"Closed index {evicted} (LRU)")
+            logger.info(f"Opened index {index_id}: {entry[0].ntotal} vectors")
+            return entry
+
+    def search(self, index_id: str, query_vectors: np.ndarray, top_k: int = 3) -> List[dict]:
+        """同步检索，供线程池调用"""
+        index, store = self.get(index_id)
+        distances, indices = index.search(np.ascontiguousarray(query_vectors, dtype=np.float32), top_k)
+        ids = [int(i) for i in indices[0] if i >= 0]
+        documents = store.get(ids)
+        results = []
+        for distance, idx in zip(distances[0], indices[0]):
+            doc = documents.get(int(idx))
+            if doc is not None:
+                results.append({
+                    "score": float(distance),
+                    "content": doc["text"],
+                    "metadata": doc["metadata"]
+                })
+        return results
+
+    async def asearch(self, index_id: str, query_vectors: np.ndarray, top_k: int = 3) -> List[dict]:
+        """在线程池中检索，FAISS 检索时会释放 GIL，多个查询可并行"""
+        return await asyncio.to_thread(self.search, index_id, query_vectors, top_k)
+
+    def close(self, index_id: Optional[str] = None):
+        """关闭一个或全部已打开的索引"""
+        with self._lock:
+            if index_id is None:
+                self._open.clear()
+            else:
+                self._open.pop(index_id, None)
+
+
+class IncrementalIndexWriter:
+    """边编码边写入的索引构建器
+
+    Flat / HNSW 索引直接增量 add；IVF 索引先缓冲向量，攒够训练样本后训练一次再写入。
+    """
+
+    def __init__(self, dimension: int, expected_size: int):
+        self.dimension = dimension
+        self.index = VectorIndexManager.build_index(dimension, expected_size)
+        self._buffer: List[np.ndarray] = []
+        self._buffered = 0
+        # faiss 建议每个聚类中心至少 39 个训练样本
+        self._train_size = 0 if self.index.is_trained else self.index.nlist * 39
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal + self._buffered
+
+    def add(self, vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.index.is_trained:
+            self.index.add(vectors)
+            return
+        self._buffer.append(vectors)
+        self._buffered += len(vectors)
+        if self._buffered >= self._train_size:
+            self._train_and_flush()
+
+    def _train_and_flush(self):
+        data = np.vstack(self._buffer)
+        self._buffer, self._buffered = [], 0
+        self.index.train(data)
+        self.index.add(data)
+
+    def finish(self) -> faiss.Index:
+        """结束写入，返回完整的索引"""
+        if not self.index.is_trained:
+            data = np.vstack(self._buffer) if self._buffer else np.empty((0, self.dimension), dtype=np.float32)
+            if len(data) < self.index.nlist:
+                # 语料规模估计偏大，样本不足以训练 IVF，改用小规模索引
+                self._buffer, self._buffered = [], 0
+                self.index = VectorIndexManager.build_index(self.dimension, len(data))
+                self.index.add(data)
+            else:
+                self._train_and_flush()
+        return self.index
+
+
+# 进程内共享的索引管理器
+_manager: Optional[VectorIndexManager] = None
+
+
+def get_index_manager() -> VectorIndexManager:
+    global _manager
+    if _manager is None:
+        _manager = VectorIndexManager()
+    return _manager
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+缓存回放延迟测试：验证缓存命中比缓存未命中更快返回
+
+用一个有首 token 延迟、按固定速率吐 token 的模拟模型代替 DeepSeek API，
+用内存字典代替语义缓存，对每种回放策略分别测量 generate_stream 的首帧耗时和总耗时。
+token_rate 模式本身就是按模型速率回放，只要求首帧更快；其余模式要求总耗时也更快。
+
+运行方式（在 llm_backend 目录下）:
+    python -m app.test.cache_replay_latency
+"""
+import asyncio
+import json
+import time
+import types
+
+from app.core.config import CacheReplayMode, settings
+from app.services import deepseek_service
+from app.services.deepseek_service import DeepseekService
+
+ANSWER = "语义缓存命中后应当比重新调用模型更快地返回完整答案。" * 40  # 约 1000 字
+FIRST_TOKEN_DELAY = 0.5  # 模拟模型的首 token 延迟
+TOKEN_DELAY = 0.02       # 模拟模型每个 token 的生成间隔
+TOKEN_SIZE = 2           # 模拟模型每个 token 的字符数
+
+
+class InMemoryCache:
+    """按最后一条用户消息精确匹配的内存缓存"""
+
+    def __init__(self):
+        self.store = {}
+
+    async def lookup(self, messages):
+        return self.store.get(messages[-1]["content"])
+
+    async def update(self, messages, response):
+        self.store[messages[-1]["content"]] = response
+
+
+class SimulatedCompletions:
+    """按固定速率流式返回 ANSWER 的模拟模型"""
+
+    async def create(self, model, messages, stream):
+        async def generator():
+            await asyncio.sleep(FIRST_TOKEN_DELAY)
+            for i in range(0, len(ANSWER), TOKEN_SIZE):
+                await asyncio.sleep(TOKEN_DELAY)
+                delta = types.SimpleNamespace(content=ANSWER[i:i + TOKEN_SIZE])
+                yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta)])
+        return generator()
+
+
+async def timed_stream(service: DeepseekService, messages) -> tuple:
+    """返回 (首帧耗时, 总耗时, 拼接后的内容)"""
+    start = time.perf_counter()
+    first_frame = None
+    body = []
+    async for frame in service.generate_stream(messages, user_id=1):
+        if first_frame is None:
+            first_frame = time.perf_counter() - start
+        body.append(json.loads(frame[len("data: "):]))
+    return first_frame, time.perf_counter() - start, "".join(body)
+
+
+async def test_cache_hit_faster_than_miss():
+    cache = InMemoryCache()
+    deepseek_service.semantic_cache_registry.get = lambda prefix, user_id: cache
+
+    service = DeepseekService()
+    service.client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=SimulatedCompletions()))
+
+    for mode in CacheReplayMode:
+        settings.CACHE_REPLAY_MODE = mode
+        cache.store.clear()
+        messages = [{"role": "user", "content": f"测试问题 {mode.value}"}]
+
+        miss_first, miss_total, miss_body = await timed_stream(service, messages)
+        hit_first, hit_total, hit_body = await timed_stream(service, messages)
+
+        print(
+            f"{mode.value:<11} first frame miss/hit: {miss_first:.3f}s / {hit_first:.3f}s  "
+            f"total miss/hit: {miss_total:.3f}s / {hit_total:.3f}s"
+        )
+        assert hit_body == miss_body == ANSWER, f"{mode.value}: replayed body differs from the original answer"
+        assert hit_first < miss_first, f"{mode.value}: first frame on hit ({hit_first:.3f}s) not faster than miss ({miss_first:.3f}s)"
+        if mode != CacheReplayMode.TOKEN_RATE:
+            assert hit_total < miss_total, f"{mode.value}: cache hit ({hit_total:.3f}s) not faster than miss ({miss_total:.3f}s)"
+
+
+if __name__ == "__main__":
+    asyncio.run(test_cache_hit_faster_than_miss())
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+LangGraph 检查点存储的内存与延迟测试：MemorySaver / BoundedMemorySaver / RedisCheckpointSaver
+
+用一个不调用模型的三节点图模拟对话：每轮追加一问一答两条消息，多个线程并发运行若干轮，
+统计每轮 ainvoke 和 aget_state 的延迟，以及运行前后进程 RSS 的增量；
+Redis 存储另外统计运行前后 used_memory 的差值（--fake-redis 时使用 fakeredis，数据也在进程内）。
+同一进程中先运行的存储释放的内存会被后面复用，比较 RSS 时每种存储单独运行一次（--backends bounded）。
+
+运行方式（在 llm_backend 目录下）:
+    python -m app.test.checkpointer_benchmark
+    python -m app.test.checkpointer_benchmark --threads 10000 --turns 5 --backends memory,bounded,redis
+"""
+import argparse
+import asyncio
+import gc
+import operator
+import time
+import uuid
+from typing import Annotated, List, TypedDict
+
+import psutil
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, START, StateGraph
+
+from app.lg_agent.lg_checkpointer import BoundedMemorySaver, RedisCheckpointSaver
+
+
+class ChatState(TypedDict):
+    messages: Annotated[list, operator.add]
+    route: str
+
+
+async def analyze(state: ChatState):
+    return {"route": "general"}
+
+
+async def respond(state: ChatState):
+    question = state["messages"][-1].content
+    return {"messages": [AIMessage(content=f"回答：{question} " + "内容" * 100)]}
+
+
+async def finish(state: ChatState):
+    return {"route": ""}
+
+
+def build_graph(checkpointer):
+    builder = StateGraph(ChatState)
+    builder.add_node(analyze)
+    builder.add_node(respond)
+    builder.add_node(finish)
+    builder.add_edge(START, "analyze")
+    builder.add_edge("analyze", "respond")
+    builder.add_edge("respond", "finish")
+    builder.add_edge("finish", END)
+    return builder.compile(checkpointer=checkpointer)
+
+
+def percentile(timings: List[float], q: float) -> float:
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * q))]
+
+
+async def run_backend(name: str, checkpointer, threads: int, turns: int, concurrency: int, redis=None):
+    graph = build_graph(checkpointer)
+    thread_ids = [str(uuid.uuid4()) for _ in range(threads)]
+    semaphore = asyncio.Semaphore(concurrency)
+    invoke_ms: List[float] = []
+    state_ms: List[float] = []
+
+    async def conversation(thread_id: str):
+        config = {"configurable": {"thread_id": thread_id}}
+        for turn in range(turns):
+            async with semaphore:
+                start = time.perf_counter()
+                await graph.ainvoke({"messages": [HumanMessage(content=f"问题 {turn}")]}, config)
+                invoke_ms.append((time.perf_counter() - start) * 1000)
+                start = time.perf_counter()
+                await graph.aget_state(config)
+                state_ms.append((time.perf_counter() - start) * 1000)
+
+    process = psutil.Process()
+    used_before = (await redis.info("memory")).get("used_memory", 0) if redis is not None else 0
+    gc.collect()
+    rss_before = process.memory_info().rss
+    start = time.perf_counter()
+    await asyncio.gather(*(conversation(thread_id) for thread_id in thread_ids))
+    wall = time.perf_counter() - start
+    gc.collect()
+
+    memory = f"rss +{(process.memory_info().rss - rss_before) / 2**20:7.1f}MB"
+    if redis is not None:
+        memory += f"  redis +{((await redis.info('memory')).get('used_memory', 0) - used_before) / 2**20:7.1f}MB"
+    print(
+        f"{name:<8} {threads} threads x {turns} turns in {wall:6.1f}s  {memory}  "
+        f"invoke p50 {percentile(invoke_ms, 0.5):6.2f}ms p95 {percentile(invoke_ms, 0.95):6.2f}ms  "
+        f"get_state p50 {percentile(state_ms, 0.5):6.2f}ms p95 {percentile(state_ms, 0.95):6.2f}ms"
+    )
+    if hasattr(checkpointer, "stats"):
+        print(f"         {checkpointer.stats()}")
+
+    # 最后一轮的消息应完整保留
+    state = await graph.aget_state({"configurable": {"thread_id": thread_ids[0]}})
+    assert len(state.values["messages"]) == turns * 2, "conversation state was lost"
+
+
+async def main(threads: int, turns: int, concurrency: int, keep: int, backends: List[str], fake_redis: bool):
+    for backend in backends:
+        if backend == "memory":
+            await run_backend("memory", MemorySaver(), threads, turns, concurrency)
+        elif backend == "bounded":
+            await run_backend("bounded", BoundedMemorySaver(keep=keep), threads, turns, concurrency)
+        elif backend == "redis":
+            checkpointer = RedisCheckpointSaver(prefix=f"lg:checkpoint:bench:{uuid.uuid4().hex[:8]}", keep=keep, ttl=600)
+            redis = None
+            if fake_redis:
+                import fakeredis
+                import redis.asyncio as aioredis
+                checkpointer._redis = fakeredis.aioredis.FakeRedis(
+                    connection_pool_class=aioredis.BlockingConnectionPool,
+                    max_connections=checkpointer.max_connections,
+                )
+            else:
+                redis = checkpointer.redis
+            await run_backend("redis", checkpointer, threads, turns, concurrency, redis=redis)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=10000)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=500, help="同时运行的 ainvoke 数")
+    parser.add_argument("--keep", type=int, default=4, help="每个线程保留的检查点数")
+    parser.add_argument("--backends", default="memory,bounded,redis")
+    parser.add_argument("--fake-redis", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.threads, args.turns, args.concurrency, args.keep, args.backends.split(","), args.fake_redis))
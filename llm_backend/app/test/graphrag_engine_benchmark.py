@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+GraphRAG 查询延迟测试：对比每次查询重新加载索引（GraphRAGAPI）与常驻查询引擎（graphrag_engine）
+
+- setup：只统计查询前的准备工作（读取配置和 parquet 表、转换数据类、打开向量库、构建搜索引擎），不调用模型
+- query：传入 --query 时执行完整查询（会调用大模型和 Embedding 服务），并测试常驻引擎的并发查询
+
+需要先用 GraphRAG 在 GRAPHRAG_PROJECT_DIR/GRAPHRAG_DATA_DIR 下构建好索引。
+
+运行方式（在 llm_backend 目录下）:
+    python -m app.test.graphrag_engine_benchmark
+    python -m app.test.graphrag_engine_benchmark --query "公司的退货政策是什么？" --rounds 3 --concurrency 4
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.lg_agent.kg_sub_graph.agentic_rag_agents.components.customer_tools.graphrag_engine import (
+    GraphRAGQueryEngine,
+    _build_search_engine,
+)
+from app.lg_agent.kg_sub_graph.agentic_rag_agents.components.customer_tools.node import GraphRAGAPI
+
+
+def report(name: str, timings: list):
+    timings = sorted(timings)
+    print(
+        f"{name:<12} mean {statistics.mean(timings):9.1f}ms  "
+        f"p50 {timings[len(timings) // 2]:9.1f}ms  max {timings[-1]:9.1f}ms"
+    )
+
+
+async def cold_setup() -> float:
+    # 旧实现：每次查询新建 GraphRAGAPI 读取配置和索引表，api.*_search 内部再转换数据并构建搜索引擎
+    start = time.perf_counter()
+    graphrag_api = GraphRAGAPI()
+    await graphrag_api.initialize()
+    await asyncio.to_thread(
+        _build_search_engine,
+        graphrag_api.config,
+        {
+            "entities": graphrag_api.entities,
+            "text_units": graphrag_api.text_units,
+            "communities": graphrag_api.communities,
+            "community_reports": graphrag_api.community_reports,
+            "relationships": graphrag_api.relationships,
+            "covariates": graphrag_api.covariates,
+        },
+        graphrag_api.query_type.lower(),
+        graphrag_api.response_type,
+        graphrag_api.community_level,
+        graphrag_api.dynamic_community_selection,
+    )
+    return (time.perf_counter() - start) * 1000
+
+
+async def warm_setup(engine: GraphRAGQueryEngine) -> float:
+    # 常驻引擎：索引没有变化时只比较文件指纹
+    start = time.perf_counter()
+    await engine.load()
+    state = engine._state
+    state.search_engine or state.build_engine()
+    return (time.perf_counter() - start) * 1000
+
+
+async def timed(coro) -> float:
+    start = time.perf_counter()
+    await coro
+    return (time.perf_counter() - start) * 1000
+
+
+async def main(query: str, rounds: int, concurrency: int):
+    engine = GraphRAGQueryEngine()
+    first_load = await timed(engine.load())
+    print(f"first load   {first_load:9.1f}ms")
+
+    cold = [await cold_setup() for _ in range(rounds)]
+    warm = [await warm_setup(engine) for _ in range(rounds)]
+    print("setup (no model calls)")
+    report("cold", cold)
+    report("warm", warm)
+    assert statistics.mean(warm) < statistics.mean(cold), "warm engine setup is not faster than reloading the index"
+
+    if not query:
+        return
+
+    cold = [await timed(GraphRAGAPI().query_graphrag(query)) for _ in range(rounds)]
+    warm = [await timed(engine.search(query)) for _ in range(rounds)]
+    print("query")
+    report("cold", cold)
+    report("warm", warm)
+
+    start = time.perf_counter()
+    concurrent = await asyncio.gather(*(timed(engine.search(query)) for _ in range(concurrency)))
+    wall = (time.perf_counter() - start) * 1000
+    report(f"warm x{concurrency}", list(concurrent))
+    print(f"concurrent wall time {wall:.1f}ms")
+    print(engine.stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--query", default="", help="执行完整查询使用的问题，为空时只测试准备阶段")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(main(args.query, args.rounds, args.concurrency))
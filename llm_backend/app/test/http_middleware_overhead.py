@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+请求计时中间件的开销测试：BaseHTTPMiddleware 实现的旧日志中间件 / 纯 ASGI 的 TimingMiddleware / 不加中间件
+
+在一个最小的 FastAPI 应用上并发请求一个 JSON 接口和一个 SSE 接口（每个事件间隔 --chunk-delay 秒），
+统计客户端看到的延迟；最后打印 TimingMiddleware 按路由统计的首字节时间和流持续时间。
+另有一个经 include_router(prefix="/api") 注册的同名接口，检查路由统计的键包含前缀、不与顶层路由混在一起。
+请求经 httpx.ASGITransport 直接调用应用，不经过网络。
+
+运行方式（在 llm_backend 目录下）:
+    python -m app.test.http_middleware_overhead
+    python -m app.test.http_middleware_overhead --requests 5000 --concurrency 100 --chunks 20
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import List
+
+import httpx
+from fastapi import APIRouter, FastAPI, Request
+from fastapi.responses import StreamingResponse
+from loguru import logger as loguru_logger
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.core.middleware import HttpMetrics, TimingMiddleware, logger
+
+
+class BaseHTTPTimingMiddleware(BaseHTTPMiddleware):
+    # 旧实现：只能测到响应头返回的时间
+    async def dispatch(self, request: Request, call_next):
+        start_time = time.time()
+        response = await call_next(request)
+        process_time = time.time() - start_time
+        logger.info(f"{request.method} {request.url.path} {response.status_code} - {process_time:.2f}s")
+        return response
+
+
+def build_app(middleware: str, metrics: HttpMetrics, chunks: int, chunk_delay: float) -> FastAPI:
+    app = FastAPI()
+    if middleware == "base":
+        app.add_middleware(BaseHTTPTimingMiddleware)
+    elif middleware == "asgi":
+        app.add_middleware(TimingMiddleware, metrics=metrics)
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: int):
+        return {"id": item_id}
+
+    router = APIRouter()
+
+    @router.get("/items/{item_id}")
+    async def get_api_item(item_id: int):
+        return {"id": item_id, "api": True}
+
+    app.include_router(router, prefix="/api")
+
+    @app.get("/stream")
+    async def stream():
+        async def events():
+            for index in range(chunks):
+                yield f"data: {index}\n\n"
+                await asyncio.sleep(chunk_delay)
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def percentile(timings: List[float], q: float) -> float:
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * q))]
+
+
+async def run(middleware: str, requests: int, concurrency: int, chunks: int, chunk_delay: float):
+    metrics = HttpMetrics()
+    app = build_app(middleware, metrics, chunks, chunk_delay)
+    semaphore = asyncio.Semaphore(concurrency)
+    json_ms: List[float] = []
+    stream_ms: List[float] = []
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        async def call_json(index: int):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(f"/items/{index}")
+                json_ms.append((time.perf_counter() - start) * 1000)
+                assert response.status_code == 200
+
+        async def call_api(index: int):
+            async with semaphore:
+                response = await client.get(f"/api/items/{index}")
+                assert response.json()["api"]
+
+        async def call_stream():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get("/stream")
+                stream_ms.append((time.perf_counter() - start) * 1000)
+                assert response.text.count("data:") == chunks
+
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(call_json(index) for index in range(requests)),
+            *(call_stream() for _ in range(max(1, requests // 100))),
+            *(call_api(index) for index in range(max(1, requests // 100))),
+        )
+        wall = time.perf_counter() - start
+
+    print(
+        f"{middleware:<5} {len(json_ms)} json in {wall:5.2f}s  "
+        f"json p50 {percentile(json_ms, 0.5):6.2f}ms p99 {percentile(json_ms, 0.99):6.2f}ms  "
+        f"stream p50 {percentile(stream_ms, 0.5):7.1f}ms"
+    )
+    if middleware == "asgi":
+        snapshot = metrics.snapshot()
+        print(json.dumps(snapshot["routes"], ensure_ascii=False, indent=2))
+        stream = snapshot["routes"]["GET /stream"]
+        # SSE 的总耗时应覆盖整个流，而首字节在第一个事件时就返回
+        assert stream["duration"]["p50_ms"] >= chunks * chunk_delay * 1000 * 0.9, "stream duration not measured"
+        assert stream["ttfb"]["p50_ms"] < stream["duration"]["p50_ms"] / 2
+        assert snapshot["routes"]["GET /items/{item_id}"]["requests"] == requests
+        # include_router 注册的路由按带前缀的完整模板统计
+        assert snapshot["routes"]["GET /api/items/{item_id}"]["requests"] == max(1, requests // 100)
+
+
+async def main(requests: int, concurrency: int, chunks: int, chunk_delay: float):
+    # 两种中间件都照常调用 logger.info，去掉输出目标避免刷屏
+    loguru_logger.remove()
+    for middleware in ("none", "base", "asgi"):
+        await run(middleware, requests, concurrency, chunks, chunk_delay)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--chunks", type=int, default=10, help="SSE 接口返回的事件数")
+    parser.add_argument("--chunk-delay", type=float, default=0.01)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency, args.chunks, args.chunk_delay))
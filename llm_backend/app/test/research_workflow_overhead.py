@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+研究计划工作流的单次请求开销测试：对比每轮重新编译与复用缓存的编译结果
+
+create_research_plan 原来每轮对话都调用 create_multi_tool_workflow，重建检索器、提示词并重新编译 StateGraph；
+现在通过 get_multi_tool_workflow 按 (模型, 配置, Schema 版本) 缓存。
+测试只统计获取工作流的耗时，不调用模型，也不需要连接 Neo4j（用内存中的假图代替）。
+
+运行方式（在 llm_backend 目录下）:
+    python -m app.test.research_workflow_overhead
+"""
+import asyncio
+import statistics
+import time
+
+from app.lg_agent.lg_builder import get_research_workflow, RESEARCH_SCOPE_DESCRIPTION
+from app.lg_agent.lg_models import model_registry
+from app.lg_agent.kg_sub_graph.agentic_rag_agents.workflows.multi_agent.multi_tool import create_multi_tool_workflow
+from app.lg_agent.kg_sub_graph.kg_tools_list import cypher_query, predefined_cypher, microsoft_graphrag_query
+from app.lg_agent.kg_sub_graph.agentic_rag_agents.components.predefined_cypher.cypher_dict import predefined_cypher_dict
+
+ROUNDS = 50
+
+
+class FakeGraph:
+    """只提供 Schema 的假图，Schema 服务通过 query / refresh_schema 读取"""
+
+    def query(self, query, params=None):
+        return [{"labels": ["Product", "Category"], "types": ["BELONGS_TO"], "keys": ["ProductName", "CategoryName"]}]
+
+    def refresh_schema(self):
+        self.schema = (
+            "Node properties:\n"
+            "- **Product**\n  - `ProductName`: STRING\n"
+            "- **Category**\n  - `CategoryName`: STRING\n"
+            "Relationship properties:\n"
+            "The relationships:\n(:Product)-[:BELONGS_TO]->(:Category)"
+        )
+        self.structured_schema = {
+            "node_props": {},
+            "rel_props": {},
+            "relationships": [{"start": "Product", "type": "BELONGS_TO", "end": "Category"}],
+            "metadata": {},
+        }
+
+
+def measure(build) -> list:
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        build()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name: str, timings: list):
+    timings = sorted(timings)
+    print(
+        f"{name:<10} mean {statistics.mean(timings):8.3f}ms  "
+        f"p50 {timings[len(timings) // 2]:8.3f}ms  p95 {timings[int(len(timings) * 0.95) - 1]:8.3f}ms"
+    )
+
+
+async def test_cached_workflow_overhead():
+    model = model_registry.get_model("research_plan")
+    graph = FakeGraph()
+
+    def rebuild():
+        # 旧实现：每轮对话都重新创建检索器、导入工具和预定义查询并编译工作流
+        from app.lg_agent.kg_sub_graph.agentic_rag_agents.retrievers.cypher_examples.northwind_retriever import NorthwindCypherRetriever
+        return create_multi_tool_workflow(
+            llm=model,
+            graph=graph,
+            tool_schemas=[cypher_query, predefined_cypher, microsoft_graphrag_query],
+            predefined_cypher_dict=predefined_cypher_dict,
+            cypher_example_retriever=NorthwindCypherRetriever(),
+            scope_description=RESEARCH_SCOPE_DESCRIPTION,
+            llm_cypher_validation=True,
+        )
+
+    before = measure(rebuild)
+    first = get_research_workflow(model, graph)
+    after = measure(lambda: get_research_workflow(model, graph))
+
+    report("before", before)
+    report("after", after)
+    assert get_research_workflow(model, graph) is first, "cached workflow was recompiled"
+    assert statistics.mean(after) < statistics.mean(before), "cached lookup is not faster than recompiling"
+
+
+if __name__ == "__main__":
+    asyncio.run(test_cached_workflow_overhead())
@@ -0,0 +1,136 @@
+"""
+语义缓存检索延迟基准测试
+
+对比三种检索方式在 1k / 10k / 100k 条缓存下的 p50 / p99 查询延迟:
+1. legacy_scan: 旧实现的计算路径，逐条 JSON 解码向量并逐个计算余弦相似度
+   （这里不含 KEYS + GET 的网络往返，只是旧实现的下限）
+2. local_matrix: 进程内 NumPy 矩阵，一次矩阵乘法 + argpartition 取 top-k
+3. redisearch: Redis Stack 的 HNSW 向量索引（需要可用的 Redis Stack）
+
+运行方式（在 llm_backend 目录下）:
+    python -m app.test.semantic_cache_benchmark
+"""
+import json
+import time
+import numpy as np
+import redis
+from redis.exceptions import ResponseError
+from loguru import logger
+
+from app.core.config import settings
+from app.services.redis_semantic_cache import (
+    LocalVectorIndex,
+    VECTOR_FIELD,
+    _index_schema,
+    _to_blob,
+)
+
+SIZES = [1_000, 10_000, 100_000]
+DIM = 1024          # bge-m3 的向量维度
+NUM_QUERIES = 200   # 每种方式的查询次数
+LEGACY_MAX_QUERIES = 20  # 旧实现太慢，限制查询次数
+TOP_K = 5
+BENCH_PREFIX = "bench_semantic_cache"
+
+
+def percentiles(latencies: list) -> dict:
+    """计算 p50 / p99 (毫秒)"""
+    arr = np.array(latencies) * 1000
+    return {"p50": float(np.percentile(arr, 50)), "p99": float(np.percentile(arr, 99))}
+
+
+class SemanticCacheBenchmark:
+    def __init__(self, dim: int = DIM, seed: int = 42):
+        self.dim = dim
+        self.rng = np.random.default_rng(seed)
+
+    def random_vectors(self, n: int) -> np.ndarray:
+        return self.rng.standard_normal((n, self.dim)).astype(np.float32)
+
+    def bench_legacy_scan(self, vectors: np.ndarray, queries: np.ndarray) -> dict:
+        """模拟旧实现：每条缓存单独 JSON 解码，再逐个计算余弦相似度"""
+        encoded = [json.dumps(v.tolist()) for v in vectors]
+        latencies = []
+        for query in queries[:LEGACY_MAX_QUERIES]:
+            start = time.perf_counter()
+            best, best_idx = 0, None
+            for i, raw in enumerate(encoded):
+                cached = json.loads(raw)
+                sim = np.dot(query, cached) / (np.linalg.norm(query) * np.linalg.norm(cached))
+                if sim > best:
+                    best, best_idx = sim, i
+            latencies.append(time.perf_counter() - start)
+        return percentiles(latencies)
+
+    def bench_local_matrix(self, vectors: np.ndarray, queries: np.ndarray) -> dict:
+        index = LocalVectorIndex()
+        index.load([(str(i), v) for i, v in enumerate(vectors)])
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            index.search(query, TOP_K)
+            latencies.append(time.perf_counter() - start)
+        return percentiles(latencies)
+
+    def bench_redisearch(self, client: redis.Redis, vectors: np.ndarray, queries: np.ndarray) -> dict:
+        from redis.commands.search.query import Query
+
+        prefix = f"{BENCH_PREFIX}:{len(vectors)}"
+        index_name = f"{prefix}:idx"
+        try:
+            fields, definition = _index_schema(prefix, self.dim)
+            client.ft(index_name).create_index(fields, definition=definition)
+            pipe = client.pipeline(transaction=False)
+            for i, v in enumerate(vectors):
+                pipe.hset(f"{prefix}:vec:{i}", mapping={VECTOR_FIELD: _to_blob(v)})
+                if i % 1000 == 999:
+                    pipe.execute()
+            pipe.execute()
+
+            query = (
+                Query(f"*=>[KNN {TOP_K} @{VECTOR_FIELD} $vec AS score]")
+                .sort_by("score")
+                .return_fields("score")
+                .paging(0, TOP_K)
+                .dialect(2)
+            )
+            latencies = []
+            for q in queries:
+                start = time.perf_counter()
+                client.ft(index_name).search(query, query_params={"vec": _to_blob(q)})
+                latencies.append(time.perf_counter() - start)
+            return percentiles(latencies)
+        finally:
+            client.ft(index_name).dropindex(delete_documents=True)
+
+    def run(self):
+        client = None
+        try:
+            client = redis.from_url(settings.REDIS_URL)
+            client.execute_command("FT._LIST")
+        except (ResponseError, redis.ConnectionError) as e:
+            logger.warning(f"Redis Stack 不可用，跳过 redisearch 测试: {e}")
+            client = None
+
+        results = []
+        for size in SIZES:
+            logger.info(f"\n=== 缓存条数: {size} ===")
+            vectors = self.random_vectors(size)
+            queries = self.random_vectors(NUM_QUERIES)
+
+            row = {"size": size}
+            row["legacy_scan"] = self.bench_legacy_scan(vectors, queries)
+            row["local_matrix"] = self.bench_local_matrix(vectors, queries)
+            if client is not None:
+                row["redisearch"] = self.bench_redisearch(client, vectors, queries)
+
+            for name, stats in row.items():
+                if name == "size":
+                    continue
+                logger.info(f"- {name:<13} p50: {stats['p50']:.3f}ms  p99: {stats['p99']:.3f}ms")
+            results.append(row)
+        return results
+
+
+if __name__ == "__main__":
+    SemanticCacheBenchmark().run()
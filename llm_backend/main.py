@@ -10,21 +10,29 @@ from datetime import datetime
 from pathlib import Path
 
 from app.core.logger import get_logger, log_structured
-from app.core.middleware import LoggingMiddleware
+from app.core.middleware import TimingMiddleware, http_metrics
 from app.core.config import settings
 from app.api import api_router
-from app.core.database import AsyncSessionLocal
+from app.core.database import AsyncSessionLocal, database_stats, dispose_engines
 from app.models.conversation import Conversation, DialogueType
 from app.models.message import Message
 from sqlalchemy import select
-from app.services.conversation_service import ConversationService
+from app.services.conversation_service import ConversationService, message_writer
 import uuid
 import os
-from app.services.indexing_service import IndexingService
+from app.services.indexing_job_service import indexing_job_manager, job_to_dict
+from app.services.redis_semantic_cache import semantic_cache_registry, close_redis_pools
 import sys
 from app.lg_agent.lg_states import AgentState, InputState
 from app.lg_agent.utils import new_uuid
-from app.lg_agent.lg_builder import graph
+from app.lg_agent.lg_builder import graph, checkpointer, warmup_research_workflow, research_progress_events
+from app.lg_agent.lg_models import model_registry
+from app.lg_agent.kg_sub_graph.kg_neo4j_conn import neo4j_pool, close_neo4j
+from app.lg_agent.kg_sub_graph.kg_cypher_cache import cypher_cache
+from app.lg_agent.kg_sub_graph.agentic_rag_agents.components.cypher_tools.utils import validation_latency
+from app.lg_agent.kg_sub_graph.agentic_rag_agents.workflows.multi_agent.scheduler import branch_scheduler
+from app.lg_agent.kg_sub_graph.agentic_rag_agents.retrievers.cypher_examples.example_store import cypher_example_store
+from app.lg_agent.kg_sub_graph.agentic_rag_agents.components.customer_tools.graphrag_engine import graphrag_engine
 from langgraph.types import Command
 import json
 
@@ -40,8 +48,8 @@ logger = get_logger(service="main")
 # 创建 FastAPI 应用实例
 app = FastAPI(title="AssistGen REST API")
 
-# 添加日志中间件， 使用 LoggingMiddleware 来统一处理日志记录，从而替代 FastAPI 的原生打印日志。
-app.add_middleware(LoggingMiddleware)
+# 添加计时中间件，统一记录请求日志（替代 FastAPI 的原生打印日志），并按路由统计首字节时间和总耗时
+app.add_middleware(TimingMiddleware)
 
 # CORS设置
 app.add_middleware(
@@ -87,10 +95,105 @@ class LangGraphResumeRequest(BaseModel):
     conversation_id: str
 
 
+@app.on_event("startup")
+async def startup_event():
+    # 启动全局唯一的语义缓存清理任务
+    semantic_cache_registry.start()
+    # 启动对话消息的批量写库任务
+    message_writer.start()
+    # 启动 GraphRAG 索引任务队列
+    await indexing_job_manager.start()
+    # 加载 Cypher 少样本示例并启动热加载任务
+    cypher_example_store.start()
+    # 预加载 GraphRAG 索引并启动热更新任务
+    graphrag_engine.start()
+    # 预先编译研究计划工作流
+    if settings.RESEARCH_WORKFLOW_WARMUP:
+        await warmup_research_workflow()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # 先写入缓冲中的对话消息，再关闭其他资源
+    await message_writer.stop()
+    await indexing_job_manager.stop()
+    await cypher_example_store.stop()
+    await graphrag_engine.stop()
+    await semantic_cache_registry.stop()
+    await checkpointer.aclose()
+    await close_redis_pools()
+    await model_registry.aclose()
+    await close_neo4j()
+    await dispose_engines()
+
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
 
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """语义缓存注册表的运行指标"""
+    return semantic_cache_registry.stats()
+
+@app.get("/api/neo4j/pool/stats")
+async def neo4j_pool_stats():
+    """Neo4j 异步连接池的运行指标"""
+    return neo4j_pool.stats()
+
+@app.get("/api/neo4j/cypher-cache/stats")
+async def cypher_cache_stats():
+    """Cypher 语句缓存和查询结果缓存的命中情况"""
+    return cypher_cache.stats()
+
+@app.post("/api/neo4j/cypher-cache/invalidate")
+async def invalidate_cypher_cache(statements: bool = True):
+    """导入或修改图数据后清空 Cypher 缓存，statements=false 时只清空查询结果"""
+    cypher_cache.invalidate(statements=statements)
+    return cypher_cache.stats()
+
+@app.get("/api/neo4j/cypher-validation/stats")
+async def cypher_validation_stats():
+    """Cypher 校验各阶段（本地检查、EXPLAIN、大模型校验、修正）的累计耗时"""
+    return validation_latency.stats()
+
+@app.get("/api/langgraph/branches/stats")
+async def branch_scheduler_stats():
+    """研究计划子任务分支的并发与排队情况"""
+    return branch_scheduler.stats()
+
+@app.get("/api/graphrag/engine/stats")
+async def graphrag_engine_stats():
+    """常驻 GraphRAG 查询引擎的加载与查询情况"""
+    return graphrag_engine.stats()
+
+@app.post("/api/graphrag/engine/reload")
+async def reload_graphrag_engine():
+    """立即重新加载 GraphRAG 索引（正常情况下后台任务会自动发现索引变化）"""
+    await graphrag_engine.load(force=True)
+    return graphrag_engine.stats()
+
+@app.get("/api/langgraph/checkpointer/stats")
+async def checkpointer_stats():
+    """LangGraph 会话检查点存储的写入、读取与压缩情况"""
+    return checkpointer.stats()
+
+@app.get("/api/conversations/writer/stats")
+async def conversation_writer_stats():
+    """对话消息批量写库的缓冲与写入情况"""
+    return message_writer.stats()
+
+@app.get("/api/database/pool/stats")
+async def database_pool_stats():
+    """MySQL 主库与只读副本的连接池状态、获取连接耗时直方图和慢查询"""
+    return database_stats()
+
+@app.get("/api/metrics/http")
+async def http_latency_metrics(reset: bool = False):
+    """按路由统计的请求数、状态码分布、首字节时间和总耗时的 p50/p95/p99，reset=true 时返回后清零"""
+    snapshot = http_metrics.snapshot()
+    if reset:
+        http_metrics.reset()
+    return snapshot
+
 @app.post("/api/chat")
 async def chat_endpoint(request: ChatMessage):
     """聊天接口"""
@@ -198,7 +301,7 @@ async def upload_file(
     file: UploadFile = File(...),
     user_id: int = Form(...)
 ):
-    """上传文件并准备 RAG 处理"""
+    """上传文件并登记 RAG 索引任务，索引在后台进程中构建"""
     try:
         logger.info(f"Uploading file for user {user_id}: {file.filename}")
         
@@ -216,16 +319,18 @@ async def upload_file(
         new_filename = f"{original_name}_{timestamp}{ext}"
         file_path = second_level_dir / new_filename
         
-        # 保存文件
-        content = await file.read()
+        # 分块写盘，不把整个文件读入内存
+        size = 0
         with open(file_path, "wb") as f:
-            f.write(content)
+            while chunk := await file.read(settings.INDEXING_UPLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                size += len(chunk)
             
         # 获取文件信息
         file_info = {
             "filename": new_filename,
             "original_name": file.filename,
-            "size": len(content),
+            "size": size,
             "type": file.content_type,
             "path": str(file_path).replace('\\', '/'),
             "user_id": user_id,
@@ -234,19 +339,37 @@ async def upload_file(
             "directory": str(second_level_dir)
         }
         
-        # 4. 处理文件索引
-        indexing_service = IndexingService()
-        index_result = await indexing_service.process_file(file_info)
+        # 4. 登记索引任务，通过 /api/indexing/jobs/{job_id} 查询进度
+        job_id = await indexing_job_manager.submit(file_info)
         
-        # 合并结果
-        result = {**file_info, "index_result": index_result}
-        
-        return result
+        return {**file_info, "job_id": job_id, "status": "queued"}
         
     except Exception as e:
         logger.error(f"Upload failed for user {user_id}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/indexing/jobs")
+async def list_indexing_jobs(user_id: int, limit: int = Query(50, ge=1, le=200)):
+    """获取用户的索引任务列表"""
+    jobs = await indexing_job_manager.list_jobs(user_id, limit)
+    return [job_to_dict(job) for job in jobs]
+
+@app.get("/api/indexing/jobs/{job_id}")
+async def get_indexing_job(job_id: str):
+    """获取索引任务的状态和进度"""
+    job = await indexing_job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="索引任务不存在")
+    return job_to_dict(job)
+
+@app.post("/api/indexing/jobs/{job_id}/cancel")
+async def cancel_indexing_job(job_id: str):
+    """取消排队中或运行中的索引任务"""
+    job = await indexing_job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="索引任务不存在")
+    return job_to_dict(job)
+
 @app.post("/chat-rag")
 async def rag_chat_endpoint(request: RAGChatRequest):
     """基于文档的问答接口"""
@@ -286,10 +409,15 @@ async def get_user_conversations(user_id: int):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/conversations/{conversation_id}/messages")
-async def get_conversation_messages(conversation_id: int, user_id: int):
-    """获取会话的所有消息"""
+async def get_conversation_messages(
+    conversation_id: int,
+    user_id: int,
+    limit: Optional[int] = None,
+    before_id: Optional[int] = None
+):
+    """获取会话的消息，指定 limit 时返回 before_id 之前最近的 limit 条"""
     try:
-        messages = await ConversationService.get_conversation_messages(conversation_id, user_id)
+        messages = await ConversationService.get_conversation_messages(conversation_id, user_id, limit, before_id)
         return messages
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -322,14 +450,24 @@ async def update_conversation_name(
         logger.error(f"更新会话名称失败: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+def sse_event(event: str, data) -> str:
+    """带类型的 SSE 事件"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
 @app.post("/api/langgraph/query")
 async def langgraph_query(
     query: str = Form(...),
     user_id: int = Form(...),
     conversation_id: Optional[str] = Form(None),
-    image: Optional[UploadFile] = File(None)
+    image: Optional[UploadFile] = File(None),
+    stream_events: bool = Form(False)
 ):
-    """使用LangGraph处理用户查询，支持图片上传"""
+    """使用LangGraph处理用户查询，支持图片上传
+
+    stream_events 为 true 时，研究计划的进度以带类型的 SSE 事件推送：
+    event: guardrails / plan / tool_result / summary_ready（data 为 JSON 对象），
+    event: summary（data 为汇总的 token）；回答内容仍是不带 event 字段的 data 行。
+    """
     try:
         logger.info(f"Processing LangGraph query for user {user_id} and conversation {conversation_id}")
         
@@ -368,69 +506,60 @@ async def langgraph_query(
         try:
             # 检查是否有现有的会话状态
             if thread_id:
-                state_history = graph.get_state(thread_config)
+                state_history = await graph.aget_state(thread_config)
                 if state_history:
                     logger.info(f"Found existing conversation state for thread_id: {thread_id}")
         except Exception as e:
             logger.warning(f"Error retrieving state: {e}. Starting with fresh state.")
         
-        # 准备输入状态 - 如果是现有会话，直接传入查询文本
+        # 准备输入状态 - 如果是现有会话，使用resume命令继续对话；否则创建新的输入状态
         if state_history and len(state_history) > 0 and len(state_history[-1]) > 0:
             logger.info("Using existing conversation state")
-            # 如果有现有会话，使用resume命令继续对话
-            async def process_stream():
-                async for c, metadata in graph.astream(
-                    Command(resume=query), 
-                    stream_mode="messages", 
-                    config=thread_config
-                ):
-                    # 只处理最终展示给用户的内容，跳过中间工具调用和内部状态
-                    if c.content and "research_plan" not in metadata.get("tags", []) and not c.additional_kwargs.get("tool_calls"):
-                        # 关键修改：使用json.dumps处理content，确保特殊字符如换行符被正确处理
-                        content_json = json.dumps(c.content, ensure_ascii=False)
-                        yield f"data: {content_json}\n\n"
-                        
-                    # 工具调用单独处理，不发送给前端
-                    elif c.additional_kwargs.get("tool_calls"):
-                        tool_data = c.additional_kwargs.get("tool_calls")[0]["function"].get("arguments")
-                        logger.debug(f"Tool call: {tool_data}")
-                        
-                # 处理中断情况
-                state = graph.get_state(thread_config)
-                if len(state) > 0 and len(state[-1]) > 0:
-                    if len(state[-1][0].interrupts) > 0:
-                        interrupt_json = json.dumps({"interruption": True, "conversation_id": thread_id})
-                        yield f"data: {interrupt_json}\n\n"
+            graph_input = Command(resume=query)
         else:
-            # 新会话或找不到现有状态，创建新的输入状态
             logger.info("Creating new conversation state")
-            input_state = InputState(messages=query)
-            
-            # 流式处理查询
-            async def process_stream():
-                async for c, metadata in graph.astream(
-                    input=input_state, 
-                    stream_mode="messages", 
-                    config=thread_config
-                ):
-                    # 只处理最终展示给用户的内容，跳过中间工具调用和内部状态
-                    if c.content and "research_plan" not in metadata.get("tags", []) and not c.additional_kwargs.get("tool_calls"):
-                        # 关键修改：使用json.dumps处理content，确保特殊字符如换行符被正确处理
-                        content_json = json.dumps(c.content, ensure_ascii=False)
-                        yield f"data: {content_json}\n\n"
-                        
-                    # 工具调用单独处理，不发送给前端
-                    elif c.additional_kwargs.get("tool_calls"):
-                        tool_data = c.additional_kwargs.get("tool_calls")[0]["function"].get("arguments")
-                        logger.debug(f"Tool call: {tool_data}")
-                        
-                # 处理中断情况
-                state = graph.get_state(thread_config)
-                if len(state) > 0 and len(state[-1]) > 0:
-                    if len(state[-1][0].interrupts) > 0:
-                        interrupt_json = json.dumps({"interruption": True, "conversation_id": thread_id})
-                        yield f"data: {interrupt_json}\n\n"
-        
+            graph_input = InputState(messages=query)
+
+        async def process_stream():
+            # subgraphs=True 时研究计划子图作为嵌套图流式输出，updates 中带有子图命名空间的是子图各节点的输出
+            async for namespace, mode, chunk in graph.astream(
+                graph_input,
+                stream_mode=["messages", "updates"] if stream_events else ["messages"],
+                config=thread_config,
+                subgraphs=True
+            ):
+                if mode == "updates":
+                    if len(namespace) == 1 and namespace[0].startswith("create_research_plan:"):
+                        for node, update in chunk.items():
+                            for event in research_progress_events(node, update):
+                                yield sse_event(event["type"], event)
+                    continue
+
+                c, metadata = chunk
+                # 研究计划子图中汇总节点的 token 作为 summary 事件推送，其余中间输出不发送
+                if "research_plan" in metadata.get("tags", []):
+                    if stream_events and c.content and metadata.get("langgraph_node") == "summarize":
+                        yield sse_event("summary", c.content)
+                    continue
+
+                # 只处理最终展示给用户的内容，跳过中间工具调用和内部状态
+                if c.content and not c.additional_kwargs.get("tool_calls"):
+                    # 关键修改：使用json.dumps处理content，确保特殊字符如换行符被正确处理
+                    content_json = json.dumps(c.content, ensure_ascii=False)
+                    yield f"data: {content_json}\n\n"
+
+                # 工具调用单独处理，不发送给前端
+                elif c.additional_kwargs.get("tool_calls"):
+                    tool_data = c.additional_kwargs.get("tool_calls")[0]["function"].get("arguments")
+                    logger.debug(f"Tool call: {tool_data}")
+
+            # 处理中断情况
+            state = await graph.aget_state(thread_config)
+            if len(state) > 0 and len(state[-1]) > 0:
+                if len(state[-1][0].interrupts) > 0:
+                    interrupt_json = json.dumps({"interruption": True, "conversation_id": thread_id})
+                    yield f"data: {interrupt_json}\n\n"
+
         response = StreamingResponse(
             process_stream(),
             media_type="text/event-stream"
@@ -452,7 +581,12 @@ async def langgraph_resume(request: LangGraphResumeRequest):
         logger.info(f"Resuming LangGraph query for user {request.user_id} with conversation {request.conversation_id}")
         
         # 使用会话ID作为线程ID
-        thread_config = {"configurable": {"thread_id": request.conversation_id}}
+        thread_config = {
+            "configurable": {
+                "thread_id": request.conversation_id,
+                "user_id": request.user_id
+            }
+        }
         
         # 流式处理恢复
         async def process_resume():